@@ -1,63 +1,4210 @@
-from flask import Flask, jsonify, Response
-import os, json, time
+from flask import Flask, jsonify, Response, request, g, got_request_exception, has_request_context
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.utils import formatdate
+import os, sys, re, json, time, threading, queue, select, sqlite3, bisect
+import base64, csv, ctypes, ctypes.util, functools, hashlib, io, itertools, mimetypes, mmap, multiprocessing, struct, zlib
+import numpy as np
+
+try:
+    import brotli   # ไม่บังคับ มีก็ใช้ br ได้
+except ImportError:
+    brotli = None
+
+try:
+    import pyarrow as pa            # ไม่บังคับ มีก็ส่งออก /export?format=parquet ได้
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import fcntl    # ล็อกข้าม process ในโหมดหลาย worker (มีเฉพาะ Unix)
+except ImportError:
+    fcntl = None
+
+try:
+    import termios  # เปิด USB serial ของ ESP32 แบบ raw (มีเฉพาะ Unix)
+    import tty
+except ImportError:
+    termios = tty = None
+
+# static_folder=None: ไฟล์ static เสิร์ฟเองจากหน่วยความจำ (ดู StaticAssets) URL มี hash ของเนื้อไฟล์
+app = Flask(__name__, static_folder=None)
+
+# ===============================
+# Config
+# ===============================
+SD_MOUNT_PATH = "/media/ployn/E25A-A181"
+# แก้ตรงนี้: ห้ามใส่ "/" นำหน้าไฟล์ ไม่งั้น os.path.join จะพัง
+JSON_FILE_PATH = os.path.join(SD_MOUNT_PATH, "noise_samples.json")
+
+# ไฟล์ *.json ทุกไฟล์ใต้ SD_MOUNT_PATH (รวมโฟลเดอร์ย่อย) = 1 session เช่น 1 ไฟล์ต่อรอบสำรวจ/ต่อวัน
+# ชื่อ session = path ใต้การ์ดไม่มี .json เช่น "noise_samples", "2025-01-01/run1"
+SAMPLE_FILE_EXT = ".json"
+DEFAULT_SESSION = os.path.splitext(os.path.basename(JSON_FILE_PATH))[0]
+# parse หลายไฟล์พร้อมกันด้วย process pool (json.loads ติด GIL ใช้ thread ได้แค่ core เดียว)
+SD_PARSE_WORKERS = os.cpu_count() or 1
+# ไฟล์ที่ต้องอ่านทั้งไฟล์รวมกันเล็กกว่านี้ parse ใน thread เดิม ไม่คุ้มเปิด process
+PARALLEL_PARSE_MIN_BYTES = 4 * 1024 * 1024
+# ไฟล์ใหญ่ตั้งแต่ขนาดนี้ไม่ json.loads ทั้งไฟล์ แต่อ่านทีละ SD_PARSE_BUFFER_BYTES แล้วทยอยเขียนลง DB
+# หน่วยความจำตอนอ่านจึงขึ้นกับขนาด buffer ไม่ใช่ขนาดไฟล์
+STREAM_PARSE_MIN_BYTES = 32 * 1024 * 1024
+SD_PARSE_BUFFER_BYTES = 4 * 1024 * 1024
+# 1 จุดยาวเกินนี้ (ยังไม่เจอ '}' ที่ปิด object ได้) = ไฟล์เสีย ไม่ buffer ต่อไปเรื่อย ๆ
+SD_MAX_POINT_BYTES = 64 * 1024
+# เก็บข้อมูลของ session ที่ถูกเปิดดู (แยกจากชุดรวม) ไว้ในหน่วยความจำกี่ชุด
+SESSION_STORES = 8
+
+# ตำแหน่งตั้งต้นของแผนที่ (กรุงเทพฯประมาณนี้)
+DEFAULT_CENTER = {"lat": 13.7276, "lng": 100.7726, "zoom": 20}
+
+# ช่วง dBm ของสเกลสี (ต้องตรงกับ legend และ dbmToIntensity() ฝั่ง JS)
+HEAT_DBM_MIN = -60.0
+HEAT_DBM_MAX = -30.0
+
+# ขนาดช่อง grid (pixel บนจอ) สำหรับ /data/grid
+GRID_CELL_PX = 16
+
+# จุดบนแผนที่แบบ level of detail (/data/clusters): จุดที่ห่างกันไม่ถึง ~CLUSTER_RADIUS_PX บนจอรวมเป็น 1 cluster
+# ลำดับชั้น cluster ของทุก zoom 0..CLUSTER_MAX_ZOOM สร้างครั้งเดียวต่อเวอร์ชันข้อมูล (zoom เกินนี้ใช้ชั้นบนสุด)
+CLUSTER_RADIUS_PX = 40
+CLUSTER_MAX_ZOOM = 22
+# cluster ต่อ response ไม่เกินนี้ (bbox กว้างเกินสำหรับ zoom นั้น -> ใช้ชั้นที่หยาบกว่า)
+CLUSTER_MAX_ITEMS = 4000
+
+# สถิติ dBm ต่อพื้นที่ (/stats): ช่องเดียวกับ spatial index (SPATIAL_CELL_DEG) ช่วงเวลาละเอียดสุด STATS_BUCKET_S วินาที
+# percentile ประมาณจาก histogram ช่องละ STATS_BIN_DB dB (คลาดไม่เกินครึ่งช่อง) ค่านอก STATS_DBM_RANGE นับเข้าช่องริม
+STATS_BUCKET_S = 60
+STATS_BIN_DB = 0.5
+STATS_DBM_RANGE = (-150.0, 0.0)
+STATS_PERCENTILES = (10, 50, 90)
+
+# ขนาดช่องของ spatial index (องศา ~55 m) สำหรับ /data?bbox=...
+SPATIAL_CELL_DEG = 0.0005
+
+# ส่ง /data, /tabledata แบบ stream ทีละ chunk เมื่อจำนวนแถวถึงค่านี้ (หรือขอ stream=1)
+STREAM_MIN_ROWS = 20000
+STREAM_CHUNK_ROWS = 5000
+# /export ส่งออกทีละเท่านี้แถว (= 1 row group ของ parquet) หน่วยความจำขึ้นกับค่านี้ ไม่ใช่ขนาดข้อมูล
+EXPORT_CHUNK_ROWS = 65536
+
+# ตัวเฝ้าไฟล์สำหรับ /events: เช็ก stat ทุกกี่วินาที (inotify จะปลุกเร็วกว่านี้ถ้ามี)
+SD_WATCH_INTERVAL = 1.0
+# ต่อท้ายเกินนี้ในรอบเดียวจะส่ง "reset" ให้ browser โหลดใหม่แทนการส่งจุดทั้งหมด
+SSE_MAX_APPEND_ROWS = 1000
+# ไม่มี event นานเท่านี้ (วินาที) ส่ง comment กัน proxy/browser ตัดการเชื่อมต่อ
+SSE_KEEPALIVE = 15.0
+
+# แคช response ที่บีบอัดแล้ว (gzip/br) ต่อเวอร์ชันข้อมูล ขนาดรวมไม่เกินนี้
+COMPRESS_CACHE_BYTES = 64 * 1024 * 1024
+# body เล็กกว่านี้ไม่ต้องบีบอัด
+COMPRESS_MIN_BYTES = 1024
+
+# ไฟล์ JS/CSS ของแผนที่ (Leaflet, leaflet.heat) เก็บไว้ในเครื่อง ไม่โหลดจาก CDN (หน้างานมักไม่มีเน็ต)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# URL ของ asset มี hash ของเนื้อไฟล์ -> browser แคชได้ยาว (1 ปี) ไฟล์เปลี่ยนเมื่อไร URL ก็เปลี่ยนเอง
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# heat tile ฝั่ง server (/tiles/z/x/y.png)
+# รัศมีของแต่ละจุดเป็น pixel บนจอ (= radius 28 + blur 18 ของ leaflet.heat ฝั่ง JS)
+TILE_RADIUS_PX = 46
+# ความทึบสูงสุดของ heat บน tile (0..1)
+TILE_OPACITY = 0.8
+TILE_MAX_ZOOM = 22
+# แคช tile PNG: ชั้นหน่วยความจำ + ชั้นดิสก์ (โฟลเดอร์ข้าง app.py) จำกัดขนาดรวมทั้งคู่
+TILE_CACHE_BYTES = 32 * 1024 * 1024
+TILE_DISK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tile_cache")
+TILE_DISK_BYTES = 256 * 1024 * 1024
+
+# พื้นผิวความแรงสัญญาณแบบ interpolate (/coverage)
+# จำนวนช่องตามด้านที่ยาวกว่าของ bbox (ค่าเริ่มต้น/สูงสุด)
+COVERAGE_RES = 64
+COVERAGE_MAX_RES = 256
+# ใช้เฉพาะจุดวัดในรัศมีนี้ (เมตร) ช่องที่ไม่มีจุดวัดในรัศมีเลย = null (ไม่เดา)
+COVERAGE_RADIUS_M = 25.0
+COVERAGE_POWER = 2.0
+# kriging ใช้จุดใกล้สุดกี่จุดต่อช่อง
+COVERAGE_NEIGHBOURS = 12
+# ขนาด matrix ระยะทาง (ช่อง x จุด) ต่อ 1 block ที่คำนวณพร้อมกัน คุมหน่วยความจำ
+COVERAGE_BLOCK_ELEMS = 2_000_000
+# ระยะห่างของเส้น contour (dB) สำหรับ format=geojson
+COVERAGE_LEVEL_STEP = 5.0
+
+# ฐานข้อมูลในเครื่อง (SQLite) ที่ ingest จุดจากการ์ดมาเก็บไว้ ถอดการ์ดแล้วยังดูข้อมูลได้
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rf_samples.db")
+
+# โหมด production หลาย worker (ดู wsgi.py): โฟลเดอร์ของไฟล์คอลัมน์ที่ทุก worker mmap ร่วมกัน
+# ไม่ตั้ง = โหมดเดิม (process เดียว ข้อมูลอยู่ในหน่วยความจำของ process เอง)
+SHARED_COLUMNS_DIR = os.environ.get("RF_SHARED_COLUMNS_DIR") or None
+
+# รับจุดสดจาก ESP32 ทาง USB serial (ไม่ต้องถอดการ์ด) ไม่ตั้ง port = ปิด  เช่น /dev/ttyUSB0, /dev/ttyACM0
+SERIAL_PORT = os.environ.get("RF_SERIAL_PORT") or None
+SERIAL_BAUD = int(os.environ.get("RF_SERIAL_BAUD", 115200))   # = Serial.begin() ใน firmware
+# JSON ที่ firmware พิมพ์หลังกด LOG คือเนื้อไฟล์เดียวกับบนการ์ด -> ใช้ session เดียวกัน
+# เสียบการ์ดทีหลังก็ไม่ได้จุดซ้ำ (SampleDB.replace เทียบแล้วเหมือนเดิม)
+SERIAL_SESSION = DEFAULT_SESSION
+# บรรทัดยาวกว่านี้ทิ้งทั้งบรรทัด (JSON ทั้งไฟล์ที่ใหญ่มาก ๆ) จุดใหม่ยังได้จากบรรทัด "Will save point"
+SERIAL_MAX_LINE_BYTES = 4 * 1024 * 1024
+# port หาย/ถอดสาย -> ลองเปิดใหม่ทุกกี่วินาที
+SERIAL_RETRY_S = 2.0
+
+# ขอบบนของ bucket ใน histogram เวลา (วินาที) ของ /metrics
+METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ===============================
+# Metrics (/metrics แบบ Prometheus)
+# ===============================
+# นับแยกต่อ thread (shard ของใครของมัน ไม่ต้องล็อกตอนนับ) แล้วค่อยรวมกันตอนมีคนขอ /metrics
+# thread ที่จบไปแล้ว (Flask dev server เปิด thread ใหม่ทุก request) ยุบ shard เข้ากองกลาง
+# ค่าจึงไม่หายและจำนวน shard ไม่โตตามจำนวน request
+
+
+class _ShardOwner:
+    """อยู่ใน threading.local ของแต่ละ thread พอ thread จบก็ถูกทิ้ง -> ยุบ shard เข้ากองกลาง"""
+
+    def __init__(self, metrics, shard):
+        self.metrics = metrics
+        self.shard = shard
+
+    def __del__(self):
+        try:
+            self.metrics._retire(self.shard)
+        except Exception:
+            pass   # ตอนปิดโปรแกรม module อาจถูกเก็บไปก่อนแล้ว
+
+
+class Metrics:
+    """counter / histogram แบบ Prometheus ไม่พึ่ง prometheus_client
+       - inc(name, labels, value)   : counter (labels = tuple ค่าตามลำดับ labelnames)
+       - observe(name, value, labels): histogram
+       - timed(name)                 : decorator จับเวลาฟังก์ชัน
+       - collector(fn)               : ฟังก์ชันที่คืน metric ณ ตอน scrape (gauge, ตัวนับที่มีอยู่แล้ว)
+    """
+
+    def __init__(self):
+        self._defs = OrderedDict()   # name -> (type, help, labelnames, buckets)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        self._defs[name] = ("counter", help, labelnames, None)
+
+    def histogram(self, name, help, labelnames=(), buckets=METRICS_LATENCY_BUCKETS):
+        self._defs[name] = ("histogram", help, labelnames, tuple(buckets))
+
+    def collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            self._local.owner = _ShardOwner(self, shard)
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def inc(self, name, labels=(), value=1):
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        shard = self._shard()
+        key = (name, labels)
+        h = shard.get(key)
+        if h is None:
+            # [นับต่อ bucket (ไม่สะสม) ..., +Inf, sum]
+            h = shard[key] = [0] * (len(self._defs[name][3]) + 1) + [0.0]
+        h[bisect.bisect_left(self._defs[name][3], value)] += 1
+        h[-1] += value
+
+    def timed(self, name, labels=()):
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - t0, labels)
+            return wrapper
+        return decorate
+
+    @staticmethod
+    def _merge(into, shard):
+        # list(...) ทีเดียวใต้ GIL: thread เจ้าของเพิ่ม key ระหว่างนี้ก็ไม่พัง
+        for key, value in list(shard.items()):
+            if isinstance(value, list):
+                acc = into.get(key)
+                if acc is None:
+                    into[key] = list(value)
+                else:
+                    for i, v in enumerate(value):
+                        acc[i] += v
+            else:
+                into[key] = into.get(key, 0) + value
+
+    def _retire(self, shard):
+        with self._lock:
+            self._shards = [s for s in self._shards if s is not shard]
+            self._merge(self._retired, shard)
+
+    def totals(self):
+        """รวมทุก shard -> {(name, labels): ค่า}"""
+        with self._lock:
+            totals = {}
+            self._merge(totals, self._retired)
+            for shard in self._shards:
+                self._merge(totals, shard)
+        return totals
+
+    def render(self):
+        """ข้อความรูปแบบ Prometheus text exposition 0.0.4"""
+        totals = self.totals()
+        out = []
+        for name, (kind, help, labelnames, buckets) in self._defs.items():
+            out.append("# HELP %s %s" % (name, help))
+            out.append("# TYPE %s %s" % (name, kind))
+            for (n, labels), value in sorted(totals.items(), key=lambda kv: kv[0]):
+                if n != name:
+                    continue
+                pairs = list(zip(labelnames, labels))
+                if kind == "counter":
+                    out.append("%s%s %s" % (name, _metric_labels(pairs), _metric_value(value)))
+                    continue
+                cumulative = 0
+                for le, count in zip(buckets + (float("inf"),), value[:-1]):
+                    cumulative += count
+                    out.append("%s_bucket%s %d" % (
+                        name, _metric_labels(pairs + [("le", _metric_value(le))]), cumulative))
+                out.append("%s_sum%s %s" % (name, _metric_labels(pairs), _metric_value(value[-1])))
+                out.append("%s_count%s %d" % (name, _metric_labels(pairs), cumulative))
+        for fn in self._collectors:
+            for name, kind, help, samples in fn():
+                out.append("# HELP %s %s" % (name, help))
+                out.append("# TYPE %s %s" % (name, kind))
+                for pairs, value in samples:
+                    out.append("%s%s %s" % (name, _metric_labels(pairs), _metric_value(value)))
+        return "\n".join(out) + "\n"
+
+
+def _metric_labels(pairs):
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join('%s="%s"' % (k, esc(v)) for k, v in pairs) + "}"
+
+
+def _metric_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    if isinstance(v, float) and not v.is_integer():
+        return repr(v)
+    return str(int(v))
+
+
+metrics = Metrics()
+metrics.counter("rf_http_requests_total", "HTTP requests by route and status.",
+                ("route", "method", "status"))
+metrics.histogram("rf_http_request_duration_seconds",
+                  "Time from request start until the response body is fully sent.", ("route",))
+metrics.counter("rf_http_response_bytes_total", "Response body bytes sent (after compression).",
+                ("route",))
+metrics.counter("rf_errors_total", "Errors by where they happened and exception type.",
+                ("where", "type"))
+metrics.histogram("rf_read_measurements_duration_seconds",
+                  "Time spent in read_measurements() (DB sync + snapshot).")
+metrics.histogram("rf_sdcard_check_duration_seconds",
+                  "Time spent checking the SD card mount and listing sample files.")
+metrics.histogram("rf_sd_parse_duration_seconds",
+                  "Time spent parsing sample files (tail = appended points only).", ("mode",))
+metrics.counter("rf_sd_bytes_read_total", "Bytes of sample files parsed.", ("mode",))
+metrics.counter("rf_sd_records_parsed_total", "Sample points parsed from the card.", ("mode",))
+metrics.histogram("rf_db_write_duration_seconds", "Time spent writing parsed points to SQLite.",
+                  ("op",))
+metrics.counter("rf_data_cache_events_total",
+                "In-memory store syncs (hits/misses) and card reads by kind.", ("event",))
+
+
+def record_error(e, where=None):
+    """นับ error ตามชนิด exception (where ไม่ใส่ = ชื่อ route ปัจจุบัน)"""
+    if where is None:
+        where = request.endpoint or "unknown"
+    metrics.inc("rf_errors_total", (where, type(e).__name__))
+
+# ===============================
+# Helper functions
+# ===============================
+@metrics.timed("rf_sdcard_check_duration_seconds")
+def is_sdcard_mounted():
+    """ตรวจว่า SD card ยัง mount อยู่และมีไฟล์ข้อมูลอย่างน้อย 1 ไฟล์"""
+    return os.path.ismount(SD_MOUNT_PATH) and bool(sample_files())
+
+# ===============================
+# Columnar store
+# ===============================
+# เก็บจุดวัดเป็นคอลัมน์ numpy (lat/lng/dbm float64, time เป็น epoch int64)
+# แทน list of dicts ที่กินหลายร้อย byte ต่อจุด
+# time ที่ parse ไม่ได้ (เช่น "0000-00-00 00:00:00" ตอน GPS ยังไม่มีวันที่)
+# เก็บเป็น NaT + ข้อความเดิมใน time_raw {index: str} (intern ไว้ ข้อความซ้ำใช้ object เดียว)
+
+TIME_NONE = np.iinfo(np.int64).min   # = NaT ของ datetime64
+_TIME_RE = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+
+class _Column:
+    """numpy array ที่ต่อท้ายได้ (จองที่เผื่อไว้)
+       ช่วง [0, n) ที่เขียนไปแล้วจะไม่ถูกแก้อีก view เก่าจึงอ่านได้ปลอดภัยไม่ต้องล็อก
+    """
+
+    def __init__(self, dtype, values=None):
+        self.dtype = dtype
+        self.buf = np.array(values if values is not None else [], dtype=dtype)
+        self.n = len(self.buf)
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        m = self.n + len(values)
+        if m > len(self.buf):
+            grown = np.empty(max(m, int(len(self.buf) * 1.5) + 64), dtype=self.dtype)
+            grown[:self.n] = self.buf[:self.n]
+            self.buf = grown
+        self.buf[self.n:m] = values
+        self.n = m
+
+    def view(self, n):
+        return self.buf[:n]
+
+    def nbytes(self):
+        return self.buf.nbytes
+
+
+def _as_float(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _parse_times(values, first_index=0):
+    """แปลงสตริงเวลา "YYYY-MM-DD HH:MM:SS" (UTC จาก GPS) เป็น epoch วินาที
+       คืน (epoch int64 array, {index: ข้อความเดิม} ของอันที่แปลงไม่ได้)
+       อันที่แปลงกลับแล้วไม่ได้ข้อความเดิมเป๊ะ ก็เก็บเป็นข้อความเดิมเหมือนกัน
+    """
+    n = len(values)
+    epoch = np.full(n, TIME_NONE, dtype=np.int64)
+    raw = {}
+    if n == 0:
+        return epoch, raw
+
+    # ทางด่วน: ทุกอันเป็นเวลาที่ถูกต้อง -> numpy แปลงทีเดียวทั้งก้อน
+    try:
+        text = np.array(values, dtype=str)
+        parsed = text.astype("datetime64[s]")
+        good_idx = np.arange(n)
+    except (ValueError, TypeError):
+        good_idx = [i for i, v in enumerate(values)
+                    if isinstance(v, str) and _TIME_RE.fullmatch(v)]
+        text = np.array([values[i] for i in good_idx], dtype=str)
+        parsed = np.array([_parse_one_time(v) for v in text.tolist()], dtype="datetime64[s]")
+        good_idx = np.array(good_idx, dtype=np.int64)
+
+    if len(good_idx):
+        back = np.char.replace(np.datetime_as_string(parsed, unit="s"), "T", " ")
+        ok = back == text
+        epoch[good_idx[ok]] = parsed[ok].astype(np.int64)
+
+    for i in np.flatnonzero(epoch == TIME_NONE).tolist():
+        v = values[i]
+        if v is not None:
+            raw[first_index + i] = sys.intern(v) if isinstance(v, str) else v
+    return epoch, raw
+
+
+def _parse_one_time(v):
+    try:
+        return np.datetime64(v, "s")
+    except ValueError:
+        return np.datetime64("NaT")
+
+
+def _float_column(recs, name):
+    try:
+        # ทางด่วน: ทุกจุดมีค่าเป็นตัวเลข
+        return np.array([p[name] for p in recs], dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        return np.fromiter((_as_float(p.get(name)) for p in recs),
+                           dtype=np.float64, count=len(recs))
+
+
+def _records_to_columns(records, first_index=0):
+    """list of dicts (แบบที่ ESP32 เขียน) -> คอลัมน์ numpy"""
+    if not isinstance(records, list):
+        raise ValueError("expected a JSON array of points")
+    recs = [p if isinstance(p, dict) else {} for p in records]
+
+    lat = _float_column(recs, "lat")
+    lng = _float_column(recs, "lng")
+    dbm = _float_column(recs, "dbm")
+    epoch, raw = _parse_times([p.get("time") for p in recs], first_index)
+    return lat, lng, dbm, epoch, raw
+
+
+class MeasurementStore:
+    """ที่เก็บจุดวัดแบบคอลัมน์ ใช้ร่วมกันทุก route
+       - version    เพิ่มทุกครั้งที่ข้อมูลเปลี่ยน (ใช้เป็น key ของแคชที่คำนวณต่อจากข้อมูล)
+       - generation เพิ่มเมื่อโหลดใหม่ทั้งชุด (undo/clear/เขียนใหม่)
+                    ถ้า generation เท่าเดิมแปลว่าข้อมูลมีแต่ต่อท้าย
+       - source     ตัวตนของต้นทางข้อมูล (updated_ns, generation, version ของ DB) ใช้ทำ ETag
+       - db_generation / db_version / last_id  ตำแหน่งที่ sync จาก DB มาถึงแล้ว
+       - derived    แคชที่คำนวณจากข้อมูลชุดนี้ (spatial index, ลำดับ sort, array ที่กรองแล้ว)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.derived = {}
+        self.version = 0
+        self.generation = 0
+        self.source = None
+        self.db_generation = 0
+        self.db_version = 0
+        self.last_id = 0
+        self._set_columns(*_records_to_columns([]))
+
+    def _set_columns(self, lat, lng, dbm, epoch, raw):
+        self.lat = _Column(np.float64, lat)
+        self.lng = _Column(np.float64, lng)
+        self.dbm = _Column(np.float64, dbm)
+        self.epoch = _Column(np.int64, epoch)
+        self.valid = _Column(np.bool_, np.isfinite(lat) & np.isfinite(lng) & np.isfinite(dbm))
+        self.time_raw = raw
+        self.n = len(lat)
+
+    def __len__(self):
+        return self.n
+
+    def replace(self, records):
+        """แทนที่ข้อมูลทั้งชุด"""
+        self.replace_columns(*_records_to_columns(records))
+
+    def replace_columns(self, lat, lng, dbm, epoch, raw):
+        with self._lock:
+            self._set_columns(lat, lng, dbm, epoch, raw)
+            self.generation += 1
+            self.version += 1
+
+    def extend(self, records):
+        """ต่อท้ายจุดใหม่ (จุดเดิมไม่ถูกแตะ)"""
+        if records:
+            self.extend_columns(*_records_to_columns(records, self.n))
+
+    def extend_columns(self, lat, lng, dbm, epoch, raw):
+        """ต่อท้ายคอลัมน์ที่แปลงแล้ว (raw ใช้ index นับต่อจาก self.n)"""
+        if not len(lat):
+            return
+        with self._lock:
+            self.lat.extend(lat)
+            self.lng.extend(lng)
+            self.dbm.extend(dbm)
+            self.epoch.extend(epoch)
+            self.valid.extend(np.isfinite(lat) & np.isfinite(lng) & np.isfinite(dbm))
+            self.time_raw.update(raw)
+            # เขียนคอลัมน์ให้ครบก่อนค่อยขยับ n ตัวอ่านจะไม่เห็นแถวที่ยังเขียนไม่เสร็จ
+            self.n += len(lat)
+            self.version += 1
+
+    def snapshot(self):
+        with self._lock:
+            return StoreSnapshot(self)
+
+    def nbytes(self):
+        cols = (self.lat, self.lng, self.dbm, self.epoch, self.valid)
+        return sum(c.nbytes() for c in cols)
+
+
+class StoreSnapshot:
+    """มุมมองข้อมูล ณ เวอร์ชันหนึ่ง (view ของคอลัมน์ ไม่ copy)
+       แปลงเป็น dict แบบเดิม {"lat","lng","time","dbm"} เฉพาะตอนจะส่งออกเท่านั้น
+    """
+
+    __slots__ = ("n", "version", "generation", "source", "lat", "lng", "dbm",
+                 "epoch", "valid", "time_raw", "derived")
+
+    def __init__(self, store):
+        n = store.n
+        self.n = n
+        self.version = store.version
+        self.generation = store.generation
+        self.source = store.source
+        self.lat = store.lat.view(n)
+        self.lng = store.lng.view(n)
+        self.dbm = store.dbm.view(n)
+        self.epoch = store.epoch.view(n)
+        self.valid = store.valid.view(n)
+        self.time_raw = store.time_raw
+        self.derived = store.derived
+
+    def __len__(self):
+        return self.n
+
+    def _indices(self, idx):
+        if idx is None:
+            return np.arange(self.n)
+        if isinstance(idx, slice):
+            return np.arange(self.n)[idx]
+        return np.asarray(idx, dtype=np.int64)
+
+    def time_strings(self, idx=None):
+        """epoch -> สตริงเวลาแบบเดียวกับที่ firmware เขียน"""
+        idx = self._indices(idx)
+        if idx.size == 0:
+            return []
+        ep = self.epoch[idx]
+        out = np.char.replace(
+            np.datetime_as_string(ep.astype("datetime64[s]"), unit="s"), "T", " "
+        ).tolist()
+        for j in np.flatnonzero(ep == TIME_NONE).tolist():
+            out[j] = self.time_raw.get(int(idx[j]))
+        return out
+
+    def column_list(self, name, idx=None):
+        """คอลัมน์ float -> list ของ Python (NaN -> None ให้เป็น JSON ที่ถูกต้อง)"""
+        col = getattr(self, name)
+        values = col[self._indices(idx)] if idx is not None else col
+        out = values.tolist()
+        if not np.isfinite(values).all():
+            out = [None if v != v else v for v in out]
+        return out
+
+    def rows(self, idx=None, with_index=False):
+        """คืน list of dicts (รูปแบบเดิมของ /data หรือ /tabledata ถ้า with_index)"""
+        if with_index:
+            ids = self._indices(idx).tolist()
+            return [
+                {"idx": i, "lat": a, "lng": b, "dbm": d}
+                for i, a, b, d in zip(ids,
+                                      self.column_list("lat", idx),
+                                      self.column_list("lng", idx),
+                                      self.column_list("dbm", idx))
+            ]
+        return [
+            {"lat": a, "lng": b, "time": t, "dbm": d}
+            for a, b, t, d in zip(self.column_list("lat", idx),
+                                  self.column_list("lng", idx),
+                                  self.time_strings(idx),
+                                  self.column_list("dbm", idx))
+        ]
+
+
+# ===============================
+# Shared columns (multi-worker)
+# ===============================
+# โหมด production หลาย worker (wsgi.py): ชุดรวมทุก session อยู่ในไฟล์คอลัมน์ไฟล์เดียว
+# ทุก worker mmap ไฟล์เดียวกันแบบอ่านอย่างเดียว -> ข้อมูลอยู่ใน page cache ชุดเดียว ไม่ใช่ N ชุด
+# layout: header SHARED_HEADER_BYTES byte แล้วตามด้วยคอลัมน์ lat/lng/dbm/epoch/valid (ยาว capacity)
+# แถวที่ < n ไม่ถูกแก้อีก (เหมือน _Column) ต่อท้าย = เขียนแถวใหม่ก่อนแล้วค่อยขยับ n ใน header
+# reset (undo/clear) หรือที่ไม่พอ = เขียนไฟล์ใหม่ทั้งไฟล์แล้ว rename ทับ worker ที่ map ไฟล์เก่าอยู่ยังอ่านต่อได้
+# ใครเขียน: process ไหนก็ได้ที่เห็นว่า DB ใหม่กว่าไฟล์ (ล็อกกันด้วย flock publish.lock)
+
+SHARED_HEADER_BYTES = 128
+# magic, format, capacity, n, version, generation, db_generation, db_version, updated_ns,
+# last_id, จำนวน time_raw
+_SHARED_HEADER = struct.Struct("<4sI QQQQ qqq qQ")
+_SHARED_MAGIC = b"RFCS"
+# flag ของตัวเฝ้าการ์ด (การ์ดเสียบอยู่ไหม) แยก offset ไว้ ไม่ชนกับตอนเขียน header หลัก
+_SHARED_FLAGS_OFFSET = 120
+_SHARED_COLUMNS = (("lat", np.float64), ("lng", np.float64), ("dbm", np.float64),
+                   ("epoch", np.int64), ("valid", np.bool_))
+
+
+def _shared_layout(capacity):
+    """offset ของแต่ละคอลัมน์ + ขนาดไฟล์ทั้งหมด (ทุกคอลัมน์เริ่มที่ขอบ 8 byte)"""
+    offsets, off = {}, SHARED_HEADER_BYTES
+    for name, dtype in _SHARED_COLUMNS:
+        offsets[name] = off
+        off += capacity * np.dtype(dtype).itemsize
+        off = (off + 7) // 8 * 8
+    return offsets, off
+
+
+class _MappedColumn:
+    """คอลัมน์ที่เป็น view บน mmap (อ่านอย่างเดียว) หน้าตาเหมือน _Column ให้ StoreSnapshot ใช้"""
+
+    def __init__(self, buf):
+        self.buf = buf
+
+    def view(self, n):
+        return self.buf[:n]
+
+    def nbytes(self):
+        return self.buf.nbytes
+
+
+class _FileLock:
+    """flock บนไฟล์ในโฟลเดอร์ shared (ล็อกข้าม process)"""
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        fcntl.flock(self.fd, self.mode)
+        return self
+
+    def __exit__(self, *exc):
+        os.close(self.fd)   # ปิด fd = ปลดล็อก
+
+
+class SharedStore:
+    """ชุดรวมทุก session แบบไฟล์คอลัมน์ที่ทุก worker ใช้ร่วมกัน
+       attribute เหมือน MeasurementStore (StoreSnapshot / route ใช้ได้ตรง ๆ)
+       - refresh(): อ่าน header ล่าสุด (map ไฟล์ใหม่ถ้าถูกแทนที่)
+       - sync()   : refresh แล้วถ้า DB ใหม่กว่าไฟล์ก็ publish เอง
+    """
+
+    def __init__(self, directory):
+        self.dir = directory
+        self.path = os.path.join(directory, "columns.bin")
+        self.raw_path = os.path.join(directory, "time_raw.json")
+        self._lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.derived = {}
+        self.version = 0
+        self.generation = 0
+        self.source = None
+        self.db_generation = 0
+        self.db_version = 0
+        self.last_id = 0
+        self.capacity = 0
+        self.n = 0
+        self.time_raw = {}
+        self._ino = None
+        self._mm = None
+        self._raw_count = 0
+        self._map(None, 0)
+
+    def __len__(self):
+        return self.n
+
+    def _file_lock(self, name, mode):
+        os.makedirs(self.dir, exist_ok=True)
+        return _FileLock(os.path.join(self.dir, name), mode)
+
+    def _map(self, mm, capacity):
+        offsets, _ = _shared_layout(capacity)
+        cols = {}
+        for name, dtype in _SHARED_COLUMNS:
+            if mm is None:
+                cols[name] = _MappedColumn(np.empty(0, dtype=dtype))
+            else:
+                cols[name] = _MappedColumn(np.frombuffer(mm, dtype=dtype, count=capacity,
+                                                         offset=offsets[name]))
+        self.lat, self.lng, self.dbm = cols["lat"], cols["lng"], cols["dbm"]
+        self.epoch, self.valid = cols["epoch"], cols["valid"]
+
+    def refresh(self):
+        """อ่าน header ล่าสุดจากไฟล์ (ถูกเขียนใหม่ทั้งไฟล์ -> map ไฟล์ใหม่)"""
+        with self._file_lock("header.lock", fcntl.LOCK_SH):
+            try:
+                ino = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                return
+            mm = self._mm
+            if ino != self._ino:
+                with open(self.path, "rb") as f:
+                    # mmap ถือ reference ของไฟล์เอง ปิด f ได้ ไฟล์เก่าที่ถูก rename ทับยังอยู่จนเลิก map
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            fields = _SHARED_HEADER.unpack_from(mm, 0)
+        (magic, _, capacity, n, version, generation, db_generation, db_version,
+         updated_ns, last_id, raw_count) = fields
+        if magic != _SHARED_MAGIC:
+            raise ValueError("%s is not a shared column file" % self.path)
+
+        raw = None
+        if ino != self._ino or raw_count != self._raw_count:
+            raw = self._load_raw() if raw_count else {}
+        with self._lock:
+            if ino != self._ino:
+                # ไม่ปิด mmap เก่าเอง snapshot ที่ยังถืออยู่อ่านต่อได้ GC เก็บให้ทีหลัง
+                self._mm, self._ino, self.capacity = mm, ino, capacity
+                self._map(mm, capacity)
+            if raw is not None:
+                self.time_raw, self._raw_count = raw, raw_count
+            self.n, self.version, self.generation = n, version, generation
+            self.db_generation, self.db_version, self.last_id = db_generation, db_version, last_id
+            self.source = (updated_ns, db_generation, db_version)
+
+    def _load_raw(self):
+        try:
+            with open(self.raw_path) as f:
+                return {int(k): v for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def mounted(self):
+        """สถานะการ์ดล่าสุดที่ตัวเฝ้าการ์ด (worker ที่เป็น leader) เขียนไว้"""
+        mm = self._mm
+        return bool(mm is not None and struct.unpack_from("<Q", mm, _SHARED_FLAGS_OFFSET)[0])
+
+    def set_mounted(self, mounted):
+        with self._file_lock("header.lock", fcntl.LOCK_EX):
+            try:
+                fd = os.open(self.path, os.O_WRONLY)
+            except FileNotFoundError:
+                return
+            try:
+                os.pwrite(fd, struct.pack("<Q", 1 if mounted else 0), _SHARED_FLAGS_OFFSET)
+            finally:
+                os.close(fd)
+
+    def sync(self):
+        """ให้ไฟล์ทันข้อมูลใน DB (คืน True ถ้ามีการเปลี่ยนแปลง)"""
+        state = _selection_state(*sample_db.state(), None)
+        self.refresh()
+        if state[:2] == (self.db_generation, self.db_version):
+            return False
+        with self.sync_lock:
+            return self.publish()
+
+    def publish(self):
+        """ดึงแถวที่ไฟล์ยังไม่มีจาก DB มาเขียนลงไฟล์ ล็อกข้าม process ด้วย publish.lock"""
+        with self._file_lock("publish.lock", fcntl.LOCK_EX):
+            # process อื่นอาจ publish ไปแล้วระหว่างรอล็อก
+            self.refresh()
+            base = self.n if self._ino is not None else 0
+            state, reset, (lat, lng, dbm, epoch, raw), last_id = sample_db.read_columns_since(
+                None, self.db_generation, self.db_version, self.last_id, base)
+            if state[:2] == (self.db_generation, self.db_version):
+                return False
+
+            if reset:
+                base = 0
+            cols = {"lat": lat, "lng": lng, "dbm": dbm, "epoch": epoch,
+                    "valid": np.isfinite(lat) & np.isfinite(lng) & np.isfinite(dbm)}
+            total = base + len(lat)
+
+            raw_all = raw if base == 0 else {**self.time_raw, **raw}
+            if raw or base == 0:
+                self._write_raw(raw_all)
+            header = [_SHARED_MAGIC, 1, self.capacity, total, self.version + 1,
+                      self.generation + (1 if reset else 0), state[0], state[1], state[2],
+                      last_id, len(raw_all)]
+
+            if base == 0 or total > self.capacity:
+                # ไฟล์ใหม่ทั้งไฟล์: ที่เผื่อไว้ ~1.5 เท่า ต่อท้ายรอบหน้าจะได้ไม่ต้องเขียนใหม่อีก
+                header[2] = max(int(total * 1.5), total + 1024)
+                self._write_file(header, cols, base)
+            else:
+                offsets, _ = _shared_layout(self.capacity)
+                fd = os.open(self.path, os.O_WRONLY)
+                try:
+                    for name, dtype in _SHARED_COLUMNS:
+                        os.pwrite(fd, np.ascontiguousarray(cols[name], dtype=dtype).tobytes(),
+                                  offsets[name] + base * np.dtype(dtype).itemsize)
+                    # แถวใหม่ลงไฟล์ครบแล้วค่อยขยับ n
+                    with self._file_lock("header.lock", fcntl.LOCK_EX):
+                        os.pwrite(fd, _SHARED_HEADER.pack(*header), 0)
+                finally:
+                    os.close(fd)
+        self.refresh()
+        return True
+
+    def _write_raw(self, raw):
+        tmp = "%s.%d.tmp" % (self.raw_path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump({str(k): v for k, v in raw.items()}, f)
+        os.replace(tmp, self.raw_path)
+
+    def _write_file(self, header, cols, base):
+        """เขียนไฟล์ใหม่ (แถวเดิม [0, base) + แถวใหม่) แล้ว rename ทับไฟล์เดิมทีเดียว"""
+        capacity = header[2]
+        offsets, size = _shared_layout(capacity)
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp, "w+b") as f:
+            f.truncate(size)
+            mm = mmap.mmap(f.fileno(), size)
+            try:
+                mm[:_SHARED_HEADER.size] = _SHARED_HEADER.pack(*header)
+                struct.pack_into("<Q", mm, _SHARED_FLAGS_OFFSET, 1 if self.mounted() else 0)
+                for name, dtype in _SHARED_COLUMNS:
+                    out = np.frombuffer(mm, dtype=dtype, count=capacity, offset=offsets[name])
+                    if base:
+                        out[:base] = getattr(self, name).view(base)
+                    out[base:header[3]] = cols[name]
+                    del out
+            finally:
+                mm.close()
+        with self._file_lock("header.lock", fcntl.LOCK_EX):
+            os.replace(tmp, self.path)
+
+    def snapshot(self):
+        with self._lock:
+            return StoreSnapshot(self)
+
+    def nbytes(self):
+        return sum(c.nbytes() for c in (self.lat, self.lng, self.dbm, self.epoch, self.valid))
+
+
+# ===============================
+# SD card reader (incremental)
+# ===============================
+# ไฟล์จุดวัดทุกไฟล์ใต้ SD_MOUNT_PATH นับเป็น 1 session (ดู sample_files)
+# สถานะการอ่านแยกต่อไฟล์ใน _files: path -> {"key", "layout", "count"}
+# key = ตัวตนของไฟล์ (mtime, size, inode) ถ้าไฟล์ไม่เปลี่ยนก็ไม่ต้อง json.load ใหม่
+# layout = (ตำแหน่ง ']' ตัวสุดท้าย, byte หัวไฟล์, byte ก่อน ']') ของการ parse ล่าสุด
+#          ใช้เช็กว่าไฟล์แค่ "ต่อท้าย" จากเดิม จะได้ parse เฉพาะส่วนใหม่
+# count = จำนวนจุดในไฟล์ตอน parse ล่าสุด
+# ไฟล์หนึ่งเปลี่ยนก็อ่านใหม่แค่ไฟล์นั้น ไฟล์อื่นไม่ถูกแตะ
+_files = {}
+_sd_lock = threading.Lock()
+
+# store = ข้อมูลรวมทุก session ที่ route ใช้ (sync มาจาก DB ในเครื่อง ไม่ได้อ่านการ์ดตรง ๆ)
+_cache = {
+    # ชุดรวมทุก session (โหมดหลาย worker = ไฟล์คอลัมน์ที่ใช้ร่วมกัน)
+    "store": SharedStore(SHARED_COLUMNS_DIR) if SHARED_COLUMNS_DIR else MeasurementStore(),
+}
+_cache_lock = threading.Lock()
+
+# ตัวนับของแคช (ดู cache_stats) นับผ่าน shard ต่อ thread ของ metrics
+# request thread กับ thread เฝ้าการ์ดนับพร้อมกันได้โดยไม่มีค่าหาย (dict += 1 ไม่ atomic)
+_CACHE_EVENTS = ("hits", "misses", "reloads", "tail_reads", "full_reads", "parallel_reads")
+
+
+def _count(event, n=1):
+    metrics.inc("rf_data_cache_events_total", (event,), n)
+
+
+def _cache_counts():
+    totals = metrics.totals()
+    return {event: totals.get(("rf_data_cache_events_total", (event,)), 0)
+            for event in _CACHE_EVENTS}
+
+# จำนวน byte ที่ใช้เทียบหัวไฟล์/ท้ายไฟล์ ว่ายังเป็นไฟล์เดิมอยู่
+TAIL_SIG_BYTES = 64
+
+# โฟลเดอร์ระบบบนการ์ด FAT ไม่ต้องเข้าไปหา
+_SKIP_DIRS = ("System Volume Information",)
+
+
+def sample_files():
+    """หาไฟล์จุดวัด (*.json) ทุกไฟล์ใต้ SD_MOUNT_PATH
+       คืน dict ชื่อ session -> path เช่น {"noise_samples": ".../noise_samples.json",
+       "2025-01-01/run1": ".../2025-01-01/run1.json"}
+    """
+    found = {}
+    for root, dirs, names in os.walk(SD_MOUNT_PATH):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d not in _SKIP_DIRS)
+        for name in sorted(names):
+            # "._xxx.json" = ไฟล์ขยะที่ macOS เขียนทิ้งไว้
+            if name.startswith(".") or not name.lower().endswith(SAMPLE_FILE_EXT):
+                continue
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, SD_MOUNT_PATH)
+            found[rel[:-len(SAMPLE_FILE_EXT)].replace(os.sep, "/")] = path
+    return found
+
+
+def _file_key(path):
+    """ตัวตนของไฟล์ ณ ตอนนี้: (mtime_ns, size, inode)"""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _file_layout(f, end):
+    """ตำแหน่ง ']' ปิดท้าย + byte หัว/ท้าย ไว้สำหรับอ่านแบบ incremental รอบถัดไป"""
+    if end is None:
+        return None
+    f.seek(0)
+    head = f.read(min(TAIL_SIG_BYTES, end))
+    start = max(0, end - TAIL_SIG_BYTES)
+    f.seek(start)
+    return (end, head, f.read(end - start))
+
+
+def _load_file(path):
+    """อ่านทั้งไฟล์ คืน (key, layout, count, แถวสำหรับ DB)
+       ไม่แตะ state ของ process เลย ส่งไปรันใน process pool ได้
+    """
+    key = _file_key(path)
+    with open(path, "rb") as f:
+        raw = f.read()
+        records = json.loads(raw)
+        if not isinstance(records, list):
+            raise ValueError("expected a JSON array of points")
+        body = raw.rstrip()
+        end = len(body) - 1 if body.endswith(b"]") else None
+        del raw, body
+        layout = _file_layout(f, end)
+    return key, layout, len(records), _records_to_db_rows(records)
+
+
+def iter_sample_chunks(f, buffer_bytes=SD_PARSE_BUFFER_BYTES):
+    """อ่านไฟล์จุดวัด [{..},{..},...] ทีละ buffer_bytes คืน list ของจุดทีละก้อน
+       ตัดก้อนที่ '}' ตัวสุดท้ายใน buffer (จุดแต่ละจุดเป็น object ชั้นเดียว ไม่มี {} ซ้อน)
+       แล้ว json.loads ทั้งก้อนทีเดียว ส่วนที่เหลือ (จุดที่ขาดครึ่ง) ยกไปต่อกับ buffer ถัดไป
+       '}' นั้นอยู่ในข้อความของจุดที่ยังมาไม่ครบ -> parse พัง ถอยไปตัดที่ '}' ก่อนตำแหน่งที่พัง
+       ไฟล์ไม่ครบ/ผิดรูปแบบ -> ValueError (เหมือน json.loads ทั้งไฟล์)
+    """
+    buf = b""
+    started = False
+    while True:
+        chunk = f.read(buffer_bytes)
+        if not chunk:
+            break
+        buf += chunk
+        del chunk
+        if not started:
+            buf = buf.lstrip()
+            if not buf:
+                continue
+            if buf[:1] != b"[":
+                raise ValueError("expected a JSON array of points")
+            buf = buf[1:]
+            started = True
+
+        records, end = None, len(buf)
+        while records is None:
+            cut = buf.rfind(b"}", 0, end)
+            if cut < 0:
+                break
+            body = buf[:cut + 1].lstrip()
+            if body[:1] == b",":
+                body = body[1:]
+            try:
+                records = json.loads(b"[" + body + b"]")
+            except ValueError as e:
+                # ตำแหน่งที่พังใน buf (ตัด "[" ที่เติมหน้าออก) ลองใหม่ที่ '}' ก่อนหน้านั้น
+                end = min(cut, cut + 1 - len(body) + getattr(e, "pos", 0) - 1)
+            del body
+        if records is None:
+            if len(buf.strip()) > max(buffer_bytes, SD_MAX_POINT_BYTES):
+                raise ValueError("point larger than SD_MAX_POINT_BYTES")
+            continue
+        buf = buf[cut + 1:]
+        yield records
+
+    if not started or buf.strip() != b"]":
+        raise ValueError("unterminated JSON array")
+
+
+def _array_end(f):
+    """ตำแหน่ง ']' ปิดท้ายไฟล์ (None ถ้าไฟล์ไม่ได้ลงท้ายด้วย ']')"""
+    size = f.seek(0, os.SEEK_END)
+    start = max(0, size - TAIL_SIG_BYTES)
+    f.seek(start)
+    tail = f.read().rstrip()
+    return start + len(tail) - 1 if tail.endswith(b"]") else None
+
+
+def _stream_file(path, key):
+    """อ่านไฟล์ใหญ่ทีละก้อน (iter_sample_chunks) คืนแถวสำหรับ DB ทีละก้อน
+       เป็น generator: ไฟล์ถูกอ่านตอน SampleDB.replace ดึงแถวไปเขียน ไม่มีช่วงไหนถือทั้งไฟล์
+       อ่านครบแล้วค่อยบันทึก state ของไฟล์ใน _files (พังกลางทาง -> ไม่มี layout อ่านเต็มใหม่รอบหน้า)
+    """
+    t0 = time.perf_counter()
+    count = 0
+    try:
+        with open(path, "rb") as f:
+            for records in iter_sample_chunks(f):
+                count += len(records)
+                rows = _records_to_db_rows(records)
+                del records
+                yield rows
+            layout = _file_layout(f, _array_end(f))
+    except Exception as e:
+        app.logger.warning("sd reader: %s: %s", path, e)
+        record_error(e, "sd_reader")
+        with _sd_lock:
+            _files[path] = {"key": key, "layout": None, "count": 0}
+        raise
+    with _sd_lock:
+        _files[path] = {"key": key, "layout": layout, "count": count}
+        _count("full_reads")
+    metrics.observe("rf_sd_parse_duration_seconds", time.perf_counter() - t0, ("stream",))
+    metrics.inc("rf_sd_bytes_read_total", ("stream",), key[1])
+    metrics.inc("rf_sd_records_parsed_total", ("stream",), count)
+
+
+_parse_pool = {"executor": None}
+
+
+def _load_files(paths):
+    """อ่านหลายไฟล์ทั้งไฟล์ คืน list ของผลลัพธ์ _load_file (หรือ exception) ตามลำดับ paths
+       json.loads ติด GIL -> ใช้ process pool กระจายไปทุก core ถ้าไฟล์ใหญ่พอจะคุ้ม
+    """
+    def total_size():
+        return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+    if len(paths) < 2 or SD_PARSE_WORKERS < 2 or total_size() < PARALLEL_PARSE_MIN_BYTES:
+        results = []
+        for path in paths:
+            try:
+                results.append(_load_file(path))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    if _parse_pool["executor"] is None:
+        # spawn: ไม่ fork process ที่มี thread อื่นวิ่งอยู่ (watcher/SSE)
+        _parse_pool["executor"] = ProcessPoolExecutor(
+            max_workers=SD_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"))
+    futures = [_parse_pool["executor"].submit(_load_file, p) for p in paths]
+    _count("parallel_reads", len(paths))
+    results = [f.exception() or f.result() for f in futures]
+    if any(isinstance(r, BrokenProcessPool) for r in results):
+        # worker ตาย (เช่นโดน OOM kill) รอบหน้าเปิด pool ใหม่
+        _parse_pool["executor"].shutdown(wait=False)
+        _parse_pool["executor"] = None
+    return results
+
+
+def _read_appended(state, f, size):
+    """ไฟล์ที่ ESP32 เขียนเป็นแบบ [{..},{..}] และ appendJsonArray แค่แทรก ",{..}" ก่อน ']'
+       ถ้าหัวไฟล์และ byte ก่อน ']' เดิมยังเหมือนเดิม และตรง ']' เดิมกลายเป็น ','
+       แปลว่ามีแค่จุดใหม่ต่อท้าย -> คืน byte ส่วนท้ายหลัง ',' นั้น (ลงท้ายด้วย ']')
+       คืน None ถ้าไม่ใช่การต่อท้าย (undo / clear / เขียนใหม่ทั้งไฟล์)
+    """
+    layout = state["layout"]
+    if layout is None or not state["count"] or size <= layout[0] + 1:
+        return None
+
+    end, head, sig = layout
+    if f.read(len(head)) != head:
+        return None
+    f.seek(end - len(sig))
+    if f.read(len(sig) + 1) != sig + b",":
+        return None
+    return f.read()
+
+
+def _parse_tail(state, path, size):
+    """parse เฉพาะจุดที่ต่อท้ายเข้ามาใหม่ คืน list ของจุดใหม่
+       คืน None ถ้าใช้วิธีนี้ไม่ได้ ให้ไป parse เต็มแทน
+    """
+    t0 = time.perf_counter()
+    with open(path, "rb") as f:
+        tail = _read_appended(state, f, size)
+        if tail is None:
+            return None
+        try:
+            new_points = json.loads(b"[" + tail)
+        except ValueError:
+            # ไฟล์อาจกำลังถูกเขียนอยู่ครึ่ง ๆ กลาง ๆ
+            return None
+        if not isinstance(new_points, list):
+            return None
+
+        # ค่าใช้จ่ายขึ้นกับจำนวนจุดใหม่เท่านั้น
+        state["layout"] = _file_layout(f, state["layout"][0] + len(tail.rstrip()))
+    state["count"] += len(new_points)
+    metrics.observe("rf_sd_parse_duration_seconds", time.perf_counter() - t0, ("tail",))
+    metrics.inc("rf_sd_bytes_read_total", ("tail",), len(tail))
+    metrics.inc("rf_sd_records_parsed_total", ("tail",), len(new_points))
+    return new_points
+
+
+def read_sd_changes(files, force=False):
+    """อ่านสิ่งที่เปลี่ยนในแต่ละไฟล์ตั้งแต่ครั้งก่อน (files = ผลของ sample_files())
+       คืน list ของ (session, path, "append"/"replace"/"stream", แถวสำหรับ DB) เฉพาะไฟล์ที่เปลี่ยน
+       ไฟล์ที่ต้องอ่านทั้งไฟล์หลายไฟล์พร้อมกันจะ parse แบบขนาน (_load_files)
+       ไฟล์ใหญ่ (>= STREAM_PARSE_MIN_BYTES) = "stream": แถวเป็น iterator ที่อ่านไฟล์ทีละก้อน (_stream_file)
+       force=True -> อ่านใหม่ทุกไฟล์ทั้งไฟล์ (ใช้กับ /reload)
+    """
+    with _sd_lock:
+        changes, full = [], []
+        for session, path in files.items():
+            state = _files.setdefault(path, {"key": None, "layout": None, "count": 0})
+            try:
+                key = _file_key(path)
+            except OSError:
+                continue
+            if not force and state["key"] == key:
+                continue
+
+            # ล้าง key ก่อน ถ้า parse พังกลางทางรอบหน้าจะได้อ่านใหม่
+            state["key"] = None
+            records = None if force else _parse_tail(state, path, key[1])
+            if records is None:
+                if key[1] >= STREAM_PARSE_MIN_BYTES:
+                    changes.append((session, path, "stream",
+                                    itertools.chain.from_iterable(_stream_file(path, key))))
+                else:
+                    full.append((session, path, key))
+                continue
+            state["key"] = key
+            changes.append((session, path, "append", _records_to_db_rows(records)))
+            _count("tail_reads")
+
+        t0 = time.perf_counter()
+        results = _load_files([path for _, path, _ in full])
+        if full:
+            metrics.observe("rf_sd_parse_duration_seconds", time.perf_counter() - t0, ("full",))
+        for (session, path, key), result in zip(full, results):
+            if isinstance(result, Exception):
+                # ไฟล์เดียวเสีย (หรือกำลังเขียนอยู่) ไม่ทำให้ session อื่นพัง
+                # จำ key ไว้ ไฟล์ยังเหมือนเดิมก็ไม่ต้องลอง/เตือนซ้ำ เขียนเพิ่มเมื่อไหร่ค่อยอ่านใหม่
+                app.logger.warning("sd reader: %s: %s", path, result)
+                record_error(result, "sd_reader")
+                _files[path] = {"key": key, "layout": None, "count": 0}
+                continue
+            key, layout, count, rows = result
+            _files[path] = {"key": key, "layout": layout, "count": count}
+            changes.append((session, path, "replace", rows))
+            _count("full_reads")
+            metrics.inc("rf_sd_bytes_read_total", ("full",), key[1])
+            metrics.inc("rf_sd_records_parsed_total", ("full",), count)
+
+        # ไฟล์ที่หายไปจากการ์ด: ลืม state (ข้อมูลใน DB ยังอยู่)
+        for path in set(_files) - set(files.values()):
+            del _files[path]
+        return changes
+
+
+def forget_sd_files():
+    """การ์ดถูกถอด: เสียบกลับมาเมื่อไหร่ค่อยเทียบทุกไฟล์ใหม่อีกรอบ"""
+    with _sd_lock:
+        for state in _files.values():
+            state["key"] = None
+
+
+# ===============================
+# Local database (SQLite WAL)
+# ===============================
+# ทุกจุดที่อ่านจากการ์ดถูก ingest ลง SQLite ในเครื่องโดย thread เบื้องหลัง
+# route อ่านจาก DB (ผ่าน store ในหน่วยความจำ) ไม่ต้องแตะการ์ดเลย
+# ถอดการ์ดออกก็ยังดูข้อมูลล่าสุดได้ และ WAL ทำให้ตัวอ่านไม่ต้องรอตัวเขียน
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    time    TEXT,
+    epoch   INTEGER,
+    lat     REAL,
+    lng     REAL,
+    dbm     REAL,
+    cell    INTEGER,
+    UNIQUE (session, time, lat, lng, dbm)
+);
+CREATE INDEX IF NOT EXISTS samples_session ON samples (session, id);
+CREATE INDEX IF NOT EXISTS samples_epoch ON samples (epoch);
+CREATE INDEX IF NOT EXISTS samples_cell ON samples (cell);
+CREATE TABLE IF NOT EXISTS sessions (
+    name       TEXT PRIMARY KEY,
+    path       TEXT,
+    generation INTEGER NOT NULL DEFAULT 0,
+    version    INTEGER NOT NULL DEFAULT 0,
+    updated_ns INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value
+);
+INSERT OR IGNORE INTO meta VALUES ('generation', 0), ('version', 0), ('updated_ns', 0);
+PRAGMA user_version = 2;
+"""
+
+# โหลดแถวจาก DB เข้า store ทีละกี่แถว (คุมหน่วยความจำตอนโหลดครั้งแรก)
+DB_FETCH_ROWS = 50000
+
+
+def spatial_cell(lat, lng, cell_deg=SPATIAL_CELL_DEG):
+    """(row, col) ของช่อง grid ขนาด cell_deg องศา"""
+    row = np.floor((np.asarray(lat) + 90.0) / cell_deg).astype(np.int64)
+    col = np.floor((np.asarray(lng) + 180.0) / cell_deg).astype(np.int64)
+    return row, col
+
+
+def spatial_key(row, col):
+    """key เดียวของช่อง (row, col) ใช้ทั้งใน SpatialIndex และคอลัมน์ cell ของ DB"""
+    return row * 10_000_000 + col
+
+
+def _nan_to_none(values):
+    out = values.tolist()
+    if not np.isfinite(values).all():
+        out = [None if v != v else v for v in out]
+    return out
+
+
+def _records_to_db_rows(records):
+    """list of dicts -> tuple สำหรับ INSERT (time, epoch, lat, lng, dbm, cell)"""
+    lat, lng, dbm, epoch, _ = _records_to_columns(records)
+    times = [p.get("time") if isinstance(p, dict) else None for p in records]
+    ok = np.isfinite(lat) & np.isfinite(lng)
+    cells = np.zeros(lat.size, dtype=np.int64)
+    if ok.any():
+        cells[ok] = spatial_key(*spatial_cell(lat[ok], lng[ok]))
+    cell_list = [c if k else None for c, k in zip(cells.tolist(), ok.tolist())]
+    epochs = [None if e == TIME_NONE else e for e in epoch.tolist()]
+    times = [t if t is None or isinstance(t, str) else json.dumps(t) for t in times]
+    return list(zip(times, epochs, _nan_to_none(lat), _nan_to_none(lng),
+                    _nan_to_none(dbm), cell_list))
+
+
+def _db_rows_to_columns(rows, first_index):
+    """แถวจาก DB (id, time, epoch, lat, lng, dbm) -> คอลัมน์สำหรับ MeasurementStore"""
+    _, times, epochs, lats, lngs, dbms = zip(*rows)
+    lat = np.array(lats, dtype=np.float64)
+    lng = np.array(lngs, dtype=np.float64)
+    dbm = np.array(dbms, dtype=np.float64)
+    epoch = np.array([TIME_NONE if e is None else e for e in epochs], dtype=np.int64)
+    raw = {
+        first_index + i: sys.intern(t)
+        for i, (t, e) in enumerate(zip(times, epochs))
+        if e is None and t is not None
+    }
+    return lat, lng, dbm, epoch, raw
+
+
+def _concat_columns(parts):
+    if not parts:
+        return _records_to_columns([])
+    if len(parts) == 1:
+        return parts[0]
+    lat, lng, dbm, epoch, raws = zip(*parts)
+    raw = {}
+    for r in raws:
+        raw.update(r)
+    return (np.concatenate(lat), np.concatenate(lng), np.concatenate(dbm),
+            np.concatenate(epoch), raw)
+
+
+def _selection_state(meta, sessions, names):
+    """(generation, version, updated_ns) ของข้อมูลชุดที่เลือก (names=None -> รวมทุก session)"""
+    if names is None:
+        return meta["generation"], meta["version"], meta["updated_ns"]
+    picked = [sessions.get(name, (0, 0, 0)) for name in names]
+    return (tuple(p[0] for p in picked), tuple(p[1] for p in picked),
+            max(p[2] for p in picked))
+
+
+class SampleDB:
+    """SQLite (WAL) เก็บจุดวัดในเครื่อง
+       - samples : 1 แถวต่อจุด ไม่ซ้ำกันตาม (session, time, lat, lng, dbm)
+                   มี index ตาม session, เวลา และช่องพื้นที่
+       - sessions: 1 แถวต่อไฟล์บนการ์ด generation/version แยกของใครของมัน
+       - meta    : generation (เพิ่มเมื่อข้อมูลถูกลบ/เขียนใหม่), version (เพิ่มทุก commit) ของชุดรวม
+       ตัวเขียน (ingester) 1 connection, ตัวอ่าน 1 connection ต่อ thread (WAL: ตัวอ่านไม่รอกันเอง)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # สร้าง/ย้าย schema ครั้งเดียวต่อ process ไม่ใช่ทุก connection ของตัวอ่าน
+        with self._schema_lock:
+            if not self._ready:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._migrate(conn)
+                    self._create(conn)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                self._ready = True
+        return conn
+
+    def _create(self, conn):
+        # executescript จะ COMMIT เองกลางทาง เลยรันทีละคำสั่งใน transaction เดียว
+        for stmt in _SCHEMA.split(";"):
+            if stmt.strip():
+                conn.execute(stmt)
+
+    def _migrate(self, conn):
+        """DB รุ่นแรกยังไม่มีคอลัมน์ session (อ่านไฟล์เดียว) -> ย้ายแถวเดิมไปเป็น DEFAULT_SESSION"""
+        columns = [r[1] for r in conn.execute("PRAGMA table_info(samples)")]
+        if not columns or "session" in columns:
+            return
+        conn.execute("ALTER TABLE samples RENAME TO samples_v1")
+        conn.execute("DROP INDEX IF EXISTS samples_epoch")
+        conn.execute("DROP INDEX IF EXISTS samples_cell")
+        self._create(conn)
+        conn.execute(
+            "INSERT INTO samples (id, session, time, epoch, lat, lng, dbm, cell) "
+            "SELECT id, ?, time, epoch, lat, lng, dbm, cell FROM samples_v1", (DEFAULT_SESSION,))
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        conn.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, ?)",
+                     (DEFAULT_SESSION, JSON_FILE_PATH, meta["generation"],
+                      meta["version"], meta["updated_ns"]))
+        conn.execute("DROP TABLE samples_v1")
+
+    def _write_conn(self):
+        if self._writer is None:
+            self._writer = self._connect()
+        return self._writer
+
+    def _read_conn(self):
+        """connection อ่านของ thread นี้ (ปิดเองเมื่อ thread จบ)"""
+        conn = getattr(self._local, "reader", None)
+        if conn is None:
+            conn = self._local.reader = self._connect()
+        return conn
+
+    def _commit(self, conn, session, path, changed, reset):
+        # path ตั้งครั้งเดียวตอนสร้าง session: แหล่งอื่นที่เขียน session เดียวกัน (เช่น serial) ไม่เปลี่ยนชื่อทับ
+        conn.execute("INSERT INTO sessions (name, path) VALUES (?, ?) "
+                     "ON CONFLICT (name) DO NOTHING", (session, path))
+        if changed:
+            now = time.time_ns()
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            if reset:
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'updated_ns'", (now,))
+            conn.execute("UPDATE sessions SET version = version + 1, generation = generation + ?, "
+                         "updated_ns = ? WHERE name = ?", (int(reset), now, session))
+        conn.execute("COMMIT")
+
+    def append(self, session, path, rows):
+        """เพิ่มจุดใหม่ต่อท้าย session (จุดที่ซ้ำของเดิมถูกข้าม)
+           rows มาจาก _records_to_db_rows
+        """
+        with self._write_lock:
+            conn = self._write_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = conn.total_changes
+                conn.executemany(
+                    "INSERT OR IGNORE INTO samples (session, time, epoch, lat, lng, dbm, cell) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", [(session,) + r for r in rows])
+                self._commit(conn, session, path, conn.total_changes != before, reset=False)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def replace(self, session, path, rows):
+        """ทำให้ session ตรงกับไฟล์ทั้งชุด (undo/clear/เขียนใหม่) session อื่นไม่ถูกแตะ
+           เทียบตามลำดับ: ส่วนต้นที่เหมือนเดิมไม่แตะ ลบเฉพาะแถวหลังจุดที่ต่างกัน แล้วเพิ่มส่วนที่เหลือ
+           undo = ลบแถวสุดท้ายแถวเดียว ไม่ได้ล้างทั้งตาราง
+           rows เป็น iterator ได้ (ไฟล์ใหญ่แบบ stream) เดินเทียบกับแถวเดิมไปพร้อมกัน ไม่ถือไว้ทั้งชุด
+        """
+        rows = iter(rows)
+        with self._write_lock:
+            conn = self._write_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = conn.execute(
+                    "SELECT id, time, lat, lng, dbm FROM samples WHERE session = ? ORDER BY id",
+                    (session,))
+                after, pending, differs = 0, [], False
+                for old in existing:
+                    new = next(rows, None)
+                    # จุดซ้ำในไฟล์ที่ UNIQUE ทิ้งไปแล้วตอนเขียนครั้งก่อน ไม่นับว่าไฟล์ต่างจาก DB
+                    while (new is not None and old[1:] != (new[0], new[2], new[3], new[4])
+                           and self._stored_before(conn, session, new, after)):
+                        new = next(rows, None)
+                    if new is None or old[1:] != (new[0], new[2], new[3], new[4]):
+                        pending = [] if new is None else [new]
+                        differs = True
+                        break
+                    after = old[0]
+                existing.close()
+
+                before = conn.total_changes
+                if differs:
+                    conn.execute("DELETE FROM samples WHERE session = ? AND id > ?",
+                                 (session, after))
+                removed = conn.total_changes != before
+                conn.executemany(
+                    "INSERT OR IGNORE INTO samples (session, time, epoch, lat, lng, dbm, cell) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((session,) + r for r in itertools.chain(pending, rows)))
+                self._commit(conn, session, path, conn.total_changes != before, reset=removed)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _stored_before(conn, session, row, after):
+        """row (จาก _records_to_db_rows) มีใน session แล้วที่ id <= after ไหม
+           ค่า NULL ไม่ชน UNIQUE ของ SQLite แถวแบบนั้นจึงไม่เคยถูกทิ้ง -> False
+        """
+        key = (row[0], row[2], row[3], row[4])
+        if None in key:
+            return False
+        found = conn.execute(
+            "SELECT id FROM samples WHERE session = ? AND time = ? AND lat = ? AND lng = ? "
+            "AND dbm = ?", (session,) + key).fetchone()
+        return found is not None and found[0] <= after
+
+    def _state(self, conn):
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        sessions = {
+            name: (generation, version, updated_ns)
+            for name, generation, version, updated_ns in conn.execute(
+                "SELECT name, generation, version, updated_ns FROM sessions")
+        }
+        return meta, sessions
+
+    def state(self):
+        """(meta ของชุดรวม, {session: (generation, version, updated_ns)})"""
+        return self._state(self._read_conn())
+
+    def read_columns_since(self, names, generation, version, last_id, first_index):
+        """อ่านสถานะ + แถวที่ store ยังไม่มี ใน read transaction เดียวกัน (snapshot ตรงกัน)
+           names = tuple ชื่อ session (None = ทุก session)
+           คืน (สถานะ (generation, version, updated_ns), reset, คอลัมน์ของแถวใหม่, id แถวสุดท้าย)
+           reset=True -> generation เปลี่ยน ต้องโหลดใหม่ตั้งแต่แถวแรก (index นับจาก 0 แทน first_index)
+           แปลงเป็นคอลัมน์ทีละ DB_FETCH_ROWS แถว ไม่ถือ tuple ของทุกแถวไว้พร้อมกัน
+        """
+        conn = self._read_conn()
+        conn.execute("BEGIN")
+        try:
+            state = _selection_state(*self._state(conn), names)
+            if state[:2] == (generation, version):
+                return state, False, _concat_columns([]), last_id
+            reset = state[0] != generation
+            sql = "SELECT id, time, epoch, lat, lng, dbm FROM samples WHERE id > ?"
+            args = [0 if reset else last_id]
+            if names is not None:
+                sql += " AND session IN (%s)" % ",".join("?" * len(names))
+                args.extend(names)
+            cur = conn.execute(sql + " ORDER BY id", args)
+            first = 0 if reset else first_index
+            last_id = 0 if reset else last_id
+            parts = []
+            while True:
+                rows = cur.fetchmany(DB_FETCH_ROWS)
+                if not rows:
+                    break
+                parts.append(_db_rows_to_columns(rows, first))
+                first += len(rows)
+                last_id = rows[-1][0]
+                del rows
+        finally:
+            conn.execute("COMMIT")
+        return state, reset, _concat_columns(parts), last_id
+
+    def sessions(self):
+        """รายการ session พร้อมจำนวนจุดและช่วงเวลา สำหรับ /sessions
+           ช่วงเวลาจาก epoch (MIN/MAX ข้าม NULL) ไม่ใช่ข้อความ: "----" / "0000-00-00 ..." ของ
+           firmware ตอน GPS ยังไม่มีเวลาเรียงมาก่อนเวลาจริงเสมอ
+        """
+        rows = self._read_conn().execute(
+            "SELECT s.name, s.path, s.updated_ns, COUNT(x.id), "
+            "datetime(MIN(x.epoch), 'unixepoch'), datetime(MAX(x.epoch), 'unixepoch') "
+            "FROM sessions s LEFT JOIN samples x ON x.session = s.name "
+            "GROUP BY s.name ORDER BY s.name").fetchall()
+        return [
+            {"name": name, "path": path, "updated": updated_ns / 1e9 if updated_ns else None,
+             "points": points, "first": first, "last": last}
+            for name, path, updated_ns, points, first, last in rows
+        ]
+
+
+sample_db = SampleDB(DB_PATH)
+
+# store ของ session ที่ถูกเปิดดู (ไม่รวมชุดรวมทุก session ที่อยู่ใน _cache["store"])
+# key = tuple ชื่อ session เรียงแล้ว, เก็บแค่ SESSION_STORES ชุดล่าสุด
+_session_stores = OrderedDict()
+
+
+def session_store(names):
+    """store ของ session ที่เลือก (None = รวมทุก session) สร้างใหม่ถ้ายังไม่เคยเปิด"""
+    if names is None:
+        return _cache["store"]
+    with _cache_lock:
+        store = _session_stores.get(names)
+        if store is None:
+            store = _session_stores[names] = MeasurementStore()
+            while len(_session_stores) > SESSION_STORES:
+                _session_stores.popitem(last=False)
+        _session_stores.move_to_end(names)
+        return store
+
+
+def _sync_store(store, names=None):
+    """ดึงแถวใหม่จาก DB เข้า store (ถ้า session ที่เลือกเปลี่ยนตั้งแต่ครั้งก่อน)
+       session อื่นเปลี่ยนไม่ทำให้ store นี้ต้องโหลดใหม่
+    """
+    if isinstance(store, SharedStore):
+        _count("misses" if store.sync() else "hits")
+        return
+
+    state = _selection_state(*sample_db.state(), names)
+    if state[:2] == (store.db_generation, store.db_version):
+        _count("hits")
+        return
+
+    # single-flight: request ที่มาพร้อมกันรอโหลดรอบเดียวกัน
+    with store.sync_lock:
+        state, reset, cols, last_id = sample_db.read_columns_since(
+            names, store.db_generation, store.db_version, store.last_id, store.n)
+        if state[:2] == (store.db_generation, store.db_version):
+            _count("hits")
+            return
+
+        if reset:
+            # มีแถวถูกลบ (undo/clear) -> แทนที่ทั้งชุดทีเดียว ตัวอ่านไม่เห็นข้อมูลครึ่ง ๆ
+            store.replace_columns(*cols)
+        else:
+            store.extend_columns(*cols)
+        store.last_id = last_id
+        store.db_generation, store.db_version = state[:2]
+        store.source = (state[2],) + state[:2]
+        _count("misses")
+
+
+@metrics.timed("rf_read_measurements_duration_seconds")
+def read_measurements(force=False, session=None):
+    """คืน snapshot ของจุดวัด (StoreSnapshot แบบคอลัมน์) จาก DB ในเครื่อง
+       คาดว่าแต่ละอันเป็น {"lat":..,"lng":..,"time":..,"dbm":..}
+       ต้องการ list of dicts แบบเดิม -> snapshot.rows()
+
+       session = tuple ชื่อ session (ดู session_arg) หรือ None = รวมทุก session
+       ไม่อ่านการ์ดใน request (thread SDWatcher เป็นคน ingest ให้)
+       force=True -> อ่านทุกไฟล์ในการ์ดใหม่ทั้งไฟล์ก่อน (ใช้กับ /reload เท่านั้น)
+    """
+    if not force and has_request_context():
+        # conditional_data ตรึง snapshot ไว้แล้ว: body ต้องมาจากเวอร์ชันเดียวกับ ETag
+        pinned = g.get("snapshot")
+        if pinned is not None and pinned[0] == session:
+            return pinned[1]
+    sd_watcher.start()
+    if force:
+        sd_watcher.check(force=True)
+        _count("reloads")
+    store = session_store(session)
+    _sync_store(store, session)
+    return store.snapshot()
+
+
+def data_available(session=None):
+    """มีข้อมูลให้เสิร์ฟไหม: เคย ingest ลง DB แล้ว หรือการ์ดเสียบอยู่"""
+    return len(read_measurements(session=session)) > 0 or bool(sd_watcher.mounted)
+
+
+def session_arg():
+    """?session=a,b -> tuple ชื่อ session (ไม่ใส่ / all -> None = รวมทุก session)
+       ชื่อที่ไม่รู้จัก -> ValueError
+    """
+    text = request.args.get("session", "").strip()
+    if text in ("", "all"):
+        return None
+    names = tuple(sorted({s.strip() for s in text.split(",") if s.strip()}))
+    known = sample_db.state()[1]
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError("unknown session: " + ", ".join(unknown))
+    return names or None
+
+
+def measurement_columns(session=None):
+    """คืน (lat, lng, dbm, valid) ยาวเท่าจำนวนจุด index เดียวกับ read_measurements()"""
+    snap = read_measurements(session=session)
+    return snap.lat, snap.lng, snap.dbm, snap.valid
+
+
+def measurement_arrays(session=None):
+    """คืน (lat, lng, dbm) เป็น numpy float64 array สำหรับคำนวณแบบ vectorized
+       จุดที่ค่าไม่ครบ/ไม่ใช่ตัวเลขจะถูกตัดทิ้ง (สร้างครั้งเดียวต่อเวอร์ชันข้อมูล)
+    """
+    snap = read_measurements(session=session)
+    if snap.valid.all():
+        return snap.lat, snap.lng, snap.dbm
+    cached = snap.derived.get("arrays")
+    if cached is None or cached[0] != snap.version:
+        v = snap.valid
+        cached = (snap.version, snap.lat[v], snap.lng[v], snap.dbm[v])
+        snap.derived["arrays"] = cached
+    return cached[1:]
+
+
+def dbm_to_intensity(dbm):
+    """แปลง dBm -> intensity 0..1 สูตรเดียวกับ dbmToIntensity() ฝั่ง JS"""
+    x = (np.asarray(dbm, dtype=np.float64) - HEAT_DBM_MIN) / (HEAT_DBM_MAX - HEAT_DBM_MIN)
+    return 0.05 + np.clip(x, 0.0, 1.0) * 0.95
+
+
+def parse_bbox(text):
+    """แปลง "minLng,minLat,maxLng,maxLat" (แบบ map.getBounds().toBBoxString())
+       คืน None ถ้าไม่ได้ส่งมา, raise ValueError ถ้ารูปแบบผิด
+    """
+    if not text:
+        return None
+    parts = [float(v) for v in text.split(",")]
+    if len(parts) != 4 or not all(np.isfinite(parts)):
+        raise ValueError("bbox must be minLng,minLat,maxLng,maxLat")
+    min_lng, min_lat, max_lng, max_lat = parts
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError("bbox min must be <= max")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def _lnglat_to_pixel(lng, lat, world):
+    """lat/lng -> พิกัด pixel แบบ Web Mercator (เหมือน Leaflet) ที่ขนาดโลก world px"""
+    x = (lng + 180.0) / 360.0 * world
+    lat_rad = np.radians(np.clip(lat, -85.05112878, 85.05112878))
+    y = (1.0 - np.arcsinh(np.tan(lat_rad)) / np.pi) / 2.0 * world
+    return x, y
+
+
+def _pixel_to_lnglat(x, y, world):
+    lng = x / world * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * y / world))))
+    return lng, lat
+
+
+def grid_aggregate(lat, lng, dbm, zoom, cell_px):
+    """รวมจุดวัดลงช่อง grid ขนาด cell_px pixel ที่ zoom ที่กำหนด (vectorized ทั้งหมด)
+       คืน list ของช่อง: ตำแหน่งกลางช่อง, จำนวนจุด, dBm เฉลี่ย/สูงสุด, intensity
+       กรอง bbox/เวลามาก่อนแล้ว (select_points ใช้ spatial index ไม่ไล่ทุกจุด)
+    """
+    if lat.size == 0:
+        return []
+
+    world = 256.0 * (2 ** zoom)
+    x, y = _lnglat_to_pixel(lng, lat, world)
+    cx = np.floor(x / cell_px).astype(np.int64)
+    cy = np.floor(y / cell_px).astype(np.int64)
+    ncols = int(np.ceil(world / cell_px)) + 1
+    keys = cy * ncols + cx
+
+    # เรียงตาม key แล้วใช้ reduceat รวมค่าทีละช่อง
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    dbm = dbm[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, keys.size])
+    mean_dbm = np.add.reduceat(dbm, starts) / counts
+    max_dbm = np.maximum.reduceat(dbm, starts)
+
+    cell_keys = keys[starts]
+    c_lng, c_lat = _pixel_to_lnglat(
+        (cell_keys % ncols + 0.5) * cell_px,
+        (cell_keys // ncols + 0.5) * cell_px,
+        world,
+    )
+    intensity = dbm_to_intensity(mean_dbm)
+
+    return [
+        {
+            "lat": round(float(c_lat[i]), 6),
+            "lng": round(float(c_lng[i]), 6),
+            "count": int(counts[i]),
+            "mean_dbm": round(float(mean_dbm[i]), 1),
+            "max_dbm": round(float(max_dbm[i]), 1),
+            "intensity": round(float(intensity[i]), 3),
+        }
+        for i in range(cell_keys.size)
+    ]
+
+
+# ลำดับ index หลัง sort ต่อคอลัมน์ (argsort ครั้งเดียวต่อเวอร์ชันข้อมูล)
+TABLE_SORT_COLUMNS = ("idx", "lat", "lng", "dbm")
+TABLE_MAX_LIMIT = 1000
+
+
+def table_order(snap, sort, descending):
+    """คืน array ของ index เรียงตามคอลัมน์ sort (ค่า NaN อยู่ท้ายเสมอ)"""
+    if sort == "idx":
+        order = np.arange(snap.n)
+        return order[::-1] if descending else order
+
+    # ลำดับที่ sort แล้วเก็บไว้ต่อเวอร์ชันข้อมูล
+    orders = snap.derived.get("sort")
+    if orders is None or orders["version"] != snap.version:
+        orders = snap.derived["sort"] = {"version": snap.version}
+
+    cache_key = (sort, descending)
+    order = orders.get(cache_key)
+    if order is None:
+        col = getattr(snap, sort)
+        order = np.argsort(-col if descending else col, kind="stable")
+        orders[cache_key] = order
+    return order
+
+
+def table_page(snap, offset, limit, sort="idx", descending=False,
+               min_dbm=None, max_dbm=None, bbox=None, trange=None):
+    """ตัดข้อมูลตารางเป็นหน้า ๆ คืน (total หลังกรอง, list ของแถว)"""
+    order = table_order(snap, sort, descending)
+
+    if min_dbm is not None or max_dbm is not None or bbox is not None or trange is not None:
+        lat, lng, dbm = snap.lat, snap.lng, snap.dbm
+        if trange is not None:
+            # ช่วงเวลาหาจาก time index ก่อน ไม่ต้องเทียบเวลาทุกแถว
+            keep = np.zeros(snap.n, dtype=bool)
+            keep[select_points(snap, None, trange)] = True
+        else:
+            keep = np.ones(snap.n, dtype=bool)
+        if min_dbm is not None:
+            keep &= dbm >= min_dbm
+        if max_dbm is not None:
+            keep &= dbm <= max_dbm
+        if bbox is not None:
+            min_lng, min_lat, max_lng, max_lat = bbox
+            keep &= (lng >= min_lng) & (lng <= max_lng) & (lat >= min_lat) & (lat <= max_lat)
+        order = order[keep[order]]
+
+    return int(order.size), snap.rows(order[offset:offset + limit], with_index=True)
+
+
+def _optional_float(name):
+    v = request.args.get(name)
+    return float(v) if v not in (None, "") else None
+
+
+def cache_stats():
+    """ตัวเลข hit/miss ของแคช เอาไว้ดูว่าแคชทำงานจริงไหม"""
+    stats = _cache_counts()
+    stats.update({
+        "db_version": _cache["store"].db_version,
+        "session_stores": len(_session_stores),
+        "tiles": tile_cache.stats(),
+    })
+    return stats
+
+
+# ===============================
+# Spatial index
+# ===============================
+class SpatialIndex:
+    """uniform grid index บน lat/lng: ช่อง -> index ของจุดในช่องนั้น
+       สร้างครั้งเดียวต่อ generation ของ store แล้วเติมเฉพาะจุดที่ต่อท้ายเข้ามา
+       query bbox เปิดดูแค่ช่องที่ทับ bbox ไม่ต้องไล่ทุกจุด
+    """
+
+    # ต่อ chunk ใหม่เข้าช่องเรื่อย ๆ พอเกินนี้ค่อยรวมเป็น array เดียว
+    MAX_CHUNKS = 8
+
+    def __init__(self, cell_deg, generation):
+        self.cell_deg = cell_deg
+        self.generation = generation
+        self.n = 0
+        # key ช่อง -> list ของ numpy array (index จุด)
+        # แก้โดยสร้าง list ใหม่แทนที่ ตัวอ่านที่ถือ list เดิมอยู่จึงไม่พัง
+        self.cells = {}
+
+    def _rows_cols(self, lat, lng):
+        return spatial_cell(lat, lng, self.cell_deg)
+
+    def _key(self, row, col):
+        return spatial_key(row, col)
+
+    def add(self, snap):
+        """เติมจุด [self.n, snap.n) ของ snapshot เข้า index"""
+        start = self.n
+        if snap.n <= start:
+            return
+        idx = start + np.flatnonzero(snap.valid[start:])
+        row, col = self._rows_cols(snap.lat[idx], snap.lng[idx])
+        keys = self._key(row, col)
+
+        order = np.argsort(keys, kind="stable")
+        keys, idx = keys[order], idx[order]
+        bounds = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1], True])
+        for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            key = int(keys[a])
+            chunks = self.cells.get(key, []) + [idx[a:b]]
+            if len(chunks) > self.MAX_CHUNKS:
+                chunks = [np.concatenate(chunks)]
+            self.cells[key] = chunks
+        self.n = snap.n
+
+    def query(self, snap, bbox):
+        """คืน index (เรียงตามลำดับในไฟล์) ของจุดใน bbox ที่มีอยู่ใน snapshot"""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        (r0, r1), (c0, c1) = self._rows_cols([min_lat, max_lat], [min_lng, max_lng])
+        r0, r1, c0, c1 = int(r0), int(r1), int(c0), int(c1)
+
+        parts = []
+        n_cells = (r1 - r0 + 1) * (c1 - c0 + 1)
+        if n_cells <= len(self.cells):
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    parts.extend(self.cells.get(self._key(r, c), ()))
+        else:
+            # bbox ใหญ่กว่าพื้นที่ที่มีข้อมูล -> ไล่เฉพาะช่องที่มีจุดจริง
+            for key, chunks in list(self.cells.items()):
+                r, c = divmod(key, 10_000_000)
+                if r0 <= r <= r1 and c0 <= c <= c1:
+                    parts.extend(chunks)
+
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        idx = np.concatenate(parts)
+        idx = idx[idx < snap.n]
+        lat, lng = snap.lat[idx], snap.lng[idx]
+        inside = (lng >= min_lng) & (lng <= max_lng) & (lat >= min_lat) & (lat <= max_lat)
+        return np.sort(idx[inside])
+
+
+_spatial_lock = threading.Lock()
+
+
+def spatial_index(snap):
+    """คืน SpatialIndex ที่ครอบคลุม snapshot นี้ (สร้างใหม่/เติมเฉพาะส่วนที่ขาด)
+       แต่ละ store (ชุดรวม / แต่ละ session) มี index ของตัวเองใน derived
+    """
+    index = snap.derived.get("spatial")
+    if index is not None and index.generation == snap.generation and index.n >= snap.n:
+        return index
+    with _spatial_lock:
+        index = snap.derived.get("spatial")
+        if index is None or index.generation != snap.generation:
+            index = SpatialIndex(SPATIAL_CELL_DEG, snap.generation)
+        index.add(snap)
+        snap.derived["spatial"] = index
+    return index
+
+
+# ===============================
+# Time index
+# ===============================
+# เวลาใน firmware (getGPSTimeString) แปลงเป็น epoch ครั้งเดียวตอนเข้า store แล้ว (คอลัมน์ epoch)
+# ที่นี่เก็บลำดับของจุดเรียงตามเวลาไว้ ถามช่วง from..to ด้วย binary search ไม่ต้องไล่ทุกจุด
+# จุดที่ไม่มีเวลา (GPS ยังไม่ได้วันที่ -> "0000-00-00 00:00:00" หรือข้อความอื่น) ไม่อยู่ใน index:
+# กรองด้วยเวลาเมื่อไหร่จะไม่ถูกส่ง  ไม่กรองเวลาก็ส่งตามปกติ (time = ข้อความเดิม)
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)([smhd])")
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class TimeIndex:
+    """index ของจุดที่มีเวลา เรียงตาม epoch (เสมอกันเรียงตามลำดับในไฟล์)
+       จุดใหม่ที่เวลาไม่ย้อนหลัง (กรณีปกติ เดินวัดไปเรื่อย ๆ) แค่ต่อท้าย ไม่ต้อง sort ใหม่
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.n = 0
+        # (epoch เรียงแล้ว, index ของจุด) เปลี่ยนทั้งคู่พร้อมกันด้วยการ assign ครั้งเดียว
+        self.arrays = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    def add(self, snap):
+        if snap.n <= self.n:
+            return
+        new = np.arange(self.n, snap.n)
+        ep = snap.epoch[self.n:snap.n]
+        timed = ep != TIME_NONE
+        new, ep = new[timed], ep[timed]
+        order = np.argsort(ep, kind="stable")
+        new, ep = new[order], ep[order]
+
+        times, idx = self.arrays
+        if not len(times) or not len(ep) or ep[0] >= times[-1]:
+            self.arrays = (np.concatenate([times, ep]), np.concatenate([idx, new]))
+        else:
+            # มีจุดที่เวลาย้อนหลัง (รวมหลาย session / GPS กระโดด) -> แทรกตามตำแหน่ง
+            at = np.searchsorted(times, ep, side="right")
+            self.arrays = (np.insert(times, at, ep), np.insert(idx, at, new))
+        self.n = snap.n
+
+    def bounds(self):
+        """(เวลาแรก, เวลาล่าสุด) หรือ None ถ้ายังไม่มีจุดที่มีเวลา"""
+        times = self.arrays[0]
+        return (int(times[0]), int(times[-1])) if len(times) else None
+
+    def query(self, snap, t0, t1):
+        """index (เรียงตามลำดับในไฟล์) ของจุดที่ t0 <= epoch <= t1"""
+        times, idx = self.arrays
+        lo = np.searchsorted(times, t0, side="left")
+        hi = np.searchsorted(times, t1, side="right")
+        found = idx[lo:hi]
+        return np.sort(found[found < snap.n])
+
+
+_time_lock = threading.Lock()
+
+
+def time_index(snap):
+    """คืน TimeIndex ที่ครอบคลุม snapshot นี้ (เก็บใน derived เหมือน spatial_index)"""
+    index = snap.derived.get("time")
+    if index is not None and index.generation == snap.generation and index.n >= snap.n:
+        return index
+    with _time_lock:
+        index = snap.derived.get("time")
+        if index is None or index.generation != snap.generation:
+            index = TimeIndex(snap.generation)
+        index.add(snap)
+        snap.derived["time"] = index
+    return index
+
+
+def parse_time_value(text):
+    """เวลาใน query: epoch วินาที หรือ "YYYY-MM-DD HH:MM:SS" / "YYYY-MM-DDTHH:MM:SS[Z]" (UTC)"""
+    text = text.strip()
+    try:
+        return int(float(text))
+    except ValueError:
+        pass
+    text = text.replace("T", " ").rstrip("Z")
+    if not _TIME_RE.fullmatch(text):
+        raise ValueError("time must be epoch seconds or YYYY-MM-DD HH:MM:SS (UTC)")
+    return int(np.datetime64(text.replace(" ", "T"), "s").astype(np.int64))
+
+
+def parse_duration(text, name="last"):
+    """"30s", "15m", "2h", "1d" -> วินาที (float)"""
+    m = _DURATION_RE.fullmatch(text.strip())
+    if not m:
+        raise ValueError(name + " must look like 30s, 15m, 2h or 1d")
+    return float(m.group(1)) * _DURATION_UNITS[m.group(2)]
+
+
+def time_range_arg():
+    """?from=&to= (epoch หรือวันเวลา UTC) และ/หรือ ?last=15m (s/m/h/d)
+       คืน (from, to, last วินาที) ส่วนที่ไม่ได้ใส่เป็น None  ไม่ใส่อะไรเลย -> None
+    """
+    args = request.args
+    t0 = parse_time_value(args["from"]) if args.get("from") else None
+    t1 = parse_time_value(args["to"]) if args.get("to") else None
+    last = None
+    if args.get("last"):
+        last = parse_duration(args["last"])
+        if t0 is not None:
+            raise ValueError("use either from or last, not both")
+    if t0 is not None and t1 is not None and t0 > t1:
+        raise ValueError("from must be <= to")
+    if t0 is None and t1 is None and last is None:
+        return None
+    return t0, t1, last
+
+
+def resolve_time_range(snap, trange):
+    """(from, to, last) -> (t0, t1) epoch ของ snapshot นี้
+       last นับย้อนจาก to หรือจากจุดล่าสุดในข้อมูล (ไม่ใช่เวลาเครื่อง server:
+       เปิดดูข้อมูลเก่าบนการ์ดทีหลังก็ยังได้ "15 นาทีสุดท้ายของการเดินวัด")
+       last เป็นช่วงเปิดซ้าย (t1 - last, t1]: last=1m ที่ 1 Hz ได้ 60 จุด ไม่ใช่ 61
+    """
+    t0, t1, last = trange
+    if last is not None:
+        if t1 is None:
+            bounds = time_index(snap).bounds()
+            t1 = bounds[1] if bounds else 0
+        # epoch เป็นวินาทีเต็ม: ep > t1 - last  <=>  ep >= t1 - ceil(last) + 1
+        t0 = t1 - int(np.ceil(last)) + 1
+    # ไม่มีขอบล่าง: ยังต้องตัดจุดที่ไม่มีเวลา (TIME_NONE) ออก
+    return (TIME_NONE + 1 if t0 is None else t0,
+            np.iinfo(np.int64).max if t1 is None else t1)
+
+
+def select_points(snap, bbox=None, trange=None):
+    """index (เรียงตามลำดับในไฟล์) ของจุดใน bbox และช่วงเวลา trange (ผลของ time_range_arg)
+       ไม่กรองอะไรเลย -> None (= ทุกจุด)
+    """
+    if trange is not None:
+        t0, t1 = resolve_time_range(snap, trange)
+    if bbox is not None:
+        idx = spatial_index(snap).query(snap, bbox)
+        if trange is not None:
+            ep = snap.epoch[idx]
+            idx = idx[(ep >= t0) & (ep <= t1)]
+        return idx
+    if trange is not None:
+        return time_index(snap).query(snap, t0, t1)
+    return None
+
+
+# ===============================
+# Clusters (level of detail)
+# ===============================
+# แทนที่จะวาด marker ทุกจุด ส่งจุดตัวแทนต่อ zoom: จุดในช่อง CLUSTER_RADIUS_PX x CLUSTER_RADIUS_PX pixel
+# เดียวกันรวมเป็น cluster (จำนวนจุด, dBm ต่ำสุด/สูงสุด/เฉลี่ย, ตำแหน่ง = จุดศูนย์ถ่วงของจุดจริง)
+# ช่องของ zoom z = ช่องของ zoom ที่ละเอียดที่สุด shift ขวา (CLUSTER_MAX_ZOOM - z) bit
+# -> เป็น quadtree: 1 ช่องของ z = 4 ช่องของ z+1 ชั้นหยาบรวมจากชั้นละเอียดได้เลยไม่ต้องแตะจุดดิบ
+# marker ต่อ viewport จึงไม่เกิน (กว้าง/R) x (สูง/R) ไม่ว่าข้อมูลจะมีกี่จุด
+
+_CLUSTER_FIELDS = ("key", "count", "sx", "sy", "sum", "min", "max")
+_CLUSTER_COL_MASK = (1 << 32) - 1
+
+
+def _cluster_scale(level):
+    """จำนวนช่องต่อความกว้างโลก (พิกัด mercator 0..1) ที่ชั้น level"""
+    return 256.0 * (2 ** level) / CLUSTER_RADIUS_PX
+
+
+def _reduce_cells(cells):
+    """รวมแถวที่ key ซ้ำกัน คืน dict คอลัมน์เรียงตาม key (key ไม่ซ้ำ)"""
+    if not cells["key"].size:
+        return cells
+    order = np.argsort(cells["key"], kind="stable")
+    key = cells["key"][order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    out = {"key": key[starts]}
+    for name in ("count", "sx", "sy", "sum"):
+        out[name] = np.add.reduceat(cells[name][order], starts)
+    out["min"] = np.minimum.reduceat(cells["min"][order], starts)
+    out["max"] = np.maximum.reduceat(cells["max"][order], starts)
+    return out
+
+
+def _point_cells(lat, lng, dbm, level):
+    """จุดดิบ -> cluster ของชั้น level"""
+    x, y = _lnglat_to_pixel(lng, lat, 1.0)
+    scale = _cluster_scale(level)
+    col = np.clip(np.floor(x * scale), 0, scale - 1).astype(np.int64)
+    row = np.clip(np.floor(y * scale), 0, scale - 1).astype(np.int64)
+    return _reduce_cells({"key": (row << 32) | col, "count": np.ones(lat.size, dtype=np.int64),
+                          "sx": x, "sy": y, "sum": dbm, "min": dbm, "max": dbm})
+
+
+def _parent_cells(cells):
+    """cluster ของชั้น z -> ของชั้น z-1 (รวมทีละ 2x2 ช่อง)"""
+    key = cells["key"]
+    parent = dict(cells, key=((key >> 33) << 32) | ((key & _CLUSTER_COL_MASK) >> 1))
+    return _reduce_cells(parent)
+
+
+def _merge_cells(old, new):
+    """รวม cluster ใหม่เข้าชั้นเดิม (ทั้งคู่เรียงตาม key) คืนชุดใหม่ ชุดเดิมไม่ถูกแก้ (ตัวอ่านใช้ต่อได้)"""
+    if not old["key"].size:
+        return new
+    if not new["key"].size:
+        return old
+    pos = np.searchsorted(old["key"], new["key"])
+    hit = pos < old["key"].size
+    hit[hit] = old["key"][pos[hit]] == new["key"][hit]
+    out = {name: col.copy() for name, col in old.items()}
+    at = pos[hit]
+    for name in ("count", "sx", "sy", "sum"):
+        out[name][at] += new[name][hit]
+    out["min"][at] = np.minimum(out["min"][at], new["min"][hit])
+    out["max"][at] = np.maximum(out["max"][at], new["max"][hit])
+    miss = ~hit
+    if miss.any():
+        out = {name: np.insert(out[name], pos[miss], new[name][miss]) for name in _CLUSTER_FIELDS}
+    return out
+
+
+class ClusterIndex:
+    """cluster ทุกชั้น 0..CLUSTER_MAX_ZOOM ของ snapshot หนึ่ง (levels[z] = dict คอลัมน์เรียงตาม key)
+       ต่อท้ายจุดใหม่ = ทำ cluster ของจุดใหม่แล้ว merge เข้าทีละชั้น ไม่สร้างใหม่ทั้งหมด
+       reset (undo/clear) -> generation เปลี่ยน สร้างใหม่
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.n = 0
+        empty = np.empty(0)
+        self.levels = [_point_cells(empty, empty, empty, CLUSTER_MAX_ZOOM)] * (CLUSTER_MAX_ZOOM + 1)
+
+    def add(self, snap):
+        if snap.n <= self.n:
+            return
+        part = slice(self.n, snap.n)
+        valid = snap.valid[part]
+        new = _point_cells(snap.lat[part][valid], snap.lng[part][valid],
+                           snap.dbm[part][valid], CLUSTER_MAX_ZOOM)
+        levels = list(self.levels)
+        for level in range(CLUSTER_MAX_ZOOM, -1, -1):
+            levels[level] = _merge_cells(levels[level], new)
+            if level:
+                new = _parent_cells(new)
+        # เปลี่ยนทั้ง list ทีเดียว ตัวอ่านที่ถือ list เก่าไว้ไม่เห็นข้อมูลครึ่ง ๆ
+        self.levels = levels
+        self.n = snap.n
+
+
+_cluster_lock = threading.Lock()
+
+
+def cluster_index(snap):
+    """คืน ClusterIndex ที่ครอบคลุม snapshot นี้ (เก็บใน derived เหมือน spatial_index)"""
+    index = snap.derived.get("clusters")
+    if index is not None and index.generation == snap.generation and index.n >= snap.n:
+        return index
+    with _cluster_lock:
+        index = snap.derived.get("clusters")
+        if index is None or index.generation != snap.generation:
+            index = ClusterIndex(snap.generation)
+        index.add(snap)
+        snap.derived["clusters"] = index
+    return index
+
+
+def _cluster_window(bbox, level):
+    """ช่วงแถว/คอลัมน์ของช่องที่ชั้น level ที่ bbox ครอบ"""
+    scale = _cluster_scale(level)
+    min_lng, min_lat, max_lng, max_lat = bbox
+    x0, y1 = _lnglat_to_pixel(max(min_lng, -180.0), min_lat, 1.0)
+    x1, y0 = _lnglat_to_pixel(min(max_lng, 180.0), max_lat, 1.0)
+    last = int(scale) - 1
+    clip = lambda v: min(max(int(np.floor(v * scale)), 0), last)
+    return clip(y0), clip(y1), clip(x0), clip(x1)
+
+
+def _cells_extent(cells):
+    """window (row0, row1, col0, col1) ที่ครอบทุกช่องของชั้นนี้ ไม่มีช่องเลย -> None"""
+    keys = cells["key"]
+    if not keys.size:
+        return None
+    cols = keys & _CLUSTER_COL_MASK
+    return int(keys[0] >> 32), int(keys[-1] >> 32), int(cols.min()), int(cols.max())
+
+
+def _window_cells(window):
+    row0, row1, col0, col1 = window
+    return (row1 - row0 + 1) * (col1 - col0 + 1)
+
+
+def _cells_in_window(cells, window):
+    """index ของช่องใน window (row0, row1, col0, col1) ด้วย searchsorted ทีละแถว"""
+    row0, row1, col0, col1 = window
+    rows = np.arange(row0, row1 + 1, dtype=np.int64) << 32
+    lo = np.searchsorted(cells["key"], rows | col0, "left")
+    hi = np.searchsorted(cells["key"], rows | col1, "right")
+    counts = hi - lo
+    if not counts.sum():
+        return np.empty(0, dtype=np.int64)
+    # ต่อช่วง lo[i]..hi[i] ของทุกแถวเป็น index เดียวโดยไม่วน Python
+    starts = np.repeat(lo - np.r_[0, np.cumsum(counts)[:-1]], counts)
+    return starts + np.arange(counts.sum())
+
+
+def cluster_query(snap, zoom, bbox=None, trange=None):
+    """cluster ที่ zoom ใน bbox คืน (ชั้นที่ใช้จริง, dict คอลัมน์ของ cluster ที่เลือก)
+       ใช้ชั้นหยาบขึ้นทีละชั้นจนจำนวน cluster ไม่เกิน CLUSTER_MAX_ITEMS
+       กรองเวลา (trange) -> รวมเฉพาะจุดในช่วงเวลาที่ชั้นนั้นตรง ๆ (ลำดับชั้นสร้างไว้สำหรับทุกจุดเท่านั้น)
+    """
+    levels = cluster_index(snap).levels
+
+    def window(lv):
+        if bbox is not None:
+            return _cluster_window(bbox, lv)
+        # ไม่มี bbox = เท่าที่มีข้อมูล (ไม่ใช่ทั้งโลก ไม่งั้น zoom เท่าไหร่ก็ตกไปชั้นหยาบสุด)
+        return _cells_extent(levels[lv])
+
+    # เริ่มจากชั้นที่ window มีช่องได้ไม่เกิน CLUSTER_MAX_ITEMS (= marker ต่อจอมีเพดาน)
+    level = min(max(zoom, 0), CLUSTER_MAX_ZOOM)
+    while level > 0:
+        w = window(level)
+        if w is None or _window_cells(w) <= CLUSTER_MAX_ITEMS:
+            break
+        level -= 1
+
+    if trange is None:
+        pick = lambda lv: levels[lv]
+    else:
+        idx = select_points(snap, bbox, trange)
+        idx = idx[snap.valid[idx]]
+        lat, lng, dbm = snap.lat[idx], snap.lng[idx], snap.dbm[idx]
+        pick = lambda lv: _point_cells(lat, lng, dbm, lv)
+
+    while True:
+        cells = pick(level)
+        w = window(level)
+        found = np.empty(0, dtype=np.int64) if w is None else _cells_in_window(cells, w)
+        if found.size <= CLUSTER_MAX_ITEMS or level == 0:
+            return level, {name: col[found] for name, col in cells.items()}
+        level -= 1
+
+
+def cluster_items(cells):
+    """คอลัมน์ cluster -> list ของ dict สำหรับ JSON (count=1 คือจุดวัดจริงจุดเดียว)"""
+    count = cells["count"]
+    lng, lat = _pixel_to_lnglat(cells["sx"] / count, cells["sy"] / count, 1.0)
+    mean = cells["sum"] / count
+    intensity = dbm_to_intensity(mean)
+    return [
+        {
+            "lat": round(float(lat[i]), 6),
+            "lng": round(float(lng[i]), 6),
+            "count": int(count[i]),
+            "mean_dbm": round(float(mean[i]), 1),
+            "min_dbm": round(float(cells["min"][i]), 1),
+            "max_dbm": round(float(cells["max"][i]), 1),
+            "intensity": round(float(intensity[i]), 3),
+        }
+        for i in range(count.size)
+    ]
+
+
+# ===============================
+# RF statistics (/stats)
+# ===============================
+# accumulator ต่อกลุ่ม: n, mean, m2 (Welford) + min/max + histogram ของ dBm (sketch ที่ merge กันได้ตรง ๆ)
+# รวม 2 กลุ่ม (ต่อท้าย / รวมหลายช่องเป็นช่องใหญ่) ใช้สูตรของ Chan ซึ่งเป็น Welford แบบทีละชุด
+# มี 2 ตาราง: "cell" = ต่อช่องตลอดทุกเวลา (ตอบรวม/ต่อช่องได้ทันที), "time" = ต่อ (ช่อง, STATS_BUCKET_S)
+# key ของกลุ่ม = (bucket << 32) | (cell id << _STATS_BIN_BITS) -> bit ล่างว่างไว้ใส่เลขช่อง histogram
+# bucket 0 = ไม่มีเวลา (GPS ยังไม่มีวันที่) หรือทั้งตาราง "cell"
+# จุดต่อท้าย = รวมเฉพาะจุดใหม่เข้าไป, undo/clear = ลบเฉพาะแถวที่หายไปออก (ถ้าหายไปเกินครึ่งค่อยสร้างใหม่)
+
+_STATS_BIN_BITS = 10
+_STATS_BINS = int(round((STATS_DBM_RANGE[1] - STATS_DBM_RANGE[0]) / STATS_BIN_DB))
+_STATS_FIELDS = ("key", "n", "mean", "m2", "min", "max")
+# รวม histogram ตอนตอบแบบ array เต็ม (กลุ่ม x ช่อง dBm) เมื่อไม่เกินนี้ ไม่งั้น sort แบบ sparse
+_STATS_DENSE_MAX = 1 << 21
+
+
+def _stats_empty():
+    return ({name: np.empty(0, dtype=np.int64 if name in ("key", "n") else np.float64)
+             for name in _STATS_FIELDS},
+            {"key": np.empty(0, dtype=np.int64), "count": np.empty(0, dtype=np.int64)})
+
+
+def _stats_bins(dbm):
+    bins = np.floor((dbm - STATS_DBM_RANGE[0]) / STATS_BIN_DB)
+    return np.clip(bins, 0, _STATS_BINS - 1).astype(np.int64)
+
+
+def _stats_reduce(keys, order=None):
+    """เรียง key แล้วคืน (ลำดับ, key ที่ไม่ซ้ำ, ตำแหน่งเริ่มของแต่ละ key ในลำดับนั้น)"""
+    if order is None:
+        order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if keys.size else keys[:0]
+    return order, keys[starts], starts
+
+
+def _stats_from_values(keys, dbm):
+    """ค่าดิบ -> (accumulator ต่อ key, sketch)  ในชุดใช้สองรอบ: หาค่าเฉลี่ยก่อนแล้วค่อยผลรวมกำลังสอง"""
+    if not keys.size:
+        return _stats_empty()
+    order, ukeys, starts = _stats_reduce(keys)
+    x = dbm[order]
+    n = np.diff(np.r_[starts, x.size])
+    mean = np.add.reduceat(x, starts) / n
+    groups = {
+        "key": ukeys,
+        "n": n,
+        "mean": mean,
+        "m2": np.add.reduceat((x - np.repeat(mean, n)) ** 2, starts),
+        "min": np.minimum.reduceat(x, starts),
+        "max": np.maximum.reduceat(x, starts),
+    }
+    skeys, counts = np.unique(keys | _stats_bins(dbm), return_counts=True)
+    return groups, {"key": skeys, "count": counts}
+
+
+def _stats_combine(groups, keys):
+    """รวมหลายกลุ่มที่ได้ key ใหม่เดียวกันเป็นกลุ่มเดียว (Chan: n, mean, m2 รวมกันได้แม่นยำ)
+       n ติดลบได้ (= ลบกลุ่มนั้นออก) กลุ่มที่ n เหลือ 0 ถูกตัดทิ้ง  min/max ของการลบต้องคำนวณใหม่เอง
+    """
+    if not keys.size:
+        return _stats_empty()[0]
+    order, ukeys, starts = _stats_reduce(keys)
+    n_i = groups["n"][order]
+    mean_i = groups["mean"][order]
+    n = np.add.reduceat(n_i, starts)
+    keep = n > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.add.reduceat(n_i * mean_i, starts) / n
+    spread = n_i * (mean_i - np.repeat(mean, np.diff(np.r_[starts, n_i.size]))) ** 2
+    m2 = np.add.reduceat(groups["m2"][order], starts) + np.add.reduceat(spread, starts)
+    out = {
+        "key": ukeys,
+        "n": n,
+        "mean": mean,
+        "m2": np.maximum(m2, 0.0),   # เศษจากการลบ (ทศนิยม) ไม่ให้ variance ติดลบ
+        "min": np.minimum.reduceat(groups["min"][order], starts),
+        "max": np.maximum.reduceat(groups["max"][order], starts),
+    }
+    return {name: col[keep] for name, col in out.items()}
+
+
+def _sketch_combine(sketch, keys):
+    if not keys.size:
+        return _stats_empty()[1]
+    order, ukeys, starts = _stats_reduce(keys)
+    counts = np.add.reduceat(sketch["count"][order], starts)
+    keep = counts > 0
+    return {"key": ukeys[keep], "count": counts[keep]}
+
+
+def _stats_merge(table, new, combine):
+    """รวมกลุ่มใหม่ (key เรียง ไม่ซ้ำ) เข้าตารางเดิมโดยไม่เรียงตารางใหม่ทั้งตาราง
+       key ที่มีอยู่แล้วรวมด้วย combine (_stats_combine / _sketch_combine) key ใหม่แทรกตามลำดับ
+       คืนตารางใหม่ ตารางเดิมไม่ถูกแก้ (ตัวอ่านใช้ต่อได้)
+    """
+    pos = np.searchsorted(table["key"], new["key"])
+    hit = pos < table["key"].size
+    hit[hit] = table["key"][pos[hit]] == new["key"][hit]
+    at = pos[hit]
+    both = {name: np.concatenate([table[name][at], new[name][hit]]) for name in table}
+    both = combine(both, both["key"])
+    out = {name: col.copy() for name, col in table.items()}
+    alive = np.isin(table["key"][at], both["key"], assume_unique=True)
+    for name in out:
+        out[name][at[alive]] = both[name]
+    if not alive.all():
+        # กลุ่มที่ลบจนเหลือ 0
+        keep = np.ones(out["key"].size, dtype=bool)
+        keep[at[~alive]] = False
+        out = {name: col[keep] for name, col in out.items()}
+    miss = ~hit
+    if miss.any():
+        where = np.searchsorted(out["key"], new["key"][miss])
+        out = {name: np.insert(out[name], where, new[name][miss]) for name in out}
+    return out
+
+
+def _stats_negate(groups, sketch):
+    """ชุดที่จะลบออก: n, m2, count ติดลบ (ค่าเฉลี่ยเดิม)"""
+    groups = dict(groups, n=-groups["n"], m2=-groups["m2"])
+    return groups, dict(sketch, count=-sketch["count"])
+
+
+def _stats_percentiles(groups, sketch, percentiles):
+    """percentile ต่อกลุ่มจาก histogram (สอดค่าเชิงเส้นภายในช่อง แล้วบีบให้อยู่ใน min..max จริง)
+       คืน array รูป (จำนวนกลุ่ม, จำนวน percentile)
+    """
+    out = np.empty((groups["key"].size, len(percentiles)))
+    if not groups["key"].size:
+        return out
+    mask = ~np.int64((1 << _STATS_BIN_BITS) - 1)
+    cum = np.cumsum(sketch["count"])
+    # sketch เรียงตาม key ของกลุ่มแล้วตามด้วยช่อง -> กลุ่ม g ครอบ sketch[first[g]:...]
+    first = np.searchsorted(sketch["key"] & mask, groups["key"], "left")
+    before = np.where(first > 0, cum[first - 1], 0)
+    for j, p in enumerate(percentiles):
+        target = before + np.maximum(groups["n"] * (p / 100.0), 1e-9)
+        at = np.minimum(np.searchsorted(cum, target, "left"), cum.size - 1)
+        count = sketch["count"][at]
+        inside = (target - (cum[at] - count)) / count
+        bins = sketch["key"][at] & ((1 << _STATS_BIN_BITS) - 1)
+        value = STATS_DBM_RANGE[0] + (bins + inside) * STATS_BIN_DB
+        out[:, j] = np.clip(value, groups["min"], groups["max"])
+    return out
+
+
+class StatsIndex:
+    """สถิติ dBm ของ store หนึ่ง (เก็บใน derived) ตามทันข้อมูลด้วย sync(snap)
+       ตาราง "cell"/"time" = (accumulator ต่อกลุ่ม, sketch) เปลี่ยนทีละชุดแล้วสลับทีเดียว
+    """
+
+    def __init__(self):
+        self.generation = None
+        self.n = 0
+        self.columns = None         # คอลัมน์ของ snapshot ล่าสุด ใช้หาว่า undo/clear ลบแถวไหนไป
+        self.cell_keys = np.empty(0, dtype=np.int64)   # spatial key เรียงจากน้อยไปมาก
+        self.cell_ids = np.empty(0, dtype=np.int64)    # id ของช่องตามลำดับ cell_keys
+        self.cell_by_id = np.empty(0, dtype=np.int64)  # id -> spatial key
+        self.tables = {"cell": _stats_empty(), "time": _stats_empty()}
+
+    def _ids(self, spatial):
+        """spatial key -> id ของช่อง (ช่องใหม่ได้ id ถัดไป id เดิมไม่เปลี่ยนตลอดอายุ index)"""
+        uniq = np.unique(spatial)
+        pos = np.searchsorted(self.cell_keys, uniq)
+        known = pos < self.cell_keys.size
+        known[known] = self.cell_keys[pos[known]] == uniq[known]
+        fresh = uniq[~known]
+        if fresh.size:
+            if self.cell_by_id.size + fresh.size > 1 << (32 - _STATS_BIN_BITS):
+                raise ValueError("too many stats cells, increase SPATIAL_CELL_DEG")
+            ids = np.arange(self.cell_by_id.size, self.cell_by_id.size + fresh.size)
+            keys = np.concatenate([self.cell_keys, fresh])
+            order = np.argsort(keys, kind="stable")
+            self.cell_keys = keys[order]
+            self.cell_ids = np.concatenate([self.cell_ids, ids])[order]
+            self.cell_by_id = np.concatenate([self.cell_by_id, fresh])
+        return self.cell_ids[np.searchsorted(self.cell_keys, spatial)]
+
+    def _row_keys(self, columns, part):
+        """key ของแถว part ในตาราง cell และ time + dBm (เฉพาะแถวที่ค่าครบ)"""
+        lat, lng, dbm, epoch, valid = (col[part] for col in columns)
+        lat, lng, dbm, epoch = lat[valid], lng[valid], dbm[valid], epoch[valid]
+        cell = self._ids(spatial_key(*spatial_cell(lat, lng))) << _STATS_BIN_BITS
+        bucket = np.where(epoch >= 0, epoch // STATS_BUCKET_S + 1, 0)
+        bucket = np.minimum(bucket, (1 << 31) - 1)
+        return cell, (bucket << 32) | cell, dbm
+
+    def _fold(self, columns, part, sign):
+        """รวม (sign=1) หรือลบ (sign=-1) แถว part ออกจากทั้งสองตาราง คืน key ที่ min/max อาจผิด"""
+        cell_keys, time_keys, dbm = self._row_keys(columns, part)
+        dirty = {}
+        for name, keys in (("cell", cell_keys), ("time", time_keys)):
+            groups, sketch = _stats_from_values(keys, dbm)
+            if sign < 0:
+                old = self.tables[name][0]
+                pos = np.searchsorted(old["key"], groups["key"])
+                # ค่าที่ลบออกเป็นค่าต่ำสุด/สูงสุดของกลุ่ม -> ต้องหาใหม่จากแถวที่เหลือ
+                dirty[name] = groups["key"][(groups["min"] <= old["min"][pos]) |
+                                            (groups["max"] >= old["max"][pos])]
+                groups, sketch = _stats_negate(groups, sketch)
+            table_groups, table_sketch = self.tables[name]
+            self.tables[name] = (_stats_merge(table_groups, groups, _stats_combine),
+                                 _stats_merge(table_sketch, sketch, _sketch_combine))
+        return dirty
+
+    def _fix_extremes(self, columns, n, dirty):
+        """หา min/max ใหม่ของกลุ่มที่ลบค่าสุดขั้วออกไป จากแถวที่เหลือ (เฉพาะกลุ่มนั้น)"""
+        if not any(keys.size for keys in dirty.values()):
+            return
+        cell_keys, time_keys, dbm = self._row_keys(columns, slice(0, n))
+        for name, keys in (("cell", cell_keys), ("time", time_keys)):
+            groups, sketch = self.tables[name]
+            wanted = np.intersect1d(dirty[name], groups["key"])
+            if not wanted.size:
+                continue
+            pos = np.searchsorted(wanted, keys)
+            hit = pos < wanted.size
+            hit[hit] = wanted[pos[hit]] == keys[hit]
+            fresh = _stats_from_values(keys[hit], dbm[hit])[0]
+            groups = dict(groups, min=groups["min"].copy(), max=groups["max"].copy())
+            at = np.searchsorted(groups["key"], fresh["key"])
+            groups["min"][at] = fresh["min"]
+            groups["max"][at] = fresh["max"]
+            self.tables[name] = (groups, sketch)
+
+    def sync(self, snap):
+        columns = (snap.lat, snap.lng, snap.dbm, snap.epoch, snap.valid)
+        if self.generation is not None and snap.generation != self.generation:
+            # undo/clear: แถวที่เหมือนเดิมตั้งแต่ต้นไม่ต้องแตะ ลบเฉพาะแถวหลังจุดที่ต่างกันออก
+            old = self.columns
+            m = min(self.n, snap.n)
+            differs = np.zeros(m, dtype=bool)
+            for a, b in zip(old[:4], columns[:4]):
+                # เทียบเป็น bit (NaN ตรงกับ NaN)
+                differs |= a[:m].view(np.int64) != b[:m].view(np.int64)
+            same = int(np.argmax(differs)) if differs.any() else m
+            if (self.n - same) * 2 > self.n:
+                # หายไปเกินครึ่ง (เช่น clear) สร้างใหม่ทั้งหมดถูกกว่า
+                self.tables = {"cell": _stats_empty(), "time": _stats_empty()}
+                same = 0
+            else:
+                dirty = self._fold(old, slice(same, self.n), -1)
+                self._fix_extremes(columns, same, dirty)
+            self.n = same
+        if snap.n > self.n:
+            self._fold(columns, slice(self.n, snap.n), 1)
+        self.columns = columns
+        self.n = snap.n
+        self.generation = snap.generation
+
+    def cell_centers(self, keys):
+        """key ของกลุ่ม -> (lat, lng) กลางช่อง"""
+        spatial = self.cell_by_id[(keys & ((1 << 32) - 1)) >> _STATS_BIN_BITS]
+        row, col = spatial // 10_000_000, spatial % 10_000_000
+        return ((row + 0.5) * SPATIAL_CELL_DEG - 90.0, (col + 0.5) * SPATIAL_CELL_DEG - 180.0)
+
+
+_stats_lock = threading.Lock()
+
+
+def stats_index(snap):
+    """คืน StatsIndex ที่ตามทัน snapshot นี้แล้ว (ต่อท้าย = รวมเฉพาะแถวใหม่)"""
+    index = snap.derived.get("stats")
+    if index is not None and index.generation == snap.generation and index.n >= snap.n:
+        return index
+    with _stats_lock:
+        index = snap.derived.get("stats")
+        if index is None:
+            index = StatsIndex()
+        if index.generation != snap.generation or index.n < snap.n:
+            index.sync(snap)
+        snap.derived["stats"] = index
+    return index
+
+
+def rf_stats(snap, by=(), bucket=None, bbox=None, trange=None, percentiles=STATS_PERCENTILES):
+    """สถิติ dBm รวม + ต่อกลุ่ม  by = ("cell",) / ("time",) / ("cell", "time")
+       bucket = ความยาวช่วงเวลา (วินาที ต้องเป็นพหุคูณของ STATS_BUCKET_S) สำหรับ by time
+       bbox กรองทีละช่อง (ช่องที่จุดกลางอยู่ใน bbox), trange กรองทีละ STATS_BUCKET_S
+       คืน (ผลรวม, list ของกลุ่ม)  แต่ละอันเป็น dict ของ n/mean/std/min/max/pXX
+    """
+    index = stats_index(snap)
+    timed = "time" in by or trange is not None
+    groups, sketch = index.tables["time" if timed else "cell"]
+
+    if timed:
+        # ตาราง time เรียงตาม bucket ก่อน -> ช่วงเวลา = ช่วงต่อกันของ key ตัดด้วย searchsorted
+        lo, hi = 1 << 32, np.iinfo(np.int64).max   # bucket 0 (ไม่มีเวลา) จัดเข้าช่วงไหนไม่ได้
+        if trange is not None:
+            t0, t1 = resolve_time_range(snap, trange)
+            lo = (max(t0, 0) // STATS_BUCKET_S + 1) << 32
+            hi = (min(t1 // STATS_BUCKET_S + 1, (1 << 31) - 2) + 1) << 32
+        a, b = np.searchsorted(groups["key"], [lo, hi])
+        groups = {name: col[a:b] for name, col in groups.items()}
+        a, b = np.searchsorted(sketch["key"], [lo, hi])
+        sketch = {name: col[a:b] for name, col in sketch.items()}
+    if bbox is not None:
+        lat, lng = index.cell_centers(groups["key"])
+        keep = (lng >= bbox[0]) & (lng <= bbox[2]) & (lat >= bbox[1]) & (lat <= bbox[3])
+        groups = {name: col[keep] for name, col in groups.items()}
+        sketch_group = sketch["key"] & ~np.int64((1 << _STATS_BIN_BITS) - 1)
+        if groups["key"].size:
+            pos = np.minimum(np.searchsorted(groups["key"], sketch_group), groups["key"].size - 1)
+            hit = groups["key"][pos] == sketch_group
+        else:
+            hit = np.zeros(sketch_group.size, dtype=bool)
+        sketch = {name: col[hit] for name, col in sketch.items()}
+
+    def regroup(key_of):
+        merged = _stats_combine(groups, key_of(groups["key"]))
+        bins = sketch["key"] & ((1 << _STATS_BIN_BITS) - 1)
+        size = merged["key"].size * _STATS_BINS
+        if size > _STATS_DENSE_MAX:
+            return merged, _sketch_combine(sketch, key_of(sketch["key"] - bins) | bins)
+        # กลุ่มไม่มาก: รวม histogram ด้วย bincount ลง array เต็ม ไม่ต้อง sort sketch ทั้งชุด
+        at = np.searchsorted(merged["key"], key_of(sketch["key"] - bins))
+        hist = np.bincount(at * _STATS_BINS + bins, weights=sketch["count"], minlength=size)
+        nz = np.flatnonzero(hist)
+        return merged, {"key": merged["key"][nz // _STATS_BINS] | (nz % _STATS_BINS),
+                        "count": hist[nz].astype(np.int64)}
+
+    def report(merged, sk):
+        pct = _stats_percentiles(merged, sk, percentiles)
+        n = merged["n"]
+        std = np.sqrt(merged["m2"] / np.maximum(n - 1, 1))
+        rows = []
+        for i in range(n.size):
+            row = {
+                "n": int(n[i]),
+                "mean": round(float(merged["mean"][i]), 2),
+                "std": round(float(std[i]), 2),
+                "min": round(float(merged["min"][i]), 1),
+                "max": round(float(merged["max"][i]), 1),
+            }
+            for j, p in enumerate(percentiles):
+                row["p%g" % p] = round(float(pct[i, j]), 1)
+            rows.append(row)
+        return rows
+
+    total = report(*regroup(lambda k: np.zeros_like(k)))
+    overall = total[0] if total else {"n": 0}
+    if not by:
+        return overall, []
+
+    step = (bucket or STATS_BUCKET_S) // STATS_BUCKET_S
+    cell_mask = np.int64((1 << 32) - 1) if "cell" in by else np.int64(0)
+
+    def key_of(k):
+        out = k & cell_mask
+        if "time" in by:
+            out |= (((k >> 32) - 1) // step) << 32
+        return out
+
+    merged, sk = regroup(key_of)
+    rows = report(merged, sk)
+    if "cell" in by:
+        lat, lng = index.cell_centers(merged["key"])
+    for i, row in enumerate(rows):
+        if "cell" in by:
+            row["lat"] = round(float(lat[i]), 6)
+            row["lng"] = round(float(lng[i]), 6)
+        if "time" in by:
+            row["time"] = int((merged["key"][i] >> 32) * step * STATS_BUCKET_S)
+    return overall, rows
+
+
+# ===============================
+# Streaming responses
+# ===============================
+RESPONSE_FORMATS = ("json", "ndjson")
+
+
+def _dumps(obj):
+    # รูปแบบเดียวกับ jsonify (เรียง key, ไม่มีช่องว่าง)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"))
+
+
+def _iter_rows(snap, idx, with_index, ndjson):
+    """สร้าง JSON array (หรือ NDJSON) ทีละ STREAM_CHUNK_ROWS แถวจากคอลัมน์ตรง ๆ
+       หน่วยความจำที่ใช้ขึ้นกับขนาด chunk ไม่ใช่จำนวนแถวทั้งหมด
+    """
+    total = snap.n if idx is None else len(idx)
+    if not ndjson:
+        yield "["
+    for start in range(0, total, STREAM_CHUNK_ROWS):
+        stop = min(start + STREAM_CHUNK_ROWS, total)
+        part = slice(start, stop) if idx is None else idx[start:stop]
+        rows = snap.rows(part, with_index=with_index)
+        if ndjson:
+            yield "".join(_dumps(r) + "\n" for r in rows)
+        else:
+            yield ("," if start else "") + _dumps(rows)[1:-1]
+    if not ndjson:
+        yield "]"
+
+
+def rows_response(snap, idx=None, with_index=False, fmt="json"):
+    """ตอบแถวข้อมูล: ชุดเล็กใช้ jsonify ปกติ, ชุดใหญ่/stream=1/ndjson ส่งแบบ stream
+       error ทั้งหมดต้องเช็กก่อนเรียกฟังก์ชันนี้ (พอเริ่ม stream แล้วเปลี่ยน status ไม่ได้)
+    """
+    total = snap.n if idx is None else len(idx)
+    if fmt == "ndjson":
+        return Response(_iter_rows(snap, idx, with_index, ndjson=True),
+                        mimetype="application/x-ndjson")
+    if request.args.get("stream") == "1" or total >= STREAM_MIN_ROWS:
+        return Response(_iter_rows(snap, idx, with_index, ndjson=False),
+                        mimetype="application/json")
+    return jsonify(snap.rows(idx, with_index=with_index))
+
+
+def _response_format():
+    fmt = request.args.get("format", "json")
+    if fmt not in RESPONSE_FORMATS:
+        raise ValueError("format must be one of " + ", ".join(RESPONSE_FORMATS))
+    return fmt
+
+
+# ===============================
+# Conditional GET + compression
+# ===============================
+class BytesLRU:
+    """LRU จำกัดขนาดรวมเป็น byte  value = (mimetype, body bytes)"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        nbytes = len(value[1])
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._items[key] = value
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, dropped = self._items.popitem(last=False)
+                self.size -= len(dropped[1])
+
+
+_compressed = BytesLRU(COMPRESS_CACHE_BYTES)
+
+
+def data_etag(snap):
+    """ETag ของ response นี้ = เวอร์ชันข้อมูล + path + query (ต่าง query ก็ต่าง ETag)"""
+    basis = "%s|%s|%s|%s" % (snap.source, snap.generation, snap.version, request.full_path)
+    return hashlib.sha1(basis.encode()).hexdigest()[:24]
+
+
+def _pick_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compressor(encoding):
+    if encoding == "br":
+        c = brotli.Compressor(quality=5)
+        return c.process, c.finish
+    c = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits 31 = gzip
+    return c.compress, c.flush
+
+
+def _compress_stream(chunks, encoding, cache_key, mimetype):
+    """บีบอัด response แบบ stream ทีละ chunk แล้วเก็บลงแคชถ้าไม่ใหญ่เกิน
+       cache_key=None -> บีบอย่างเดียว ไม่เก็บ (เช่น /export ที่ใหญ่ได้ไม่จำกัด)
+    """
+    process, finish = _compressor(encoding)
+    # kept = None -> ไม่เก็บแล้ว (ใหญ่เกินแคช) ปล่อยที่เก็บมาทันที ไม่ถือไว้จนส่งจบ
+    kept = [] if cache_key is not None else None
+    size = 0
+    for chunk in chunks:
+        out = process(chunk.encode() if isinstance(chunk, str) else chunk)
+        if out:
+            size += len(out)
+            if kept is not None:
+                if size <= COMPRESS_CACHE_BYTES:
+                    kept.append(out)
+                else:
+                    kept = None
+            yield out
+    out = finish()
+    size += len(out)
+    yield out
+    if kept is not None and size <= COMPRESS_CACHE_BYTES:
+        kept.append(out)
+        _compressed.put(cache_key, (mimetype, b"".join(kept)))
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since is not None and last_modified is not None:
+        return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+
+def conditional_data(view):
+    """ห่อ route ข้อมูล: ETag/Last-Modified + 304 และบีบอัด gzip/br พร้อมแคชต่อเวอร์ชัน
+       ข้อมูลไม่เปลี่ยนตั้งแต่ครั้งก่อน -> 304 ไม่มี body (แทบไม่เสียอะไรบน Wi-Fi)
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            session = session_arg()
+            snap = read_measurements(session=session)
+        except Exception:
+            return view(*args, **kwargs)
+        # view อ่าน snapshot นี้ตัวเดียวกัน (ดู read_measurements) จุดที่ต่อท้ายระหว่างนี้
+        # จึงไม่ไปอยู่ใน body ที่แคชไว้ใต้ ETag ของเวอร์ชันก่อน
+        g.snapshot = (session, snap)
+        if not (len(snap) or sd_watcher.mounted):
+            return view(*args, **kwargs)
+
+        etag = data_etag(snap)
+        last_modified = snap.source[0] / 1e9 if snap.source else None
+        headers = {"ETag": '"%s"' % etag, "Vary": "Accept-Encoding",
+                   "Cache-Control": "no-cache"}
+        if last_modified is not None:
+            headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+        if _not_modified(etag, last_modified):
+            return Response(status=304, headers=headers)
+
+        encoding = _pick_encoding()
+        cache_key = (etag, encoding)
+        if encoding:
+            cached = _compressed.get(cache_key)
+            if cached is not None:
+                resp = Response(cached[1], mimetype=cached[0])
+                resp.headers.update(headers)
+                resp.headers["Content-Encoding"] = encoding
+                return resp
+
+        resp = app.make_response(view(*args, **kwargs))
+        if resp.status_code != 200:
+            return resp
+        resp.headers.update(headers)
+        if not encoding or resp.mimetype.startswith("image/"):
+            # PNG บีบอัดมาแล้ว gzip ซ้ำไม่ได้อะไร
+            return resp
+
+        if resp.is_streamed:
+            resp.response = _compress_stream(resp.response, encoding, cache_key, resp.mimetype)
+        else:
+            raw = resp.get_data()
+            if len(raw) < COMPRESS_MIN_BYTES:
+                return resp
+            process, finish = _compressor(encoding)
+            body = process(raw) + finish()
+            _compressed.put(cache_key, (resp.mimetype, body))
+            resp.set_data(body)
+        resp.headers["Content-Encoding"] = encoding
+        return resp
+
+    return wrapper
+
+
+# ===============================
+# Bulk export (/export)
+# ===============================
+# ส่งออกทั้งชุด (หรือเฉพาะ bbox/ช่วงเวลา) เป็นไฟล์ดาวน์โหลด ทีละ EXPORT_CHUNK_ROWS แถวจากคอลัมน์ตรง ๆ
+# ไม่สร้าง list ของ dict ทั้งชุดแบบ /tabledata และใช้ snapshot เดียวตลอด
+# จุดที่ต่อท้ายระหว่างดาวน์โหลดจึงไม่ปนเข้ามาครึ่ง ๆ กลาง ๆ
+
+EXPORT_FORMATS = OrderedDict([
+    # format: (mimetype, นามสกุลไฟล์)
+    ("csv", ("text/csv", "csv")),
+    ("geojson", ("application/geo+json", "geojson")),
+    ("ndjson", ("application/x-ndjson", "ndjson")),
+    ("parquet", ("application/vnd.apache.parquet", "parquet")),
+])
+
+
+def _export_parts(snap, idx):
+    """index ของแถวทีละ EXPORT_CHUNK_ROWS (เป็น array เสมอ ไม่สร้าง arange ทั้งชุด)"""
+    total = snap.n if idx is None else len(idx)
+    for start in range(0, total, EXPORT_CHUNK_ROWS):
+        stop = min(start + EXPORT_CHUNK_ROWS, total)
+        yield np.arange(start, stop) if idx is None else idx[start:stop]
+
+
+def _export_csv(snap, idx):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    yield "lat,lng,time,dbm\n"
+    for part in _export_parts(snap, idx):
+        # None (NaN / ไม่มีเวลา) -> ช่องว่าง
+        writer.writerows(zip(snap.column_list("lat", part), snap.column_list("lng", part),
+                             snap.time_strings(part), snap.column_list("dbm", part)))
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def _json_tokens(snap, part):
+    """คอลัมน์ lat, lng, time, dbm เป็นข้อความ JSON ทีละค่า (แปลงทั้งคอลัมน์ใน C ทีเดียว
+       เร็วกว่า json.dumps ทีละแถวหลายเท่า) ผลตรงกับ _dumps ทุกตัว"""
+    floats = [_dumps(snap.column_list(name, part))[1:-1].split(",")
+              for name in ("lat", "lng", "dbm")]
+    quote = json.encoder.encode_basestring_ascii
+    times = ["null" if t is None else quote(t) for t in snap.time_strings(part)]
+    return floats[0], floats[1], times, floats[2]
+
+
+def _export_geojson(snap, idx):
+    # coordinates ของ GeoJSON เป็น [lng, lat]  จุดที่ไม่มีพิกัด -> geometry null
+    point = ('{"geometry":{"coordinates":[%s,%s],"type":"Point"},'
+             '"properties":{"dbm":%s,"time":%s},"type":"Feature"}')
+    empty = '{"geometry":null,"properties":{"dbm":%s,"time":%s},"type":"Feature"}'
+    yield '{"type":"FeatureCollection","features":['
+    sep = ""
+    for part in _export_parts(snap, idx):
+        yield sep + ",".join(
+            empty % (d, t) if a == "null" or b == "null" else point % (b, a, d, t)
+            for a, b, t, d in zip(*_json_tokens(snap, part)))
+        sep = ","
+    yield "]}"
+
+
+def _export_ndjson(snap, idx):
+    # แถวเหมือน /data?format=ndjson
+    row = '{"dbm":%s,"lat":%s,"lng":%s,"time":%s}\n'
+    for part in _export_parts(snap, idx):
+        yield "".join(row % (d, a, b, t) for a, b, t, d in zip(*_json_tokens(snap, part)))
+
+
+class _ChunkSink:
+    """file-like ให้ ParquetWriter เขียนใส่ แล้วดึงออกไปส่งทีละ row group (ไม่เก็บทั้งไฟล์)"""
+
+    def __init__(self):
+        self.closed = False
+        self._parts = []
+        self._pos = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+
+def _export_parquet(snap, idx):
+    # เวลาเป็น timestamp UTC (เวลาที่ parse ไม่ได้ -> null), NaN -> null
+    schema = pa.schema([("lat", pa.float64()), ("lng", pa.float64()),
+                        ("time", pa.timestamp("s", tz="UTC")), ("dbm", pa.float64())])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for part in _export_parts(snap, idx):
+            lat, lng, dbm, ep = snap.lat[part], snap.lng[part], snap.dbm[part], snap.epoch[part]
+            writer.write_table(pa.Table.from_arrays([
+                pa.array(lat, mask=~np.isfinite(lat)),
+                pa.array(lng, mask=~np.isfinite(lng)),
+                pa.array(ep, type=schema.field("time").type, mask=ep == TIME_NONE),
+                pa.array(dbm, mask=~np.isfinite(dbm)),
+            ], schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+_EXPORTERS = {"csv": _export_csv, "geojson": _export_geojson,
+              "ndjson": _export_ndjson, "parquet": _export_parquet}
+
+
+def export_filename(session, fmt):
+    """เช่น rf-samples-2025-01-01_run1-20250101-120000.csv (ชื่อ session ใช้ได้เฉพาะตัวที่ปลอดภัย)"""
+    parts = ["rf-samples"]
+    if session:
+        parts.append(re.sub(r"[^A-Za-z0-9._-]+", "_", "+".join(session)))
+    parts.append(time.strftime("%Y%m%d-%H%M%S", time.gmtime()))
+    return "%s.%s" % ("-".join(parts), EXPORT_FORMATS[fmt][1])
+
+
+def export_response(snap, idx, fmt, filename):
+    """ไฟล์ดาวน์โหลดแบบ stream  error ทั้งหมดต้องเช็กก่อนเรียก (เหมือน rows_response)"""
+    mimetype = EXPORT_FORMATS[fmt][0]
+    body = _EXPORTERS[fmt](snap, idx)
+    headers = {"Content-Disposition": 'attachment; filename="%s"' % filename,
+               "Cache-Control": "no-store"}
+    # parquet บีบอัดข้างในแล้ว  แบบข้อความบีบ gzip/br ระหว่างส่งได้ แต่ไม่เก็บลงแคช (ใหญ่ไม่จำกัด)
+    encoding = _pick_encoding() if fmt != "parquet" else None
+    if encoding:
+        body = _compress_stream(body, encoding, None, mimetype)
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+    return Response(body, mimetype=mimetype, headers=headers)
+
+
+# ===============================
+# Static assets (Leaflet ในเครื่อง)
+# ===============================
+class StaticAssets:
+    """โหลดไฟล์ใต้ STATIC_DIR เข้าหน่วยความจำครั้งเดียวตอนเริ่มโปรแกรม พร้อมบีบอัด gzip/br ไว้ก่อน
+       URL = /assets/<version>/<path>  (version = hash ของทุกไฟล์รวมกัน)
+       ใช้ prefix เดียวทั้งชุด ไม่ใส่ hash ต่อไฟล์ เพราะ leaflet.css อ้าง images/*.png แบบ relative
+    """
+
+    SKIP = ("README", "LICENSE")
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}   # path -> {"mimetype", "etag", "integrity", "raw", "gzip", "br"}
+        total = hashlib.sha256()
+        for base, dirs, names in os.walk(root):
+            dirs.sort()
+            for name in sorted(names):
+                if name.startswith(".") or name.upper().startswith(self.SKIP):
+                    continue
+                full = os.path.join(base, name)
+                path = os.path.relpath(full, root).replace(os.sep, "/")
+                with open(full, "rb") as f:
+                    raw = f.read()
+                digest = hashlib.sha256(raw)
+                total.update(path.encode() + b"\0" + digest.digest())
+                self.files[path] = self._entry(path, raw, digest)
+        self.version = total.hexdigest()[:12]
+
+    @staticmethod
+    def _entry(path, raw, digest):
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if mimetype.startswith("text/") or mimetype.endswith("javascript"):
+            mimetype += "; charset=utf-8"
+        entry = {"mimetype": mimetype, "raw": raw,
+                 "etag": digest.hexdigest()[:24],
+                 "integrity": "sha256-" + base64.b64encode(digest.digest()).decode()}
+        if mimetype.startswith("image/") or len(raw) < COMPRESS_MIN_BYTES:
+            return entry
+        # บีบแรงสุดได้ เพราะทำครั้งเดียวตอนเริ่ม ไม่ใช่ทุก request
+        variants = {"gzip": lambda b: zlib.compress(b, 9, wbits=31)}
+        if brotli is not None:
+            variants["br"] = lambda b: brotli.compress(b, quality=11)
+        for encoding, compress in variants.items():
+            body = compress(raw)
+            if len(body) < len(raw):
+                entry[encoding] = body
+        return entry
+
+    def url(self, path):
+        return "/assets/%s/%s" % (self.version, path)
+
+    def integrity(self, path):
+        return self.files[path]["integrity"]
+
+    def response(self, version, path):
+        entry = self.files.get(path)
+        if entry is None:
+            return None
+        headers = {"ETag": '"%s"' % entry["etag"], "Vary": "Accept-Encoding"}
+        if version == self.version:
+            headers["Cache-Control"] = "public, max-age=%d, immutable" % ASSET_MAX_AGE
+        else:
+            # หน้าเว็บเก่าที่ค้างอยู่ขอ version เดิม: ให้ไฟล์ปัจจุบันไปแต่ห้ามแคชยาว
+            headers["Cache-Control"] = "no-cache"
+        if _not_modified(entry["etag"], None):
+            return Response(status=304, headers=headers)
+        encoding = _pick_encoding()
+        if encoding not in entry:
+            encoding = "gzip" if "gzip" in entry and request.accept_encodings["gzip"] else None
+        resp = Response(entry[encoding] if encoding else entry["raw"], mimetype=entry["mimetype"])
+        resp.headers.update(headers)
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        return resp
+
+
+static_assets = StaticAssets(STATIC_DIR)
+
+
+# ===============================
+# Binary payload (/data.bin)
+# ===============================
+# layout (little-endian ทั้งหมด) ให้ JS เปิดเป็น typed array ได้เลยไม่ต้อง parse:
+#   0  char[4]  magic "RFHM"
+#   4  uint16   format version (1)
+#   6  uint16   header size (48) = offset ของคอลัมน์แรก
+#   8  uint32   n = จำนวนจุด
+#   12 uint32   reserved
+#   16 float64  origin lat
+#   24 float64  origin lng
+#   32 float32  dBm ต่ำสุดของสเกลสี (HEAT_DBM_MIN)
+#   36 float32  dBm สูงสุดของสเกลสี (HEAT_DBM_MAX)
+#   40 byte[8]  reserved
+#   48 float32[n] lat - origin lat
+#      float32[n] lng - origin lng
+#      float32[n] dBm
+#      float32[n] intensity 0..1 (สูตรเดียวกับ dbmToIntensity)
+# lat/lng เก็บเป็นระยะจากจุดกลาง (origin) เป็น float32 ละเอียดระดับมิลลิเมตร
+# สำหรับ survey ที่กว้างไม่เกินราว 1 องศา
+BIN_MAGIC = b"RFHM"
+BIN_VERSION = 1
+_BIN_HEADER = struct.Struct("<4sHHII dd ff 8x")
+
+
+def pack_points(lat, lng, dbm):
+    """แพ็ก lat/lng/dbm (เฉพาะจุดที่ค่าครบ) เป็น bytes ตาม layout ด้านบน"""
+    n = lat.size
+    if n:
+        origin_lat = float(lat.min() + lat.max()) / 2.0
+        origin_lng = float(lng.min() + lng.max()) / 2.0
+    else:
+        origin_lat, origin_lng = DEFAULT_CENTER["lat"], DEFAULT_CENTER["lng"]
+
+    header = _BIN_HEADER.pack(BIN_MAGIC, BIN_VERSION, _BIN_HEADER.size, n, 0,
+                              origin_lat, origin_lng, HEAT_DBM_MIN, HEAT_DBM_MAX)
+    cols = np.empty((4, n), dtype="<f4")
+    cols[0] = lat - origin_lat
+    cols[1] = lng - origin_lng
+    cols[2] = dbm
+    cols[3] = dbm_to_intensity(dbm)
+    return header + cols.tobytes()
+
+
+# ===============================
+# Heat tiles (/tiles/{z}/{x}/{y}.png)
+# ===============================
+# heatmap วาดฝั่ง server เป็นรูป 256x256 ต่อ tile (XYZ แบบเดียวกับ OSM/Leaflet)
+# browser แค่โหลดรูปเหมือนแผนที่พื้นหลัง ภาระฝั่ง client คงที่ต่อจอไม่ว่าจะมีกี่จุด
+# สี    = dBm เฉลี่ยถ่วงน้ำหนัก (Gaussian) ของจุดรอบ ๆ สเกล HEAT_DBM_MIN..MAX เดียวกับ legend
+# ความทึบ = ความหนาแน่นของจุด (ไม่มีจุดแถวนั้น = โปร่งใส)
+TILE_SIZE = 256
+
+# ไล่สีเดียวกับ .legend-bar: #00f -> #0ff -> #0f0 -> #ff0 -> #f00 (ระยะเท่ากัน)
+_HEAT_STOPS = np.linspace(0.0, 1.0, 5)
+_HEAT_COLORS = np.array([[0, 0, 255], [0, 255, 255], [0, 255, 0],
+                         [255, 255, 0], [255, 0, 0]], dtype=np.float64)
+_HEAT_LUT = np.stack([
+    np.interp(np.linspace(0.0, 1.0, 256), _HEAT_STOPS, _HEAT_COLORS[:, k]) for k in range(3)
+], axis=1).round().astype(np.uint8)
+
+# ค่าที่มีผลกับหน้าตา tile ใส่ใน key แคช เปลี่ยน config แล้ว tile เก่าบนดิสก์จะไม่ถูกใช้
+_TILE_STYLE = (TILE_SIZE, TILE_RADIUS_PX, TILE_OPACITY, HEAT_DBM_MIN, HEAT_DBM_MAX)
+
+
+def _gaussian_kernel(radius):
+    d = np.arange(-radius, radius + 1, dtype=np.float64)
+    return np.exp(-0.5 * (d / (radius / 3.0)) ** 2)
+
+
+_TILE_KERNEL = _gaussian_kernel(TILE_RADIUS_PX)
+
+
+def _blur_tile(grid, kernel):
+    """Gaussian แบบแยกแกน: grid ขนาด (TILE_SIZE+2r)^2 -> เฉพาะส่วนใน tile TILE_SIZE^2"""
+    out = np.zeros((grid.shape[0], TILE_SIZE))
+    for j, k in enumerate(kernel):
+        out += k * grid[:, j:j + TILE_SIZE]
+    final = np.zeros((TILE_SIZE, TILE_SIZE))
+    for j, k in enumerate(kernel):
+        final += k * out[j:j + TILE_SIZE, :]
+    return final
+
+
+def render_tile(snap, z, x, y, trange=None):
+    """วาด heat tile (z, x, y) จากจุดใน snapshot คืน RGBA uint8 (TILE_SIZE, TILE_SIZE, 4)
+       หรือ None ถ้าไม่มีจุดที่มีผลกับ tile นี้เลย  trange = ช่วงเวลา (ดู time_range_arg)
+    """
+    r = TILE_RADIUS_PX
+    size = TILE_SIZE + 2 * r
+    world = TILE_SIZE * float(2 ** z)
+    x0, y0 = x * TILE_SIZE - r, y * TILE_SIZE - r
+
+    # จุดที่อยู่ใน tile หรือห่างขอบไม่เกินรัศมี (ใช้ spatial index ไม่ต้องไล่ทุกจุด)
+    min_lng, max_lat = _pixel_to_lnglat(x0, y0, world)
+    max_lng, min_lat = _pixel_to_lnglat(x0 + size, y0 + size, world)
+    idx = select_points(snap, (min_lng, min_lat, max_lng, max_lat), trange)
+    if idx.size == 0:
+        return None
+
+    px, py = _lnglat_to_pixel(snap.lng[idx], snap.lat[idx], world)
+    ix = np.floor(px - x0).astype(np.int64)
+    iy = np.floor(py - y0).astype(np.int64)
+    ok = (ix >= 0) & (ix < size) & (iy >= 0) & (iy < size)
+    cells = iy[ok] * size + ix[ok]
+    value = np.clip((snap.dbm[idx][ok] - HEAT_DBM_MIN) / (HEAT_DBM_MAX - HEAT_DBM_MIN), 0.0, 1.0)
+
+    # splat: นับจุด/รวมค่าลง pixel ก่อน แล้วค่อยเบลอทีเดียว (ค่าใช้จ่ายไม่ขึ้นกับจำนวนจุด)
+    count = np.bincount(cells, minlength=size * size).reshape(size, size).astype(np.float64)
+    total = np.bincount(cells, weights=value, minlength=size * size).reshape(size, size)
+    density = _blur_tile(count, _TILE_KERNEL)
+    weighted = _blur_tile(total, _TILE_KERNEL)
+
+    visible = density > 0.02
+    if not visible.any():
+        return None
+    mean = np.zeros_like(density)
+    np.divide(weighted, density, out=mean, where=visible)
+
+    rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    rgba[..., :3] = _HEAT_LUT[np.clip(mean * 255.0, 0, 255).astype(np.uint8)]
+    alpha = np.clip(density, 0.0, 1.0) * (255.0 * TILE_OPACITY)
+    rgba[..., 3] = np.where(visible, alpha, 0.0).astype(np.uint8)
+    return rgba
+
+
+def encode_png(rgba):
+    """RGBA uint8 (h, w, 4) -> PNG bytes (ใช้แค่ zlib ไม่ต้องพึ่ง PIL)"""
+    h, w, _ = rgba.shape
+    raw = np.zeros((h, w * 4 + 1), dtype=np.uint8)   # byte แรกของแต่ละแถว = filter 0
+    raw[:, 1:] = rgba.reshape(h, w * 4)
+
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+            + chunk(b"IEND", b""))
+
+
+EMPTY_TILE_PNG = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+class TileCache:
+    """LRU 2 ชั้นของ tile PNG: หน่วยความจำ (BytesLRU) -> ดิสก์ (TILE_DISK_DIR)
+       key มีตัวตนเวอร์ชันข้อมูลอยู่ด้วย ข้อมูลเปลี่ยน tile เก่าก็ไม่ถูกใช้อีกและค่อย ๆ หล่นออกจาก LRU
+       ชั้นดิสก์อยู่รอดข้ามการรีสตาร์ต (เวอร์ชันข้อมูลมาจาก DB ซึ่งก็อยู่รอดเหมือนกัน)
+    """
+
+    def __init__(self, mem_bytes, disk_dir, disk_bytes):
+        self.mem = BytesLRU(mem_bytes)
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._disk = None          # ชื่อไฟล์ -> ขนาด เรียงจากใช้ล่าสุดน้อยสุด
+        self._disk_size = 0
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+    def _name(self, key):
+        return hashlib.sha1(repr(key).encode()).hexdigest() + ".png"
+
+    def _load_index(self):
+        """สแกนโฟลเดอร์ครั้งแรก เรียงตาม mtime (เก่าสุดก่อน)"""
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        try:
+            entries = sorted(os.scandir(self.disk_dir), key=lambda e: e.stat().st_mtime)
+        except FileNotFoundError:
+            return
+        for e in entries:
+            if e.name.endswith(".png"):
+                size = e.stat().st_size
+                self._disk[e.name] = size
+                self._disk_size += size
+
+    def get(self, key):
+        hit = self.mem.get(key)
+        if hit is not None:
+            self.hits["memory"] += 1
+            return hit[1]
+        name = self._name(key)
+        with self._lock:
+            if self._disk is None:
+                self._load_index()
+            if name not in self._disk:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(name)
+        try:
+            with open(os.path.join(self.disk_dir, name), "rb") as f:
+                body = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits["disk"] += 1
+        self.mem.put(key, ("image/png", body))
+        return body
+
+    def put(self, key, body):
+        self.mem.put(key, ("image/png", body))
+        name = self._name(key)
+        path = os.path.join(self.disk_dir, name)
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp = "%s.%d.tmp" % (path, threading.get_ident())
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+        except OSError as e:
+            app.logger.warning("tile cache: %s", e)
+            record_error(e, "tile_cache")
+            return
+        with self._lock:
+            if self._disk is None:
+                self._load_index()
+            self._disk_size += len(body) - self._disk.pop(name, 0)
+            self._disk[name] = len(body)
+            while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+                old, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                try:
+                    os.remove(os.path.join(self.disk_dir, old))
+                except OSError:
+                    pass
+
+    def stats(self):
+        return {"memory_hits": self.hits["memory"], "disk_hits": self.hits["disk"],
+                "misses": self.misses, "memory_bytes": self.mem.size,
+                "disk_bytes": self._disk_size}
+
+
+tile_cache = TileCache(TILE_CACHE_BYTES, TILE_DISK_DIR, TILE_DISK_BYTES)
+
+
+def heat_tile_png(snap, session, z, x, y, trange=None):
+    """PNG ของ tile (z, x, y) จากแคช หรือวาดใหม่แล้วเก็บเข้าแคช"""
+    key = (snap.source, session, z, x, y, _TILE_STYLE)
+    if trange is not None:
+        # last= ขึ้นกับจุดล่าสุด -> ใช้ช่วงที่คำนวณแล้วเป็น key
+        key += resolve_time_range(snap, trange)
+    body = tile_cache.get(key)
+    if body is None:
+        rgba = render_tile(snap, z, x, y, trange)
+        body = EMPTY_TILE_PNG if rgba is None else encode_png(rgba)
+        tile_cache.put(key, body)
+    return body
+
+
+# ===============================
+# Coverage surface (/coverage)
+# ===============================
+# ประมาณค่า dBm "ระหว่าง" จุดที่เดินวัด บน grid ของ bbox (ไว้วางแผนความครอบคลุม 2.4 GHz)
+# - idw    : modified Shepard ถ่วงน้ำหนัก ((R-d)/(R*d))^p เฉพาะจุดในรัศมี R (ผิวต่อเนื่องถึงขอบรัศมี)
+# - kriging: ordinary kriging จาก k จุดใกล้สุด variogram แบบ exponential ที่ fit จากข้อมูลเอง
+# คำนวณทีละ block ของช่อง กับเฉพาะจุดที่อยู่ใกล้ block นั้น (spatial index + เรียงตามแกน y)
+# ไม่ใช่ทุกช่อง x ทุกจุด  หน่วยความจำต่อ block ไม่เกิน COVERAGE_BLOCK_ELEMS
+# พิกัดคิดเป็นเมตรบนระนาบ (equirectangular รอบกลาง bbox) พอสำหรับพื้นที่ระดับไม่กี่กิโลเมตร
+
+_M_PER_DEG_LAT = 110540.0
+_M_PER_DEG_LNG = 111320.0
+# ช่องต่อด้านของ 1 block
+_COVERAGE_BLOCK = 16
+# จำนวนจุดสุ่มที่ใช้ fit variogram (คู่จุด ~n^2/2)
+_VARIOGRAM_SAMPLE = 1500
+# รวมจุดที่อยู่ในช่องย่อยขนาด radius/ค่านี้ เป็นจุดเดียว (ตำแหน่ง/ค่าเฉลี่ย + จำนวนจุด)
+# ยืนวัดที่เดิมหรือเดินวนซ้ำ ๆ จุดหนาแน่นมาก -> งานต่อช่องขึ้นกับจำนวนช่องย่อยในรัศมี ไม่ใช่จำนวนจุด
+_COVERAGE_BIN_FRACTION = 16
+
+
+def _bin_points(px, py, pv, size):
+    """รวมจุดในช่องย่อยขนาด size เมตร คืน (x, y, dbm เฉลี่ย, จำนวนจุด)"""
+    if not len(px):
+        return px, py, pv, np.ones(0)
+    col = np.floor(px / size).astype(np.int64)
+    row = np.floor(py / size).astype(np.int64)
+    key = (row - row.min()) * (col.max() - col.min() + 1) + (col - col.min())
+    _, inverse, counts = np.unique(key, return_inverse=True, return_counts=True)
+    counts = counts.astype(np.float64)
+    mean = lambda v: np.bincount(inverse, v, len(counts)) / counts
+    return mean(px), mean(py), mean(pv), counts
+
+
+def _idw(cx, cy, px, py, pv, power, radius, weight=None):
+    """IDW ของช่อง (cx, cy) จากจุด (px, py, pv) ช่องที่ไม่มีจุดในรัศมี = NaN
+       weight = น้ำหนักต่อจุด (จำนวนจุดจริงที่ถูกรวมไว้ใน _bin_points)
+    """
+    d = np.hypot(cx[:, None] - px[None, :], cy[:, None] - py[None, :])
+    # d ต่ำสุด 1 ซม. จุดที่ทับช่องพอดีได้น้ำหนักสูงมากแทนการหารศูนย์
+    w = np.clip(radius - d, 0.0, None) / (radius * np.maximum(d, 0.01))
+    w **= power
+    if weight is not None:
+        w *= weight
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (w @ pv) / w.sum(axis=1)
+
+
+def fit_variogram(px, py, pv, max_lag):
+    """fit variogram แบบ exponential: gamma(h) = nugget + psill * (1 - exp(-3h / range))
+       คืน (nugget, psill, range) หรือ None ถ้าจุดน้อยเกินจะ fit ได้
+    """
+    if len(px) > _VARIOGRAM_SAMPLE:
+        pick = np.random.default_rng(0).choice(len(px), _VARIOGRAM_SAMPLE, replace=False)
+        px, py, pv = px[pick], py[pick], pv[pick]
+    if len(px) < 10:
+        return None
+    i, j = np.triu_indices(len(px), 1)
+    h = np.hypot(px[i] - px[j], py[i] - py[j])
+    keep = (h > 0) & (h <= max_lag)
+    if keep.sum() < 30:
+        return None
+    h = h[keep]
+    g = 0.5 * (pv[i[keep]] - pv[j[keep]]) ** 2
+    del i, j
+
+    nbins = 12
+    which = np.minimum((h / max_lag * nbins).astype(np.int64), nbins - 1)
+    counts = np.bincount(which, minlength=nbins).astype(np.float64)
+    used = counts > 0
+    lag = np.bincount(which, h, nbins)[used] / counts[used]
+    gamma = np.bincount(which, g, nbins)[used] / counts[used]
+    weight = np.sqrt(counts[used])
+
+    best = None
+    for rng in np.linspace(max_lag / 10, max_lag * 1.5, 30):
+        f = 1.0 - np.exp(-3.0 * lag / rng)
+        # nugget/psill เป็นเชิงเส้น -> least squares ตรง ๆ ต่อ range แต่ละค่า
+        X = np.column_stack([np.ones_like(f), f]) * weight[:, None]
+        coef = np.linalg.lstsq(X, gamma * weight, rcond=None)[0]
+        nugget, psill = max(coef[0], 0.0), max(coef[1], 1e-6)
+        err = np.sum(counts[used] * (nugget + psill * f - gamma) ** 2)
+        if best is None or err < best[0]:
+            best = (err, nugget, psill, rng)
+    _, nugget, psill, rng = best
+    # nugget > 0 เสมอ จุดซ้ำตำแหน่งเดียวกัน (ยืนวัดที่เดิม) จะได้ไม่ทำให้ matrix singular
+    return max(nugget, psill * 1e-3), psill, float(rng)
+
+
+def _kriging(cx, cy, px, py, pv, model, radius, k):
+    """ordinary kriging ของช่อง (cx, cy) จาก k จุดใกล้สุด แก้ระบบสมการทุกช่องพร้อมกัน
+       ช่องที่จุดใกล้สุดอยู่นอกรัศมี = NaN
+    """
+    d = np.hypot(cx[:, None] - px[None, :], cy[:, None] - py[None, :])
+    k = min(k, len(px))
+    if k < len(px):
+        nn = np.argpartition(d, k - 1, axis=1)[:, :k]
+    else:
+        nn = np.broadcast_to(np.arange(k), d.shape)
+    nd = np.take_along_axis(d, nn, axis=1)
+    out = np.full(len(cx), np.nan)
+    ok = nd.min(axis=1) <= radius
+    if not ok.any():
+        return out
+    nn, nd = nn[ok], nd[ok]
+
+    nugget, psill, rng = model
+    qx, qy = px[nn], py[nn]
+    dd = np.hypot(qx[:, :, None] - qx[:, None, :], qy[:, :, None] - qy[:, None, :])
+    a = np.ones((len(nn), k + 1, k + 1))
+    a[:, :k, :k] = psill * np.exp(-3.0 * dd / rng) + nugget * np.eye(k)
+    a[:, k, k] = 0.0
+    b = np.ones((len(nn), k + 1, 1))
+    b[:, :k, 0] = psill * np.exp(-3.0 * nd / rng)
+    try:
+        lam = np.linalg.solve(a, b)[:, :k, 0]
+    except np.linalg.LinAlgError:
+        out[ok] = _idw(cx[ok], cy[ok], px, py, pv, COVERAGE_POWER, radius)
+        return out
+    out[ok] = np.sum(lam * pv[nn], axis=1)
+    return out
+
+
+def coverage_grid(snap, bbox, res, method="idw", power=COVERAGE_POWER,
+                  radius=COVERAGE_RADIUS_M, neighbours=COVERAGE_NEIGHBOURS):
+    """คำนวณ grid ค่า dBm ใน bbox  ช่องเป็นสี่เหลี่ยมจัตุรัส (เมตร) ด้านยาวของ bbox มี res ช่อง
+       คืน (lat กลางช่อง[ny], lng กลางช่อง[nx], values[ny, nx], info)  แถว 0 = ใต้สุด
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    kx = _M_PER_DEG_LNG * np.cos(np.radians((min_lat + max_lat) / 2.0))
+    ky = _M_PER_DEG_LAT
+    width, height = (max_lng - min_lng) * kx, (max_lat - min_lat) * ky
+    cell = max(width, height, 0.01) / res
+    nx = max(1, int(np.ceil(width / cell - 1e-9)))
+    ny = max(1, int(np.ceil(height / cell - 1e-9)))
+    xs = (np.arange(nx) + 0.5) * cell
+    ys = (np.arange(ny) + 0.5) * cell
+
+    # จุดวัดใน bbox ที่ขยายออกไปอีก 1 รัศมี (ช่องริมขอบจะได้เห็นจุดนอก bbox ด้วย)
+    pad_lng, pad_lat = radius / kx, radius / ky
+    idx = spatial_index(snap).query(snap, (min_lng - pad_lng, min_lat - pad_lat,
+                                           max_lng + pad_lng, max_lat + pad_lat))
+    idx = idx[snap.valid[idx]]
+    px, py, pv, pn = _bin_points((snap.lng[idx] - min_lng) * kx, (snap.lat[idx] - min_lat) * ky,
+                                 snap.dbm[idx], radius / _COVERAGE_BIN_FRACTION)
+    order = np.argsort(py, kind="stable")
+    px, py, pv, pn = px[order], py[order], pv[order], pn[order]
+
+    model = None
+    if method == "kriging":
+        model = fit_variogram(px, py, pv, 2.0 * radius)
+        if model is None:
+            method = "idw"   # จุดน้อยเกินจะ fit variogram ได้
+
+    values = np.full((ny, nx), np.nan)
+    B = _COVERAGE_BLOCK
+    for r0 in range(0, ny, B):
+        yb = ys[r0:r0 + B]
+        lo, hi = np.searchsorted(py, [yb[0] - radius, yb[-1] + radius])
+        bx, by, bv, bn = px[lo:hi], py[lo:hi], pv[lo:hi], pn[lo:hi]
+        if not len(bx):
+            continue
+        for c0 in range(0, nx, B):
+            xb = xs[c0:c0 + B]
+            m = (bx >= xb[0] - radius) & (bx <= xb[-1] + radius)
+            if not m.any():
+                continue
+            qx, qy, qv, qn = bx[m], by[m], bv[m], bn[m]
+            gx, gy = np.meshgrid(xb, yb)
+            gx, gy = gx.ravel(), gy.ravel()
+            out = np.empty(len(gx))
+            # จุดหนาแน่นมาก -> แบ่งช่องใน block เป็นชุดเล็กลง matrix จะได้ไม่เกินงบ
+            step = max(1, COVERAGE_BLOCK_ELEMS // len(qx))
+            for s in range(0, len(gx), step):
+                if model is None:
+                    out[s:s + step] = _idw(gx[s:s + step], gy[s:s + step], qx, qy, qv,
+                                           power, radius, qn)
+                else:
+                    out[s:s + step] = _kriging(gx[s:s + step], gy[s:s + step], qx, qy, qv,
+                                               model, radius, neighbours)
+            values[r0:r0 + len(yb), c0:c0 + len(xb)] = out.reshape(len(yb), len(xb))
+
+    if model is not None and len(pv):
+        # kriging แกว่งเลยช่วงข้อมูลได้นิดหน่อย ตัดให้อยู่ในช่วงที่วัดได้จริง
+        np.clip(values, pv.min(), pv.max(), out=values)
+    info = {"method": method, "cell_m": round(cell, 3), "points": int(len(idx)),
+            "radius": radius}
+    if method == "idw":
+        info["power"] = power
+    if model is not None:
+        info["variogram"] = {"model": "exponential", "nugget": round(model[0], 4),
+                             "psill": round(model[1], 4), "range": round(model[2], 3)}
+    return ys / ky + min_lat, xs / kx + min_lng, values, info
+
+
+# marching squares: case (bit0=ล่างซ้าย, 1=ล่างขวา, 2=บนขวา, 3=บนซ้าย >= level)
+# -> คู่ขอบที่เส้นตัด (0=ล่าง, 1=ขวา, 2=บน, 3=ซ้าย)  saddle (5, 10) แยกมุมออกจากกันเสมอ
+_MS_SEGMENTS = {
+    1: ((3, 0),), 2: ((0, 1),), 3: ((3, 1),), 4: ((1, 2),), 5: ((3, 0), (1, 2)),
+    6: ((0, 2),), 7: ((3, 2),), 8: ((2, 3),), 9: ((0, 2),), 10: ((0, 1), (2, 3)),
+    11: ((1, 2),), 12: ((1, 3),), 13: ((0, 1),), 14: ((3, 0),),
+}
+
+
+def coverage_contours(lat, lng, values, levels):
+    """เส้น contour ของ grid ที่แต่ละ level (dBm) เป็น GeoJSON FeatureCollection
+       1 Feature (MultiLineString) ต่อ level  เส้นเป็นท่อนสั้นช่องละท่อน (ไม่ได้ต่อเป็นเส้นยาว)
+    """
+    features = []
+    if len(lat) < 2 or len(lng) < 2:
+        return {"type": "FeatureCollection", "features": features}
+    dlat, dlng = lat[1] - lat[0], lng[1] - lng[0]
+    bl, br = values[:-1, :-1], values[:-1, 1:]
+    tr, tl = values[1:, 1:], values[1:, :-1]
+    finite = np.isfinite(bl) & np.isfinite(br) & np.isfinite(tr) & np.isfinite(tl)
+    rows, cols = np.mgrid[0:len(lat) - 1, 0:len(lng) - 1]
+
+    for level in levels:
+        case = ((bl >= level) * 1 | (br >= level) * 2 | (tr >= level) * 4
+                | (tl >= level) * 8)
+        case[~finite] = 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # ตำแหน่งที่เส้นตัดแต่ละขอบ เป็นพิกัด (row, col) แบบทศนิยม
+            edges = (
+                (rows, cols + (level - bl) / (br - bl)),
+                (rows + (level - br) / (tr - br), cols + 1),
+                (rows + 1, cols + (level - tl) / (tr - tl)),
+                (rows + (level - bl) / (tl - bl), cols),
+            )
+        segments = []
+        for c, pairs in _MS_SEGMENTS.items():
+            hit = case == c
+            if not hit.any():
+                continue
+            for a, b in pairs:
+                ra, ca = edges[a][0][hit], edges[a][1][hit]
+                rb, cb = edges[b][0][hit], edges[b][1][hit]
+                seg = np.stack([lng[0] + ca * dlng, lat[0] + ra * dlat,
+                                lng[0] + cb * dlng, lat[0] + rb * dlat], axis=1)
+                segments.append(np.round(seg, 6))
+        if not segments:
+            continue
+        coords = [[[s[0], s[1]], [s[2], s[3]]] for s in np.concatenate(segments).tolist()]
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "MultiLineString", "coordinates": coords},
+            "properties": {"dbm": float(level)},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def coverage_levels(values, step):
+    """ค่า dBm ของเส้น contour: ทุก step dB ที่อยู่ในช่วงค่าของ grid"""
+    finite = values[np.isfinite(values)]
+    if not finite.size:
+        return []
+    lo = np.ceil(finite.min() / step) * step
+    return [float(v) for v in np.arange(lo, finite.max() + 1e-9, step)]
+
+
+# ===============================
+# Live updates (SSE)
+# ===============================
+class EventHub:
+    """กระจาย event ให้ทุก client ที่ subscribe /events อยู่ (1 queue ต่อ client)"""
+
+    def __init__(self, maxsize=256):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.maxsize = maxsize
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.maxsize)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event, payload):
+        msg = "event: " + event + "\ndata: " + _dumps(payload) + "\n\n"
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(msg)
+            except queue.Full:
+                # client ช้าจนตามไม่ทัน -> ล้างคิวแล้วสั่งให้โหลดใหม่ทั้งชุด
+                _drain(q)
+                q.put_nowait("event: reset\ndata: {}\n\n")
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+def _drain(q):
+    try:
+        while True:
+            q.get_nowait()
+    except queue.Empty:
+        pass
+
+
+# inotify (Linux) ผ่าน ctypes: ใช้ปลุก watcher ทันทีที่ไฟล์ในการ์ดเปลี่ยน
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_UNMOUNT = 0x2000
+_IN_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+                  | _IN_DELETE | _IN_DELETE_SELF | _IN_UNMOUNT)
+
+
+def _inotify_open(path):
+    """เปิด inotify เฝ้า directory path คืน fd หรือ None ถ้าใช้ไม่ได้ (ไม่ใช่ Linux ฯลฯ)"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(path), _IN_WATCH_MASK) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class SDWatcher:
+    """thread เดียวเฝ้า SD_MOUNT_PATH / JSON_FILE_PATH, ingest จุดที่เปลี่ยนลง DB แล้วส่ง event เข้า EventHub
+       - status: mount/unmount หรือจำนวนจุดเปลี่ยน
+       - append: จุดที่ต่อท้ายเข้ามาใหม่ (generation เดิม) ของชุดรวม + ชื่อ session ที่เปลี่ยน
+       - reset : ข้อมูลเปลี่ยนทั้งชุด (undo/clear/เขียนใหม่) ให้ client โหลดใหม่
+       ใช้ inotify ปลุกถ้ามี ไม่งั้น (หรือการ์ดถูกถอด) ก็ poll stat ทุก SD_WATCH_INTERVAL
+       โหมดหลาย worker: worker เดียวที่ได้ leader.lock เป็นคนอ่านการ์ด ตัวอื่นแค่ตามไฟล์คอลัมน์
+       (ยังส่ง event ให้ client ของตัวเองเหมือนเดิม) leader ตายเมื่อไหร่ตัวถัดไปได้ล็อกแทน
+    """
+
+    def __init__(self, hub, interval=SD_WATCH_INTERVAL):
+        self.hub = hub
+        self.interval = interval
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._fd = None
+        self._leader_fd = None
+        self._sessions = None
+        self.mounted = None
+        self.points = None
+        self.generation = None
+        self.n = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                # เช็กรอบแรกเลย status แรกที่ส่งให้ client จะได้ถูกต้อง
+                try:
+                    self.check()
+                except Exception as e:
+                    app.logger.warning("sd watcher: %s", e)
+                    record_error(e, "sd_watcher")
+                self._thread = threading.Thread(target=self._run, name="sd-watcher", daemon=True)
+                self._thread.start()
+                serial_ingest.start()
+
+    def status(self):
+        info = {"mounted": bool(self.mounted), "points": self.points or 0,
+                "source": "sd" if self.mounted else "local",
+                "timestamp": time.time()}
+        if serial_ingest.port:
+            info["serial"] = serial_ingest.status()
+        return info
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                app.logger.warning("sd watcher: %s", e)
+                record_error(e, "sd_watcher")
+            self._wait()
+
+    def _wait(self):
+        if self._fd is None and self.mounted:
+            self._fd = _inotify_open(SD_MOUNT_PATH)
+        if self._fd is None:
+            time.sleep(self.interval)
+            return
+        ready, _, _ = select.select([self._fd], [], [], self.interval)
+        if not ready:
+            return
+        try:
+            # อ่าน event ทิ้งให้หมด (สนใจแค่ว่ามีอะไรเปลี่ยน แล้วไป stat เอง)
+            while os.read(self._fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._close()
+            return
+        # ESP32 ลบไฟล์แล้วเขียนใหม่ รอให้เขียนเสร็จก่อนค่อยอ่าน
+        time.sleep(0.1)
+        if not os.path.isdir(SD_MOUNT_PATH) or not os.path.ismount(SD_MOUNT_PATH):
+            self._close()
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def is_leader(self):
+        """process นี้เป็นคนอ่านการ์ดไหม (โหมด process เดียว = ใช่เสมอ)
+           ได้ล็อกแล้วถือไว้ตลอดอายุ process
+        """
+        if not SHARED_COLUMNS_DIR or self._leader_fd is not None:
+            return True
+        os.makedirs(SHARED_COLUMNS_DIR, exist_ok=True)
+        fd = os.open(os.path.join(SHARED_COLUMNS_DIR, "leader.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        return True
+
+    def _changed_sessions(self):
+        """worker ที่ไม่ได้อ่านการ์ดเอง: เทียบ generation/version ของแต่ละ session กับรอบก่อน"""
+        sessions = sample_db.state()[1]
+        old, self._sessions = self._sessions, sessions
+        if old is None:
+            return []
+        return sorted(name for name, state in sessions.items() if old.get(name) != state)
+
+    def check(self, force=False):
+        """เช็ก 1 รอบ: ingest สิ่งที่เปลี่ยนในการ์ดลง DB แล้ว publish event ถ้ามีอะไรเปลี่ยน
+           force=True -> อ่านไฟล์ใหม่ทั้งไฟล์ (ปุ่ม Reload)
+        """
+        with self._check_lock:
+            store = _cache["store"]
+            if not (force or self.is_leader()):
+                _sync_store(store)
+                self._publish(store.mounted(), self._changed_sessions())
+                return
+
+            t0 = time.perf_counter()
+            files = sample_files() if os.path.ismount(SD_MOUNT_PATH) else {}
+            metrics.observe("rf_sdcard_check_duration_seconds", time.perf_counter() - t0)
+            mounted = bool(files)
+            changed = []
+            if mounted:
+                for session, path, mode, rows in read_sd_changes(files, force):
+                    t0 = time.perf_counter()
+                    if mode == "append":
+                        sample_db.append(session, path, rows)
+                    elif mode == "stream":
+                        try:
+                            sample_db.replace(session, path, rows)
+                        except ValueError:
+                            # ไฟล์เสีย (เตือน/นับไว้แล้วใน _stream_file) transaction ถูก rollback แล้ว
+                            continue
+                    else:
+                        sample_db.replace(session, path, rows)
+                    metrics.observe("rf_db_write_duration_seconds",
+                                    time.perf_counter() - t0, (mode,))
+                    changed.append(session)
+            else:
+                # เสียบการ์ดกลับมาเมื่อไหร่ค่อยเทียบไฟล์ใหม่อีกรอบ (ข้อมูลใน DB ยังอยู่)
+                forget_sd_files()
+
+            _sync_store(store)
+            if isinstance(store, SharedStore) and store.mounted() != mounted:
+                store.set_mounted(mounted)
+            self._publish(mounted, changed)
+
+    def notify(self, changed):
+        """มีคนอื่นเขียน DB แล้ว (SerialIngest) -> sync store แล้วส่ง event เลย ไม่ต้องรอรอบ check"""
+        with self._check_lock:
+            _sync_store(_cache["store"])
+            self._publish(bool(self.mounted), changed)
+
+    def _publish(self, mounted, changed):
+        """เทียบ store กับรอบก่อนแล้วส่ง event append / reset / status"""
+        snap = _cache["store"].snapshot()
+        was_mounted = self.mounted
+        self.mounted = mounted
+
+        if snap.generation == self.generation and snap.n >= self.n:
+            if snap.n > self.n:
+                if snap.n - self.n > SSE_MAX_APPEND_ROWS:
+                    self.hub.publish("reset", {"points": snap.n, "sessions": changed})
+                else:
+                    self.hub.publish("append", {
+                        "points": snap.n,
+                        "sessions": changed,
+                        "rows": snap.rows(slice(self.n, snap.n)),
+                    })
+        elif self.generation is not None:
+            self.hub.publish("reset", {"points": snap.n, "sessions": changed})
+
+        self.generation = snap.generation
+        self.n = snap.n
+        if was_mounted != mounted or self.points != snap.n:
+            self.points = snap.n
+            self.hub.publish("status", self.status())
+
+
+event_hub = EventHub()
+sd_watcher = SDWatcher(event_hub)
 
-app = Flask(__name__)
 
 # ===============================
-# Config
+# Serial ingest (USB serial ของ ESP32)
 # ===============================
-SD_MOUNT_PATH = "/media/ployn/E25A-A181"
-# แก้ตรงนี้: ห้ามใส่ "/" นำหน้าไฟล์ ไม่งั้น os.path.join จะพัง
-JSON_FILE_PATH = os.path.join(SD_MOUNT_PATH, "noise_samples.json")
+# firmware พิมพ์ทาง Serial (115200) อยู่แล้ว ไม่ต้องแก้ firmware:
+#   ----------- STATUS -----------            ทุก 1 วินาที
+#   GPS OK  LAT=13.727600  LNG=100.772600  TIME=2025-01-01 12:00:00   (หรือ GPS not fixed yet...)
+#   Sats=7
+#   RF dBm=-45.3
+#   ------------------------------
+#   Will save point: lat=.. lng=.. rf=.. dBm time=..   ตอนกด LOG
+#   ----- After Save, JSON is: -----                   บรรทัดถัดไป = JSON ทั้งไฟล์
+#   ↩ UNDO: new JSON:                                  บรรทัดถัดไป = JSON ทั้งไฟล์หลัง undo
+#   🧹 SD: File cleared to []                          หลัง CLEAR
+
+_SERIAL_NUMBER = r"(-?\d+(?:\.\d+)?)"
+_SERIAL_STATUS = "----------- STATUS -----------"
+_SERIAL_RULE = re.compile(r"-{10,}")
+_SERIAL_GPS = re.compile(r"LAT=%s\s+LNG=%s\s+TIME=(.+)$" % (_SERIAL_NUMBER, _SERIAL_NUMBER))
+_SERIAL_SATS = re.compile(r"Sats=(\d+)")
+_SERIAL_DBM = re.compile(r"RF dBm=" + _SERIAL_NUMBER)
+_SERIAL_SAVE = re.compile(r"Will save point: lat=%s lng=%s rf=%s dBm time=(.+)$"
+                          % (_SERIAL_NUMBER, _SERIAL_NUMBER, _SERIAL_NUMBER))
+_SERIAL_DUMP = ("After Save, JSON is: -----", "UNDO: new JSON:")
+_SERIAL_CLEARED = "SD: File cleared to []"
+# บล็อก STATUS ปกติมี 4 บรรทัด ยาวเกินนี้ = ปิดบล็อกหาย (สายหลุด/ขยะ) ทิ้งบล็อกนั้น
+_SERIAL_STATUS_LINES = 8
+
+
+class SerialParser:
+    """แยก output ของ firmware ทีละบรรทัดแบบ incremental (ป้อน byte ก้อนขนาดเท่าไหร่ก็ได้)
+       feed() คืน list ของ event:
+       - ("status", {"fix", "lat", "lng", "time", "sats", "dbm"}) ตำแหน่ง/ค่าปัจจุบัน (ยังไม่ได้บันทึก)
+       - ("point", {"lat", "lng", "time", "dbm"})  จุดที่กด LOG
+       - ("file", [จุด, ...])                       ไฟล์บนการ์ดทั้งไฟล์หลัง LOG/UNDO ([] หลัง CLEAR)
+       ทนสัญญาณรบกวน: บรรทัดที่อ่านไม่ออก/JSON เสียข้ามไป, บรรทัดยาวเกิน max_line ทิ้งทั้งบรรทัด
+       หน่วยความจำไม่เกิน max_line ต่อ parser
+    """
+
+    def __init__(self, max_line=None):
+        self.max_line = max_line or SERIAL_MAX_LINE_BYTES
+        self._buf = bytearray()
+        self._skipping = False   # อยู่กลางบรรทัดที่ยาวเกิน ทิ้งจนถึง newline ถัดไป
+        self._status = None
+        self._status_lines = 0
+        self._expect_json = False
+        self.lines = 0
+        self.dropped = 0
+
+    def feed(self, data):
+        events = []
+        pieces = data.split(b"\n")
+        for i, piece in enumerate(pieces):
+            if not self._skipping:
+                if len(self._buf) + len(piece) > self.max_line:
+                    self._buf.clear()
+                    self._skipping = True
+                    self._expect_json = False
+                    self.dropped += 1
+                else:
+                    self._buf += piece
+            if i == len(pieces) - 1:
+                break
+            if self._skipping:
+                self._skipping = False
+                continue
+            line = self._buf.decode("utf-8", "replace").strip()
+            self._buf.clear()
+            self.lines += 1
+            event = self._line(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _line(self, line):
+        if self._expect_json:
+            self._expect_json = False
+            if line.startswith("["):
+                try:
+                    records = json.loads(line)
+                except ValueError:
+                    # เช่น JSON ที่ undo ของ firmware ตัดพัง -> ข้าม (DB ยังเป็นชุดก่อนหน้า)
+                    self.dropped += 1
+                    return None
+                return ("file", records) if isinstance(records, list) else None
+        if line.endswith(_SERIAL_STATUS):
+            self._status = {"fix": False}
+            self._status_lines = 0
+            return None
+        if self._status is not None:
+            event = self._status_line(line)
+            if event is not False:
+                return event
+
+        m = _SERIAL_SAVE.search(line)
+        if m:
+            return ("point", {"lat": float(m.group(1)), "lng": float(m.group(2)),
+                              "time": m.group(4).strip(), "dbm": float(m.group(3))})
+        if line.endswith(_SERIAL_DUMP):
+            self._expect_json = True
+        elif line.endswith(_SERIAL_CLEARED):
+            return ("file", [])
+        return None
+
+    def _status_line(self, line):
+        """บรรทัดในบล็อก STATUS -> event หรือ None, False = ไม่ใช่บรรทัดของบล็อก (ให้แยกแบบปกติต่อ)"""
+        status = self._status
+        self._status_lines += 1
+        if self._status_lines > _SERIAL_STATUS_LINES:
+            # เส้นปิดบล็อกหาย (สายหลุด/ขยะ) ทิ้งบล็อกนี้
+            self._status = None
+            self.dropped += 1
+            return False
+        m = _SERIAL_GPS.search(line)
+        if m:
+            status.update(fix=True, lat=float(m.group(1)), lng=float(m.group(2)),
+                          time=m.group(3).strip())
+            return None
+        m = _SERIAL_SATS.search(line)
+        if m:
+            status["sats"] = int(m.group(1))
+            return None
+        m = _SERIAL_DBM.search(line)
+        if m:
+            status["dbm"] = float(m.group(1))
+            return None
+        if _SERIAL_RULE.fullmatch(line):
+            self._status = None
+            return ("status", status) if "dbm" in status else None
+        # เช่น "GPS not fixed yet..." หรือบรรทัดอื่นที่มาก่อนเส้นปิดบล็อก
+        return False
+
+
+def open_serial(port, baud):
+    """เปิด serial port แบบ raw 8N1 ที่ baud นี้ (termios ไม่พึ่ง pyserial) คืน fd แบบ non-blocking"""
+    if termios is None:
+        raise OSError("serial ingest needs termios (Linux/macOS)")
+    speed = getattr(termios, "B%d" % baud, None)
+    if speed is None:
+        raise ValueError("unsupported baud rate: %d" % baud)
+    fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        attrs[2] |= termios.CLOCAL | termios.CREAD
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+class SerialIngest:
+    """thread อ่าน USB serial ของ ESP32 (SERIAL_PORT) แล้ว ingest จุดลง DB ทันทีที่กด LOG
+       - point/file -> sample_db ของ SERIAL_SESSION แล้วให้ SDWatcher sync store + ส่ง event append/reset
+         (ทางเดียวกับจุดจากการ์ด route ทุกตัวเห็นข้อมูลชุดเดียวกัน)
+       - status     -> event "live" ตำแหน่ง/dBm ปัจจุบันทุก ~1 วินาที (ไม่เก็บลง DB เพราะยังไม่ได้กด LOG)
+       สายหลุด/ESP32 reset -> ปิดแล้วเปิดใหม่ทุก SERIAL_RETRY_S
+       โหมดหลาย worker: เปิด port เฉพาะ leader (เหมือนการอ่านการ์ด) event "live" จึงไปถึงเฉพาะ
+       client ของ worker นั้น ส่วนจุดที่บันทึกแล้วทุก worker เห็นผ่าน DB ตามปกติ
+    """
+
+    def __init__(self, hub, watcher, port=SERIAL_PORT, baud=SERIAL_BAUD, session=SERIAL_SESSION):
+        self.hub = hub
+        self.watcher = watcher
+        self.port = port
+        self.baud = baud
+        self.session = session
+        self.parser = SerialParser()
+        self.connected = False
+        self.points = 0
+        self.live = None
+        self._error = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        if not self.port:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="serial-ingest", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """หยุด thread (ปิด port) ภายใน ~SERIAL_RETRY_S"""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout)
+
+    def status(self):
+        return {"port": self.port, "baud": self.baud, "connected": self.connected,
+                "points": self.points, "lines": self.parser.lines,
+                "dropped": self.parser.dropped, "live": self.live}
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.watcher.is_leader():
+                self._stop.wait(SERIAL_RETRY_S)
+                continue
+            try:
+                fd = open_serial(self.port, self.baud)
+            except (OSError, ValueError) as e:
+                self._warn(e)
+                self._stop.wait(SERIAL_RETRY_S)
+                continue
+            self._error = None
+            # เริ่มอ่านใหม่ทุกครั้งที่ต่อ ไม่เอาครึ่งบรรทัดจากรอบก่อนมาต่อกัน
+            self.parser = SerialParser()
+            self._set_connected(True)
+            try:
+                self._read(fd)
+            except Exception as e:
+                # สายหลุด (OSError) หรือเขียน DB ไม่ได้: ปิดแล้วต่อใหม่ thread ไม่ตาย
+                self._warn(e)
+            finally:
+                os.close(fd)
+                self._set_connected(False)
+            self._stop.wait(SERIAL_RETRY_S)
+
+    def _warn(self, e):
+        # port ไม่อยู่ก็ลองซ้ำทุก SERIAL_RETRY_S เตือนเฉพาะตอน error เปลี่ยน log จะได้ไม่ท่วม
+        if str(e) != self._error:
+            self._error = str(e)
+            app.logger.warning("serial ingest: %s", e)
+            record_error(e, "serial_ingest")
+
+    def _set_connected(self, connected):
+        if self.connected != connected:
+            self.connected = connected
+            self.hub.publish("status", self.watcher.status())
+
+    def _read(self, fd):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([fd], [], [], SERIAL_RETRY_S)
+            if not ready:
+                continue
+            try:
+                data = os.read(fd, 65536)
+            except BlockingIOError:
+                continue
+            if not data:
+                raise OSError("serial port closed")
+            self.handle(self.parser.feed(data))
+
+    def handle(self, events):
+        """ส่ง event จาก SerialParser: เขียน DB ให้เสร็จทั้งก้อนก่อน แล้ว sync/แจ้ง client ทีเดียว"""
+        changed = False
+        path = "serial:" + str(self.port)
+        for kind, value in events:
+            if kind == "status":
+                value["timestamp"] = time.time()
+                self.live = value
+                self.hub.publish("live", value)
+                continue
+            t0 = time.perf_counter()
+            if kind == "point":
+                sample_db.append(self.session, path, _records_to_db_rows([value]))
+                self.points += 1
+            else:
+                sample_db.replace(self.session, path, _records_to_db_rows(value))
+            metrics.observe("rf_db_write_duration_seconds", time.perf_counter() - t0, ("serial",))
+            changed = True
+        if changed:
+            self.watcher.notify([self.session])
+
+
+serial_ingest = SerialIngest(event_hub, sd_watcher)
+
+
+def _iter_events(q):
+    try:
+        # ส่งสถานะปัจจุบันก่อนเลย client จะได้ไม่ต้องรอ event แรก
+        yield "event: status\ndata: " + _dumps(sd_watcher.status()) + "\n\n"
+        while True:
+            try:
+                yield q.get(timeout=SSE_KEEPALIVE)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+    finally:
+        event_hub.unsubscribe(q)
 
-# ตำแหน่งตั้งต้นของแผนที่ (กรุงเทพฯประมาณนี้)
-DEFAULT_CENTER = {"lat": 13.7276, "lng": 100.7726, "zoom": 20}
 
 # ===============================
-# Helper functions
+# Request metrics
 # ===============================
-def is_sdcard_mounted():
-    """ตรวจว่า SD card ยัง mount อยู่และไฟล์ข้อมูลยังอยู่จริง"""
-    return os.path.ismount(SD_MOUNT_PATH) and os.path.exists(JSON_FILE_PATH)
+@metrics.collector
+def _runtime_metrics():
+    """ค่า ณ ตอน scrape: hit/miss ของแคชที่นับไว้อยู่แล้ว + ขนาดข้อมูลในหน่วยความจำ"""
+    counts = _cache_counts()
+    caches = {
+        "store": (counts["hits"], counts["misses"]),
+        "compressed": (_compressed.hits, _compressed.misses),
+        "tiles": (tile_cache.hits["memory"] + tile_cache.hits["disk"], tile_cache.misses),
+    }
+    store = _cache["store"]
+    return [
+        ("rf_cache_hits_total", "counter", "Cache hits.",
+         [((("cache", name),), hm[0]) for name, hm in caches.items()]),
+        ("rf_cache_misses_total", "counter", "Cache misses.",
+         [((("cache", name),), hm[1]) for name, hm in caches.items()]),
+        ("rf_cache_hit_ratio", "gauge", "Cache hits / lookups since start.",
+         [((("cache", name),), hm[0] / float(sum(hm)) if sum(hm) else 0.0)
+          for name, hm in caches.items()]),
+        ("rf_cache_bytes", "gauge", "Bytes held by each byte-bounded cache.",
+         [((("cache", "compressed"),), _compressed.size),
+          ((("cache", "tiles_memory"),), tile_cache.mem.size),
+          ((("cache", "tiles_disk"),), tile_cache._disk_size)]),
+        ("rf_store_points", "gauge", "Points in the in-memory store (all sessions).",
+         [((), len(store))]),
+        ("rf_store_bytes", "gauge", "Bytes allocated for the in-memory store columns.",
+         [((), store.nbytes())]),
+        ("rf_sdcard_mounted", "gauge", "1 if the watcher last saw the SD card with sample files.",
+         [((), 1 if sd_watcher.mounted else 0)]),
+        ("rf_sse_clients", "gauge", "Connected /events clients.",
+         [((), len(event_hub))]),
+    ]
 
-def read_measurements():
-    """อ่านไฟล์ JSON แล้วคืนลิสต์จุดวัด (list of dicts)
-       คาดว่าแต่ละอันเป็น {"lat":..,"lng":..,"dbm":..}
-    """
-    with open(JSON_FILE_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data
+
+def _metrics_route():
+    # ใช้ rule (เช่น /tiles/<int:z>/<int:x>/<int:y>.png) ไม่ใช่ path จริง label จะได้ไม่บาน
+    return request.url_rule.rule if request.url_rule is not None else "other"
+
+
+def _count_stream(chunks, route, t0, timed):
+    """นับ byte ของ response แบบ stream ตอนส่งจริง (และจับเวลาจนส่งครบ)"""
+    sent = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, bytes) or chunk.isascii():
+                sent += len(chunk)
+            else:
+                sent += len(chunk.encode())
+            yield chunk
+    finally:
+        metrics.inc("rf_http_response_bytes_total", (route,), sent)
+        if timed:
+            metrics.observe("rf_http_request_duration_seconds", time.perf_counter() - t0, (route,))
+
+
+@app.before_request
+def _metrics_start():
+    g.metrics_t0 = time.perf_counter()
+
+
+@app.after_request
+def _metrics_finish(resp):
+    t0 = g.pop("metrics_t0", None)
+    if t0 is None:
+        return resp
+    route = _metrics_route()
+    metrics.inc("rf_http_requests_total", (route, request.method, str(resp.status_code)))
+    if resp.is_streamed:
+        # SSE เปิดค้างไว้ตลอด ไม่นับเวลา ไม่งั้น histogram มีแต่ +Inf
+        timed = resp.mimetype != "text/event-stream"
+        resp.response = _count_stream(resp.response, route, t0, timed)
+    else:
+        metrics.inc("rf_http_response_bytes_total", (route,), resp.content_length or 0)
+        metrics.observe("rf_http_request_duration_seconds", time.perf_counter() - t0, (route,))
+    return resp
+
+
+def _metrics_exception(sender, exception, **extra):
+    record_error(exception)
+
+
+got_request_exception.connect(_metrics_exception, app)
 
 
 # ===============================
 # Routes
 # ===============================
 
-@app.route("/")
-def index():
+def render_index():
     # หน้าเว็บหลัก: ตอนนี้มี 2 tab (Map / Table)
-    html = f"""<!DOCTYPE html>
+    # ค่าในหน้ามาจาก config + static_assets เท่านั้น ไม่ขึ้นกับ request -> สร้างครั้งเดียวแล้วแคช (ดู index)
+    return f"""<!DOCTYPE html>
 <html lang="th">
 <head>
   <meta charset="utf-8" />
   <title>RF 2.4GHz - Heatmap</title>
   <meta name="viewport" content="width=device-width, initial-scale=1.0" />
 
-  <!-- Leaflet CSS/JS -->
+  <!-- Leaflet CSS/JS (ไฟล์ในเครื่อง static/vendor) -->
   <link
     rel="stylesheet"
-    href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"
-    integrity="sha256-p4NxAoJBhIIN+hmNHrzRCf9tD/miZyoHS5obTRR9BMY="
-    crossorigin=""
+    href="{static_assets.url("vendor/leaflet/leaflet.css")}"
+    integrity="{static_assets.integrity("vendor/leaflet/leaflet.css")}"
   />
   <script
-    src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"
-    integrity="sha256-20nQCchB9co0qIjJZRGuk2/Z9VM+kNiyxNV1lvTlZBo="
-    crossorigin=""
+    src="{static_assets.url("vendor/leaflet/leaflet.js")}"
+    integrity="{static_assets.integrity("vendor/leaflet/leaflet.js")}"
   ></script>
 
   <!-- Leaflet.heat -->
-  <script src="https://unpkg.com/leaflet.heat/dist/leaflet-heat.js"></script>
+  <script
+    src="{static_assets.url("vendor/leaflet.heat/leaflet-heat.js")}"
+    integrity="{static_assets.integrity("vendor/leaflet.heat/leaflet-heat.js")}"
+  ></script>
 
   <style>
     html, body {{
@@ -117,6 +4264,17 @@ def index():
     }}
 
     /* ปุ่ม reload */
+    /* เลือก session (ไฟล์บนการ์ด) */
+    #session-select {{
+      font-size: 13px;
+      background: #1f2937;
+      color: #fff;
+      border: 1px solid rgba(255,255,255,0.2);
+      border-radius: 8px;
+      padding: 6px 8px;
+      max-width: 14rem;
+    }}
+
     #reload-btn {{
       margin-left: auto;
       padding: 8px 12px;
@@ -249,6 +4407,44 @@ def index():
       color: #666;
     }}
 
+    /* แถบเลือกช่วงเวลา (เล่นย้อนการเดินวัด) กลางบน */
+    #time-panel {{
+      position: absolute;
+      top: 12px;
+      left: 50%;
+      transform: translateX(-50%);
+      display: flex;
+      align-items: center;
+      gap: 8px;
+      background: rgba(0,0,0,0.6);
+      color: #fff;
+      font-size: 12px;
+      padding: 6px 10px;
+      border-radius: 8px;
+      box-shadow: 0 2px 8px rgba(0,0,0,0.4);
+      z-index: 1000;
+      font-family: system-ui, sans-serif;
+    }}
+    #time-panel.hidden {{
+      display: none;
+    }}
+    #time-slider {{
+      width: 18rem;
+    }}
+    #time-panel button, #time-panel select {{
+      font-size: 12px;
+      background: #1f2937;
+      color: #fff;
+      border: 1px solid rgba(255,255,255,0.2);
+      border-radius: 6px;
+      padding: 3px 8px;
+      cursor: pointer;
+    }}
+    #time-label {{
+      font-family: monospace;
+      min-width: 11rem;
+    }}
+
     /* สถานะ SD card มุมล่างขวา */
     #sd-status {{
       position: absolute;
@@ -361,6 +4557,27 @@ def index():
       background: rgba(255,255,255,0.07);
     }}
 
+    /* ความสูงแถวคงที่ ให้ virtual scroll คำนวณตำแหน่งได้ (ต้องตรงกับ TABLE_ROW_H ใน JS) */
+    table.data-table tbody tr {{
+      height: 32px;
+    }}
+    table.data-table tbody tr.spacer,
+    table.data-table tbody tr.spacer:hover {{
+      background: none;
+    }}
+    table.data-table tbody tr.spacer td {{
+      padding: 0;
+      border: none;
+    }}
+
+    /* หัวตารางคลิกเพื่อ sort */
+    table.data-table th[data-sort] {{
+      cursor: pointer;
+      user-select: none;
+    }}
+    table.data-table th.sorted-asc::after {{ content: " ▲"; }}
+    table.data-table th.sorted-desc::after {{ content: " ▼"; }}
+
     .col-idx {{ color: #888; width: 3rem; }}
     .col-lat, .col-lng {{ color: #fff; }}
     .col-dbm {{ font-weight: 600; }}
@@ -378,6 +4595,11 @@ def index():
   <div id="topbar">
     <button class="tab-btn active" id="tab-map">Map</button>
     <button class="tab-btn" id="tab-table">Table</button>
+    <button class="tab-btn" id="mode-btn" title="สลับโหมดแสดงผลบนแผนที่">จุดดิบ</button>
+    <button class="tab-btn" id="time-btn" title="กรองตามเวลา / เล่นย้อนการเดินวัด">⏱ เวลา</button>
+    <select id="session-select" title="เลือก session (ไฟล์บนการ์ด)">
+      <option value="">ทุก session</option>
+    </select>
 
     <button id="reload-btn">🔄 Reload Data</button>
   </div>
@@ -422,6 +4644,20 @@ def index():
         </div>
       </div>
 
+      <!-- ช่วงเวลา: slider = เวลาสิ้นสุด, ช่วง = ย้อนไปนานเท่าไหร่ -->
+      <div id="time-panel" class="hidden">
+        <button id="time-play" title="เล่นย้อนการเดินวัด">▶</button>
+        <input type="range" id="time-slider" min="0" max="0" step="1" value="0"/>
+        <select id="time-window" title="แสดงจุดย้อนหลังจากเวลาที่เลือก">
+          <option value="">ตั้งแต่เริ่ม</option>
+          <option value="1m">1 นาที</option>
+          <option value="5m">5 นาที</option>
+          <option value="15m">15 นาที</option>
+          <option value="1h">1 ชั่วโมง</option>
+        </select>
+        <span id="time-label">--</span>
+      </div>
+
       <!-- สถานะ SD card -->
       <div id="sd-status">
         <div class="label">SD card:</div>
@@ -447,10 +4683,10 @@ def index():
         <table class="data-table">
           <thead>
             <tr>
-              <th class="col-idx">#</th>
-              <th class="col-lat">lat</th>
-              <th class="col-lng">lng</th>
-              <th class="col-dbm">dBm</th>
+              <th class="col-idx" data-sort="idx">#</th>
+              <th class="col-lat" data-sort="lat">lat</th>
+              <th class="col-lng" data-sort="lng">lng</th>
+              <th class="col-dbm" data-sort="dbm">dBm</th>
             </tr>
           </thead>
           <tbody id="table-body">
@@ -499,7 +4735,8 @@ def index():
   tabTableBtn.addEventListener("click", () => switchTo("table"));
 
   // =============== Map setup ===============
-  const map = L.map('map').setView(
+  // preferCanvas: marker ทุกตัววาดลง canvas แผ่นเดียว ไม่ใช่ 1 SVG element ต่อ marker
+  const map = L.map('map', {{ preferCanvas: true }}).setView(
     [{DEFAULT_CENTER["lat"]}, {DEFAULT_CENTER["lng"]}],
     {DEFAULT_CENTER["zoom"]}
   );
@@ -512,7 +4749,8 @@ def index():
 
   // Heat layer object (เราจะเซ็ตทีหลังตอนโหลดข้อมูล)
   let heatLayer = null;
-  let pointMarkers = [];
+  // marker ทั้งหมดอยู่ใน group เดียว ล้างทีเดียวด้วย clearLayers()
+  const markerLayer = L.layerGroup().addTo(map);
 
   // แปลง dBm -> intensity (0..1)
   // mapping ตาม legend: -110 (เย็น) → ต่ำ, -60 (ร้อน) → สูง
@@ -524,129 +4762,596 @@ def index():
     return 0.05 + x * 0.95; // boost นิดหน่อยให้มองเห็น
   }}
 
-  // วาดข้อมูลลง heatmap + จุด popup
-  function renderData(rawPoints) {{
-    // เคลียร์ของเดิม
-    if (heatLayer) {{
-      map.removeLayer(heatLayer);
+  // โหมดแสดงผล: "raw" = จุดดิบทั้งหมด, "grid" = รวมเป็นช่องจาก /data/grid
+  //             "tiles" = รูป heat ที่ server วาดให้ (/tiles) เบาสุด ไม่ขึ้นกับจำนวนจุด
+  let viewMode = "raw";
+  const VIEW_MODES = ["raw", "grid", "tiles"];
+  const VIEW_MODE_LABELS = {{ raw: "จุดดิบ", grid: "Grid", tiles: "Tiles" }};
+  let tileVersion = 0;   // เพิ่มเมื่อข้อมูลเปลี่ยน ให้ browser ขอ tile ชุดใหม่
+
+  // ลบ heatmap + marker เดิมออกจากแผนที่
+  function clearMapLayers() {{
+    if (heatLayer) {{
+      map.removeLayer(heatLayer);
+      heatLayer = null;
+    }}
+    markerLayer.clearLayers();
+  }}
+
+  // marker แบบ level of detail จาก /data/clusters (จำนวนต่อจอมีเพดาน ไม่ขึ้นกับจำนวนจุด)
+  // count=1 = จุดวัดจริง, มากกว่านั้น = cluster ยิ่งหลายจุดวงยิ่งใหญ่
+  function renderClusters(clusters) {{
+    markerLayer.clearLayers();
+    clusters.forEach(c => {{
+      const single = c.count === 1;
+      const marker = L.circleMarker([c.lat, c.lng], {{
+        radius: single ? 3 : Math.min(4 + 2 * Math.log2(c.count), 18),
+        weight: single ? 0 : 1,
+        fillOpacity: single ? 0.8 : 0.5
+      }})
+      .bindPopup(single
+        ? "<div style='font-size:11px; line-height:1.4;'>"
+          + "<b>dBm:</b> " + c.mean_dbm + "<br/>"
+          + "<b>lat:</b> " + c.lat + "<br/>"
+          + "<b>lng:</b> " + c.lng + "</div>"
+        : "<div style='font-size:11px; line-height:1.4;'>"
+          + "<b>points:</b> " + c.count + "<br/>"
+          + "<b>mean dBm:</b> " + c.mean_dbm + "<br/>"
+          + "<b>min dBm:</b> " + c.min_dbm + "<br/>"
+          + "<b>max dBm:</b> " + c.max_dbm + "</div>"
+      );
+      markerLayer.addLayer(marker);
+    }});
+  }}
+
+  // ถอด /data.bin -> คอลัมน์ typed array (layout ดู pack_points() ฝั่ง Python)
+  // header 48 byte แล้วตามด้วย float32: dlat[n], dlng[n], dbm[n], intensity[n]
+  function decodePoints(buf) {{
+    const dv = new DataView(buf);
+    const magic = String.fromCharCode(dv.getUint8(0), dv.getUint8(1), dv.getUint8(2), dv.getUint8(3));
+    if (magic !== "RFHM" || dv.getUint16(4, true) !== 1) {{
+      throw new Error("unknown /data.bin format");
+    }}
+    const headerSize = dv.getUint16(6, true);
+    const n = dv.getUint32(8, true);
+    return {{
+      n: n,
+      originLat: dv.getFloat64(16, true),
+      originLng: dv.getFloat64(24, true),
+      dlat: new Float32Array(buf, headerSize, n),
+      dlng: new Float32Array(buf, headerSize + 4 * n, n),
+      dbm: new Float32Array(buf, headerSize + 8 * n, n),
+      intensity: new Float32Array(buf, headerSize + 12 * n, n)
+    }};
+  }}
+
+  // วาดข้อมูลลง heatmap (pts = ผลจาก decodePoints) marker มาจาก renderClusters
+  function renderData(pts) {{
+    // เคลียร์ของเดิม
+    clearMapLayers();
+
+    // เตรียมข้อมูล heatmap
+    const heatArray = new Array(pts.n);
+    for (let i = 0; i < pts.n; i++) {{
+      heatArray[i] = [pts.originLat + pts.dlat[i], pts.originLng + pts.dlng[i], pts.intensity[i]];
+    }}
+    heatLayer = L.heatLayer(heatArray, {{
+      radius: 28,
+      blur: 18,
+      maxZoom: 17
+    }}).addTo(map);
+  }}
+
+  // วาดช่อง grid ที่ server รวมมาให้แล้ว (1 ช่อง = 1 จุด heat + 1 marker)
+  function renderGrid(cells) {{
+    clearMapLayers();
+
+    const heatArray = cells.map(c => [c.lat, c.lng, c.intensity]);
+    heatLayer = L.heatLayer(heatArray, {{
+      radius: 28,
+      blur: 18,
+      maxZoom: 17
+    }}).addTo(map);
+
+    cells.forEach(c => {{
+      const marker = L.circleMarker([c.lat, c.lng], {{
+        radius: 4,
+        weight: 0,
+        fillOpacity: 0.8
+      }})
+      .bindPopup(
+        "<div style='font-size:11px; line-height:1.4;'>"
+        + "<b>points:</b> " + c.count + "<br/>"
+        + "<b>mean dBm:</b> " + c.mean_dbm + "<br/>"
+        + "<b>max dBm:</b> " + c.max_dbm + "</div>"
+      )
+      markerLayer.addLayer(marker);
+    }});
+  }}
+
+  // ======== SESSIONS ========
+  // 1 ไฟล์ *.json บนการ์ด = 1 session ("" = รวมทุก session)
+  const sessionSelect = document.getElementById("session-select");
+  let currentSession = "";
+
+  function sessionParam() {{
+    return currentSession ? '&session=' + encodeURIComponent(currentSession) : '';
+  }}
+
+  async function loadSessions() {{
+    try {{
+      const res = await fetch('/sessions');
+      const list = await res.json();
+      if (!Array.isArray(list)) {{
+        return;
+      }}
+      sessionSelect.innerHTML = "";
+      sessionSelect.add(new Option("ทุก session", ""));
+      list.forEach(s => {{
+        sessionSelect.add(new Option(s.name + " (" + s.points + ")", s.name));
+      }});
+      sessionSelect.value = currentSession;
+      if (sessionSelect.value !== currentSession) {{
+        // session ที่เลือกอยู่หายไปแล้ว กลับไปดูทั้งหมด
+        currentSession = "";
+        sessionSelect.value = "";
+      }}
+    }} catch (e) {{
+      console.warn("⚠ /sessions error:", e);
+    }}
+  }}
+
+  sessionSelect.addEventListener("change", async () => {{
+    currentSession = sessionSelect.value;
+    stopTimePlayer();
+    timeRange = null;
+    await loadTimeRange();
+    await fetchData();
+    refreshTableIfVisible();
+  }});
+
+  // ======== TIME RANGE ========
+  // เปิดแถบเวลาแล้ว ทุก request แนบ to= (ตำแหน่ง slider) และ from= / last= (ช่วงย้อนหลัง)
+  // จุดที่ไม่มีเวลา (GPS ยังไม่ได้วันที่) จะไม่แสดงตอนกรองเวลา
+  const timeButton = document.getElementById("time-btn");
+  const timePanel = document.getElementById("time-panel");
+  const timeSlider = document.getElementById("time-slider");
+  const timeWindow = document.getElementById("time-window");
+  const timeLabel = document.getElementById("time-label");
+  const timePlay = document.getElementById("time-play");
+  let timeRange = null;     // ผลของ /timerange
+  let timePlayer = null;
+  let timeFetching = false;
+
+  function timeActive() {{
+    return !timePanel.classList.contains("hidden") && timeRange !== null
+           && timeRange.first !== null;
+  }}
+
+  function timeParam() {{
+    if (!timeActive()) {{
+      return '';
+    }}
+    const to = '&to=' + timeSlider.value;
+    return timeWindow.value ? to + '&last=' + timeWindow.value
+                            : to + '&from=' + timeRange.first;
+  }}
+
+  function formatUTC(epoch) {{
+    return new Date(epoch * 1000).toISOString().replace("T", " ").slice(0, 19) + " UTC";
+  }}
+
+  function showTimeLabel() {{
+    timeLabel.textContent = timeActive() ? formatUTC(Number(timeSlider.value))
+                                         : "ไม่มีจุดที่มีเวลา";
+  }}
+
+  // อ่านช่วงเวลาใหม่ (เปลี่ยน session / ข้อมูลเข้ามาใหม่) slider อยู่ท้ายสุดก็ตามไปท้ายสุดต่อ
+  async function loadTimeRange() {{
+    if (timePanel.classList.contains("hidden")) {{
+      return;
+    }}
+    try {{
+      const res = await fetch('/timerange?' + sessionParam().slice(1));
+      const info = await res.json();
+      if (info.error) {{
+        return;
+      }}
+      const following = timeRange === null
+                        || Number(timeSlider.value) >= Number(timeSlider.max);
+      timeRange = info;
+      if (info.first !== null) {{
+        timeSlider.min = info.first;
+        timeSlider.max = info.last;
+        if (following) {{
+          timeSlider.value = info.last;
+        }}
+      }}
+      showTimeLabel();
+    }} catch (e) {{
+      console.warn("⚠ /timerange error:", e);
+    }}
+  }}
+
+  async function applyTimeRange() {{
+    showTimeLabel();
+    if (timeFetching) {{
+      return;   // ระหว่างลาก slider ไม่ยิง request ซ้อนกัน
+    }}
+    timeFetching = true;
+    try {{
+      await fetchData();
+      refreshTableIfVisible();
+    }} finally {{
+      timeFetching = false;
+    }}
+  }}
+
+  function stopTimePlayer() {{
+    if (timePlayer !== null) {{
+      clearInterval(timePlayer);
+      timePlayer = null;
+      timePlay.textContent = "▶";
+    }}
+  }}
+
+  timeButton.addEventListener("click", async () => {{
+    timePanel.classList.toggle("hidden");
+    timeButton.classList.toggle("active", !timePanel.classList.contains("hidden"));
+    stopTimePlayer();
+    timeRange = null;
+    await loadTimeRange();
+    await applyTimeRange();
+  }});
+  timeSlider.addEventListener("input", applyTimeRange);
+  timeSlider.addEventListener("change", applyTimeRange);
+  timeWindow.addEventListener("change", applyTimeRange);
+
+  // เล่นย้อน: เลื่อน slider จากต้นจนจบใน ~200 ก้าว
+  timePlay.addEventListener("click", () => {{
+    if (timePlayer !== null || !timeActive()) {{
+      stopTimePlayer();
+      return;
+    }}
+    const min = Number(timeSlider.min), max = Number(timeSlider.max);
+    if (Number(timeSlider.value) >= max) {{
+      timeSlider.value = min;
+    }}
+    const step = Math.max(1, Math.ceil((max - min) / 200));
+    timePlay.textContent = "⏸";
+    timePlayer = setInterval(() => {{
+      if (timeFetching) {{
+        return;   // รอรอบก่อนวาดเสร็จ
+      }}
+      timeSlider.value = Math.min(max, Number(timeSlider.value) + step);
+      applyTimeRange();
+      if (Number(timeSlider.value) >= max) {{
+        stopTimePlayer();
+      }}
+    }}, 150);
+  }});
+
+  // โหลดช่อง grid เฉพาะ viewport ปัจจุบัน
+  async function fetchGrid() {{
+    const url = '/data/grid?bbox=' + map.getBounds().toBBoxString()
+              + '&zoom=' + map.getZoom() + sessionParam() + timeParam();
+    const res = await fetch(url);
+    const grid = await res.json();
+    if (grid.error) {{
+      console.warn("⚠ /data/grid error:", grid.error);
+      clearMapLayers();
+      return [];
+    }}
+    renderGrid(grid.cells);
+    return grid.cells;
+  }}
+
+  // marker แบบ cluster ของ viewport (ขยายขอบเท่ากับที่ขอ heat)
+  async function fetchClusters(bbox) {{
+    const url = '/data/clusters?bbox=' + bbox + '&zoom=' + map.getZoom()
+              + sessionParam() + timeParam();
+    try {{
+      const res = await fetch(url);
+      const info = await res.json();
+      if (info.error) {{
+        console.warn("⚠ /data/clusters error:", info.error);
+        return [];
+      }}
+      return info.clusters;
+    }} catch (e) {{
+      console.warn("⚠ /data/clusters failed:", e);
+      return [];
+    }}
+  }}
+
+  // จุดใหม่จาก SSE: รวมหลาย event ติดกันเป็นการโหลด cluster ครั้งเดียว
+  let clusterRefresh = null;
+  function scheduleClusterRefresh() {{
+    if (clusterRefresh !== null) {{
+      return;
+    }}
+    clusterRefresh = setTimeout(async () => {{
+      clusterRefresh = null;
+      if (viewMode === "raw") {{
+        const clusters = await fetchClusters(map.getBounds().pad(0.5).toBBoxString());
+        if (viewMode === "raw") {{
+          renderClusters(clusters);
+        }}
+      }}
+    }}, 1000);
+  }}
+
+  // heat เป็น tile PNG จาก server (L.tileLayer ธรรมดา)
+  function showTiles() {{
+    const url = '/tiles/{{z}}/{{x}}/{{y}}.png?v=' + tileVersion + sessionParam() + timeParam();
+    if (heatLayer instanceof L.TileLayer) {{
+      heatLayer.setUrl(url);   // URL เดิม Leaflet ไม่โหลดใหม่
+      return;
+    }}
+    clearMapLayers();
+    heatLayer = L.tileLayer(url, {{
+      maxZoom: {TILE_MAX_ZOOM},
+      tileSize: {TILE_SIZE}
+    }}).addTo(map);
+  }}
+
+  // โหลดข้อมูลจาก Flask สำหรับแผนที่
+  async function fetchData() {{
+    if (viewMode === "grid") {{
+      return fetchGrid();
+    }}
+    if (viewMode === "tiles") {{
+      showTiles();
+      return null;
+    }}
+
+    // ขอเฉพาะจุดใน viewport (ขยายขอบออกไปครึ่งจอ เลื่อนนิดหน่อยจะได้ไม่โหล่ง)
+    // ใช้ /data.bin (typed array) แทน JSON ประหยัดทั้งขนาดและเวลา parse
+    const bbox = map.getBounds().pad(0.5).toBBoxString();
+    const clusters = fetchClusters(bbox);
+    const res = await fetch('/data.bin?bbox=' + bbox + sessionParam() + timeParam());
+    if (!res.ok) {{
+      const err = await res.json().catch(() => ({{ error: res.statusText }}));
+      console.warn("⚠ /data.bin error:", err.error);
+      // เคลียร์ heatmap ถ้ามี
+      clearMapLayers();
+      return null;
+    }}
+    const pts = decodePoints(await res.arrayBuffer());
+    renderData(pts);
+    renderClusters(await clusters);
+    return pts;
+  }}
+
+  // โหลดใหม่ทุกครั้งที่เลื่อน/ซูมแผนที่ (ทั้ง 2 โหมดขอเฉพาะ viewport)
+  map.on("moveend", () => {{
+    fetchData();
+  }});
+
+  // ปุ่มสลับโหมด จุดดิบ -> Grid -> Tiles
+  const modeButton = document.getElementById("mode-btn");
+  modeButton.addEventListener("click", async () => {{
+    viewMode = VIEW_MODES[(VIEW_MODES.indexOf(viewMode) + 1) % VIEW_MODES.length];
+    modeButton.textContent = VIEW_MODE_LABELS[viewMode];
+    modeButton.classList.toggle("active", viewMode !== "raw");
+    await fetchData();
+  }});
+
+  // ======== TABLE (virtual scroll) ========
+  // วาดเฉพาะแถวที่มองเห็น + โหลดข้อมูลจาก /tabledata ทีละหน้า
+  // เปิด tab ได้เร็วเท่ากันไม่ว่าไฟล์จะมีกี่จุด
+  const TABLE_ROW_H = 32;   // ต้องตรงกับ CSS "table.data-table tbody tr"
+  const TABLE_PAGE = 200;   // จำนวนแถวต่อการ fetch 1 ครั้ง
+  const TABLE_OVERSCAN = 10;
+
+  const tableScroll = document.getElementById("table-scroll");
+  const tableState = {{
+    sort: "idx",
+    order: "asc",
+    total: 0,
+    pages: new Map(),     // page no. -> rows
+    loading: new Set(),   // page no. ที่กำลังโหลด
+    gen: 0                // เปลี่ยนทุกครั้งที่เริ่มใหม่ ทิ้ง response เก่าที่มาช้า
+  }};
+
+  function nowHMS() {{
+    const now = new Date();
+    const hh = String(now.getHours()).padStart(2,"0");
+    const mm = String(now.getMinutes()).padStart(2,"0");
+    const ss = String(now.getSeconds()).padStart(2,"0");
+    return hh+":"+mm+":"+ss;
+  }}
+
+  function tableMessage(color, text) {{
+    const tbody = document.getElementById("table-body");
+    tbody.innerHTML = "<tr><td colspan='4' style='color:" + color + ";padding:12px;'>"
+                    + text + "</td></tr>";
+  }}
+
+  // โหลด 1 หน้า คืน response (หรือ null ถ้าถูกยกเลิกเพราะเริ่มใหม่แล้ว)
+  async function loadTablePage(pageNo) {{
+    const gen = tableState.gen;
+    tableState.loading.add(pageNo);
+    try {{
+      const url = '/tabledata?offset=' + (pageNo * TABLE_PAGE)
+                + '&limit=' + TABLE_PAGE
+                + '&sort=' + tableState.sort
+                + '&order=' + tableState.order
+                + sessionParam() + timeParam();
+      const res = await fetch(url);
+      const page = await res.json();
+      if (gen !== tableState.gen) {{
+        return null;
+      }}
+      if (!page.error) {{
+        tableState.total = page.total;
+        tableState.pages.set(pageNo, page.rows);
+      }}
+      return page;
+    }} finally {{
+      if (gen === tableState.gen) {{
+        tableState.loading.delete(pageNo);
+      }}
+    }}
+  }}
+
+  function makeSpacer(height) {{
+    const tr = document.createElement("tr");
+    tr.className = "spacer";
+    tr.style.height = height + "px";
+    const td = document.createElement("td");
+    td.colSpan = 4;
+    tr.appendChild(td);
+    return tr;
+  }}
+
+  function makeRow(r) {{
+    const tr = document.createElement("tr");
+    const cells = [
+      ["col-idx", r ? r.idx : "…"],
+      ["col-lat", r ? r.lat : ""],
+      ["col-lng", r ? r.lng : ""],
+      ["col-dbm", r ? r.dbm : ""]
+    ];
+    cells.forEach(([cls, text]) => {{
+      const td = document.createElement("td");
+      td.className = cls;
+      td.textContent = text;
+      tr.appendChild(td);
+    }});
+    return tr;
+  }}
+
+  // วาดเฉพาะช่วงที่อยู่ใน viewport ของ #table-scroll (+ เผื่อบน/ล่างนิดหน่อย)
+  function renderTableWindow() {{
+    const total = tableState.total;
+    const first = Math.max(0, Math.floor(tableScroll.scrollTop / TABLE_ROW_H) - TABLE_OVERSCAN);
+    const visible = Math.ceil(tableScroll.clientHeight / TABLE_ROW_H) + 2 * TABLE_OVERSCAN;
+    const last = Math.min(total, first + visible);
+
+    const frag = document.createDocumentFragment();
+    frag.appendChild(makeSpacer(first * TABLE_ROW_H));
+    for (let i = first; i < last; i++) {{
+      const rows = tableState.pages.get(Math.floor(i / TABLE_PAGE));
+      frag.appendChild(makeRow(rows ? rows[i % TABLE_PAGE] : null));
+    }}
+    frag.appendChild(makeSpacer((total - last) * TABLE_ROW_H));
+
+    const tbody = document.getElementById("table-body");
+    tbody.replaceChildren(frag);
+
+    // หน้าไหนยังไม่มีก็โหลดมา แล้ววาดใหม่
+    const firstPage = Math.floor(first / TABLE_PAGE);
+    const lastPage = Math.floor(Math.max(first, last - 1) / TABLE_PAGE);
+    for (let pg = firstPage; pg <= lastPage; pg++) {{
+      if (!tableState.pages.has(pg) && !tableState.loading.has(pg)) {{
+        loadTablePage(pg).then(page => {{
+          if (page && !page.error) {{
+            renderTableWindow();
+          }}
+        }});
+      }}
     }}
-    pointMarkers.forEach(m => map.removeLayer(m));
-    pointMarkers = [];
+  }}
 
-    if (!Array.isArray(rawPoints)) {{
+  let tableRenderQueued = false;
+  tableScroll.addEventListener("scroll", () => {{
+    if (tableRenderQueued) {{
       return;
     }}
+    tableRenderQueued = true;
+    requestAnimationFrame(() => {{
+      tableRenderQueued = false;
+      renderTableWindow();
+    }});
+  }});
 
-    // เตรียมข้อมูล heatmap
-    const heatArray = rawPoints.map(p => [p.lat, p.lng, dbmToIntensity(p.dbm)]);
-    heatLayer = L.heatLayer(heatArray, {{
-      radius: 28,
-      blur: 18,
-      maxZoom: 17
-    }}).addTo(map);
-
-    // จุดวัดจริงเล็ก ๆ + popup
-    rawPoints.forEach(p => {{
-      const marker = L.circleMarker([p.lat, p.lng], {{
-        radius: 3,
-        weight: 0,
-        fillOpacity: 0.8
-      }})
-      .bindPopup(
-        "<div style='font-size:11px; line-height:1.4;'>"
-        + "<b>dBm:</b> " + p.dbm + "<br/>"
-        + "<b>lat:</b> " + p.lat + "<br/>"
-        + "<b>lng:</b> " + p.lng + "</div>"
-      )
-      .addTo(map);
-
-      pointMarkers.push(marker);
+  function updateSortHeaders() {{
+    document.querySelectorAll("table.data-table th[data-sort]").forEach(th => {{
+      th.classList.toggle("sorted-asc", th.dataset.sort === tableState.sort && tableState.order === "asc");
+      th.classList.toggle("sorted-desc", th.dataset.sort === tableState.sort && tableState.order === "desc");
     }});
   }}
 
-  // โหลดข้อมูลจาก Flask สำหรับแผนที่
-  async function fetchData() {{
-    const res = await fetch('/data');
-    const data = await res.json();
-    if (data.error) {{
-      console.warn("⚠ /data error:", data.error);
-      // เคลียร์ heatmap ถ้ามี
-      if (heatLayer) {{
-        map.removeLayer(heatLayer);
-        heatLayer = null;
+  // คลิกหัวคอลัมน์ -> sort (คลิกซ้ำ = สลับ asc/desc)
+  document.querySelectorAll("table.data-table th[data-sort]").forEach(th => {{
+    th.addEventListener("click", () => {{
+      if (tableState.sort === th.dataset.sort) {{
+        tableState.order = (tableState.order === "asc") ? "desc" : "asc";
+      }} else {{
+        tableState.sort = th.dataset.sort;
+        tableState.order = "asc";
       }}
-      pointMarkers.forEach(m => map.removeLayer(m));
-      pointMarkers = [];
-      return [];
-    }}
-    renderData(data);
-    return data;
-  }}
+      populateTable();
+    }});
+  }});
 
   // โหลดข้อมูลแบบตาราง (สำหรับ tab Table)
   async function populateTable() {{
-    const tbody = document.getElementById("table-body");
     const rowCountEl = document.getElementById("row-count");
     const tableTimeEl = document.getElementById("table-time");
 
-    tbody.innerHTML = "<tr><td colspan='4' style='color:#999;padding:12px;'>Loading...</td></tr>";
+    // เริ่มใหม่: ล้างหน้าเก่าทั้งหมด
+    tableState.gen += 1;
+    tableState.pages = new Map();
+    tableState.loading = new Set();
+    tableState.total = 0;
+    updateSortHeaders();
+
+    tableMessage("#999", "Loading...");
 
     try {{
-      const res = await fetch('/tabledata');
-      const rows = await res.json();
+      const firstPage = Math.floor(tableScroll.scrollTop / TABLE_ROW_H / TABLE_PAGE);
+      const page = await loadTablePage(firstPage);
+      if (!page) {{
+        return;
+      }}
 
-      if (rows.error) {{
-        tbody.innerHTML = "<tr><td colspan='4' style='color:#f87171;padding:12px;'>"
-                        + "Error: " + rows.error + "</td></tr>";
+      if (page.error) {{
+        tableMessage("#f87171", "Error: " + page.error);
         rowCountEl.textContent = "0";
         tableTimeEl.textContent = "--:--:--";
         return;
       }}
 
-      // เติมตารางใหม่
-      tbody.innerHTML = "";
-      rows.forEach(r => {{
-        const tr = document.createElement("tr");
-
-        const tdIdx = document.createElement("td");
-        tdIdx.className = "col-idx";
-        tdIdx.textContent = r.idx;
-        tr.appendChild(tdIdx);
-
-        const tdLat = document.createElement("td");
-        tdLat.className = "col-lat";
-        tdLat.textContent = r.lat;
-        tr.appendChild(tdLat);
-
-        const tdLng = document.createElement("td");
-        tdLng.className = "col-lng";
-        tdLng.textContent = r.lng;
-        tr.appendChild(tdLng);
-
-        const tdDbm = document.createElement("td");
-        tdDbm.className = "col-dbm";
-        tdDbm.textContent = r.dbm;
-        tr.appendChild(tdDbm);
-
-        tbody.appendChild(tr);
-      }});
+      renderTableWindow();
 
       // อัปเดต meta
-      rowCountEl.textContent = rows.length;
-      const now = new Date();
-      const hh = String(now.getHours()).padStart(2,"0");
-      const mm = String(now.getMinutes()).padStart(2,"0");
-      const ss = String(now.getSeconds()).padStart(2,"0");
-      tableTimeEl.textContent = hh+":"+mm+":"+ss;
+      rowCountEl.textContent = tableState.total;
+      tableTimeEl.textContent = nowHMS();
 
     }} catch(e) {{
-      tbody.innerHTML = "<tr><td colspan='4' style='color:#facc15;padding:12px;'>"
-                      + "⚠ Failed to load table: "+e+"</td></tr>";
+      tableMessage("#facc15", "⚠ Failed to load table: " + e);
       rowCountEl.textContent = "0";
       tableTimeEl.textContent = "--:--:--";
     }}
   }}
 
+  // แสดงสถานะ SD card (info = {{mounted, points}} จาก /sdstatus หรือ event "status")
+  function showSDStatus(info) {{
+    const stateEl = document.getElementById("sd-state");
+    const timeEl = document.getElementById("sd-time");
+
+    timeEl.textContent = nowHMS();
+
+    if (info.mounted) {{
+      stateEl.textContent = "ONLINE ✓  (" + info.points + " points)";
+      stateEl.style.color = "#4ade80"; // เขียว
+    }} else if (info.points > 0) {{
+      // ถอดการ์ดแล้ว แต่ยังมีข้อมูลที่ ingest ไว้ในเครื่อง
+      stateEl.textContent = "OFFLINE ✗  (" + info.points + " points cached)";
+      stateEl.style.color = "#facc15"; // เหลือง
+    }} else {{
+      stateEl.textContent = "OFFLINE ✗  (no card)";
+      stateEl.style.color = "#f87171"; // แดง
+    }}
+    if (info.serial && info.serial.connected) {{
+      // ESP32 ต่อสาย USB อยู่: จุดที่กด LOG เข้ามาเองไม่ต้องถอดการ์ด
+      stateEl.textContent += "  · LIVE serial";
+      stateEl.style.color = "#4ade80";
+    }}
+  }}
+
   // อัปเดตสถานะ SD card
   async function updateSDStatus() {{
     const stateEl = document.getElementById("sd-state");
@@ -655,20 +5360,7 @@ def index():
     try {{
       const res = await fetch('/sdstatus');
       const info = await res.json();
-
-      const now = new Date();
-      const hh = String(now.getHours()).padStart(2,"0");
-      const mm = String(now.getMinutes()).padStart(2,"0");
-      const ss = String(now.getSeconds()).padStart(2,"0");
-      timeEl.textContent = hh+":"+mm+":"+ss;
-
-      if (info.mounted) {{
-        stateEl.textContent = "ONLINE ✓  (" + info.points + " points)";
-        stateEl.style.color = "#4ade80"; // เขียว
-      }} else {{
-        stateEl.textContent = "OFFLINE ✗  (no card)";
-        stateEl.style.color = "#f87171"; // แดง
-      }}
+      showSDStatus(info);
     }} catch (e) {{
       stateEl.textContent = "UNKNOWN ?";
       stateEl.style.color = "#facc15"; // เหลือง
@@ -676,6 +5368,126 @@ def index():
     }}
   }}
 
+  // จุดใหม่จาก event "append": เติมเข้า heat layer ทีละจุด ไม่ต้องโหลดใหม่ทั้งหมด
+  function appendPoints(rows) {{
+    if (viewMode === "grid") {{
+      // grid ต้องให้ server รวมช่องใหม่
+      fetchGrid();
+      return;
+    }}
+    if (viewMode === "tiles") {{
+      tileVersion += 1;
+      showTiles();
+      return;
+    }}
+    const bounds = map.getBounds().pad(0.5);
+    let added = false;
+    rows.forEach(p => {{
+      if (p.lat === null || p.lng === null || !bounds.contains([p.lat, p.lng])) {{
+        return;
+      }}
+      if (heatLayer) {{
+        heatLayer.addLatLng([p.lat, p.lng, dbmToIntensity(p.dbm)]);
+      }}
+      added = true;
+    }});
+    // marker: ให้ server รวม cluster ใหม่ (จุดใหม่อาจเข้า cluster เดิม)
+    if (added) {{
+      scheduleClusterRefresh();
+    }}
+  }}
+
+  // ตาราง: มีข้อมูลเปลี่ยนแล้วเปิดอยู่ก็โหลดใหม่
+  function refreshTableIfVisible() {{
+    if (tabTableBtn.classList.contains("active")) {{
+      populateTable();
+    }}
+  }}
+
+  // ======== LIVE UPDATES (SSE) ========
+  // ใช้ /events แทนการ poll /sdstatus ถ้า browser/เครือข่ายใช้ไม่ได้ค่อยกลับไป poll ทุก 5 วินาที
+  let statusPoll = null;
+
+  function startStatusPolling() {{
+    if (statusPoll === null) {{
+      statusPoll = setInterval(updateSDStatus, 5000);
+    }}
+  }}
+
+  function stopStatusPolling() {{
+    if (statusPoll !== null) {{
+      clearInterval(statusPoll);
+      statusPoll = null;
+    }}
+  }}
+
+  // ตำแหน่ง/dBm ปัจจุบันของ ESP32 ทาง USB serial (event "live" ~ทุก 1 วินาที) ยังไม่ใช่จุดที่บันทึก
+  // อยู่นอก markerLayer จะได้ไม่หายตอนวาดข้อมูลใหม่
+  let liveMarker = null;
+
+  function showLive(s) {{
+    if (!s.fix) {{
+      if (liveMarker) {{
+        map.removeLayer(liveMarker);
+        liveMarker = null;
+      }}
+      return;
+    }}
+    const html = "<div style='font-size:11px; line-height:1.4;'>"
+      + "<b>LIVE dBm:</b> " + s.dbm + "<br/>"
+      + "<b>time:</b> " + s.time + "<br/>"
+      + "<b>sats:</b> " + (s.sats ?? "-") + "</div>";
+    if (!liveMarker) {{
+      liveMarker = L.circleMarker([s.lat, s.lng], {{
+        radius: 8,
+        color: "#2563eb",
+        weight: 2,
+        fillOpacity: 0.9
+      }}).bindPopup(html).addTo(map);
+    }} else {{
+      liveMarker.setLatLng([s.lat, s.lng]).setPopupContent(html);
+    }}
+  }}
+
+  function connectEvents() {{
+    if (!window.EventSource) {{
+      startStatusPolling();
+      return;
+    }}
+    const es = new EventSource('/events');
+    es.onopen = () => stopStatusPolling();
+    es.onerror = () => startStatusPolling();   // EventSource ต่อใหม่เองอัตโนมัติ
+
+    es.addEventListener("status", ev => {{
+      showSDStatus(JSON.parse(ev.data));
+    }});
+    es.addEventListener("append", async ev => {{
+      const info = JSON.parse(ev.data);
+      loadSessions();
+      if (!currentSession && !timeActive()) {{
+        appendPoints(info.rows);
+      }} else if (!currentSession || info.sessions.includes(currentSession)) {{
+        // แถวใน event เป็นของชุดรวม ดู session เดียว / กรองเวลาอยู่ ก็ให้ server กรองแล้วโหลดใหม่
+        tileVersion += 1;
+        await loadTimeRange();
+        fetchData();
+      }} else {{
+        return;
+      }}
+      refreshTableIfVisible();
+    }});
+    es.addEventListener("live", ev => {{
+      showLive(JSON.parse(ev.data));
+    }});
+    es.addEventListener("reset", async () => {{
+      tileVersion += 1;
+      await loadSessions();
+      await loadTimeRange();
+      await fetchData();
+      refreshTableIfVisible();
+    }});
+  }}
+
   // ปุ่ม Reload → เรียก /reload แล้วรีเฟรชข้อมูล map/table/status
   const reloadButton = document.getElementById("reload-btn");
   reloadButton.addEventListener("click", async () => {{
@@ -686,6 +5498,9 @@ def index():
 
       if (info.status === "ok") {{
         alert(`✅ Reload success — ${{info.count}} points loaded!`);
+        tileVersion += 1;
+        await loadSessions();
+        await loadTimeRange();
         await fetchData();
         await updateSDStatus();
 
@@ -704,40 +5519,424 @@ def index():
   }});
 
   // --- เรียกครั้งแรกตอนโหลดหน้า ---
+  await loadSessions();
   await fetchData();
   await updateSDStatus();
 
-  // อัปเดตสถานะ SD card ทุก ๆ 5 วินาที
-  setInterval(updateSDStatus, 5000);
+  // อัปเดตสถานะ SD card + จุดใหม่แบบ real-time
+  connectEvents();
 
 }})();
 </script>
 
 </body>
 </html>"""
-    return Response(html, mimetype="text/html")
+
+
+# หน้าเว็บที่ render แล้ว + ETag + ตัวบีบอัด ต่อชุด config (config เปลี่ยนตอน restart เท่านั้น จึงมีแค่ชุดเดียว)
+_index_cache = {}
+
+
+def _index_page():
+    key = (static_assets.version, DEFAULT_CENTER["lat"], DEFAULT_CENTER["lng"],
+           DEFAULT_CENTER["zoom"], TILE_MAX_ZOOM, TILE_SIZE)
+    page = _index_cache.get(key)
+    if page is None:
+        raw = render_index().encode()
+        page = {"raw": raw, "etag": hashlib.sha1(raw).hexdigest()[:24],
+                "gzip": zlib.compress(raw, 9, wbits=31)}
+        if brotli is not None:
+            page["br"] = brotli.compress(raw, quality=11)
+        _index_cache.clear()
+        _index_cache[key] = page
+    return page
+
+
+@app.route("/")
+def index():
+    page = _index_page()
+    # no-cache = แคชได้แต่ต้องถามทุกครั้ง หน้าเล็กตอบ 304 ได้ทันที แต่ได้ asset version ใหม่เสมอหลังอัปเดต
+    headers = {"ETag": '"%s"' % page["etag"], "Vary": "Accept-Encoding",
+               "Cache-Control": "no-cache"}
+    if _not_modified(page["etag"], None):
+        return Response(status=304, headers=headers)
+    encoding = _pick_encoding()
+    resp = Response(page[encoding] if encoding else page["raw"], mimetype="text/html")
+    resp.headers.update(headers)
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    return resp
+
+
+@app.route("/assets/<version>/<path:name>")
+def asset(version, name):
+    resp = static_assets.response(version, name)
+    if resp is None:
+        return jsonify({"error": "asset not found"}), 404
+    return resp
 
 
 @app.route("/data")
+@conditional_data
 def data():
     """
-    คืนข้อมูลจุดวัดสำหรับ heatmap
-    ถ้า SD card ไม่เจอ -> ส่ง error
+    คืนข้อมูลจุดวัดสำหรับ heatmap (จาก DB ในเครื่อง ถอดการ์ดแล้วก็ยังได้ข้อมูลล่าสุด)
+    ถ้าไม่เคยมีข้อมูลและ SD card ไม่เจอ -> ส่ง error
+    bbox=minLng,minLat,maxLng,maxLat -> เฉพาะจุดใน viewport (ใช้ spatial index)
+    format=ndjson -> 1 จุดต่อบรรทัด, stream=1 -> บังคับส่งแบบ stream
+    session=ชื่อ (หรือ a,b) -> เฉพาะ session นั้น ไม่ใส่ = รวมทุกไฟล์ (ดู /sessions)
+    from=, to= (epoch หรือ YYYY-MM-DD HH:MM:SS UTC), last=15m -> เฉพาะช่วงเวลานั้น (ดู /timerange)
+    กรองเวลาแล้วจุดที่ไม่มีเวลา (GPS ยังไม่ได้วันที่) จะไม่ถูกส่ง
     """
-    if not is_sdcard_mounted():
+    try:
+        session = session_arg()
+        bbox = parse_bbox(request.args.get("bbox"))
+        trange = time_range_arg()
+        fmt = _response_format()
+    except ValueError as e:
+        return jsonify({"error": "bad query: " + str(e)}), 400
+
+    if not data_available(session):
+        return jsonify({
+            "error": "SD card not detected or file not found.",
+            "hint": SD_MOUNT_PATH
+        }), 404
+
+    try:
+        pts = read_measurements(session=session)
+        return rows_response(pts, select_points(pts, bbox, trange), fmt=fmt)
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/data.bin")
+@conditional_data
+def data_bin():
+    """
+    จุดวัดสำหรับ heatmap แบบ binary (ดู layout ที่ pack_points)
+    ~16 byte ต่อจุด แทน ~70 byte ของ JSON และ browser ไม่ต้อง JSON.parse
+    รับ bbox=minLng,minLat,maxLng,maxLat, session= และ from=/to=/last= เหมือน /data
+    สร้างครั้งเดียวต่อเวอร์ชันข้อมูล+query แล้วเก็บในแคช
+    """
+    try:
+        session = session_arg()
+        bbox = parse_bbox(request.args.get("bbox"))
+        trange = time_range_arg()
+    except ValueError as e:
+        return jsonify({"error": "bad query: " + str(e)}), 400
+
+    if not data_available(session):
+        return jsonify({
+            "error": "SD card not detected or file not found.",
+            "hint": SD_MOUNT_PATH
+        }), 404
+
+    try:
+        pts = read_measurements(session=session)
+        cache_key = (data_etag(pts), "raw")
+        cached = _compressed.get(cache_key)
+        if cached is None:
+            idx = select_points(pts, bbox, trange)
+            if idx is None:
+                idx = np.flatnonzero(pts.valid)
+            else:
+                idx = idx[pts.valid[idx]]
+            body = pack_points(pts.lat[idx], pts.lng[idx], pts.dbm[idx])
+            cached = ("application/octet-stream", body)
+            _compressed.put(cache_key, cached)
+        return Response(cached[1], mimetype=cached[0])
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/export")
+def export():
+    """
+    ส่งออกจุดวัดเป็นไฟล์ดาวน์โหลด (Content-Disposition: attachment) แบบ stream
+    format=csv (ค่าเริ่มต้น) | geojson | ndjson | parquet (ต้องมี pyarrow)
+    รับ session=, bbox= และ from=/to=/last= เหมือน /data
+    ส่งทีละ EXPORT_CHUNK_ROWS แถว หลายล้านจุดก็ไม่กินหน่วยความจำเพิ่มตามขนาดข้อมูล
+    """
+    try:
+        session = session_arg()
+        bbox = parse_bbox(request.args.get("bbox"))
+        trange = time_range_arg()
+        fmt = request.args.get("format", "csv")
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError("format must be one of " + ", ".join(EXPORT_FORMATS))
+    except ValueError as e:
+        return jsonify({"error": "bad query: " + str(e)}), 400
+
+    if fmt == "parquet" and pq is None:
+        return jsonify({"error": "parquet export needs pyarrow (pip install pyarrow)"}), 501
+
+    if not data_available(session):
+        return jsonify({
+            "error": "SD card not detected or file not found.",
+            "hint": SD_MOUNT_PATH
+        }), 404
+
+    try:
+        pts = read_measurements(session=session)
+        return export_response(pts, select_points(pts, bbox, trange), fmt,
+                               export_filename(session, fmt))
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/tiles/<int:z>/<int:x>/<int:y>.png")
+@conditional_data
+def heat_tile(z, x, y):
+    """
+    heatmap เป็นรูป PNG ทีละ tile (XYZ เหมือน OSM) ใช้กับ L.tileLayer ได้ตรง ๆ
+    วาดฝั่ง server ครั้งเดียวต่อเวอร์ชันข้อมูล แล้วเก็บในแคช (หน่วยความจำ + ดิสก์)
+    รับ session= และ from=/to=/last= เหมือน /data, tile ที่ไม่มีจุดเลย = PNG โปร่งใส
+    """
+    try:
+        session = session_arg()
+        trange = time_range_arg()
+    except ValueError as e:
+        return jsonify({"error": "bad query: " + str(e)}), 400
+    if not (0 <= z <= TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": "tile out of range"}), 404
+
+    if not data_available(session):
+        return jsonify({
+            "error": "SD card not detected or file not found.",
+            "hint": SD_MOUNT_PATH
+        }), 404
+
+    try:
+        pts = read_measurements(session=session)
+        return Response(heat_tile_png(pts, session, z, x, y, trange), mimetype="image/png")
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/coverage")
+@conditional_data
+def coverage():
+    """
+    ค่าความแรงสัญญาณ (dBm) ที่ประมาณระหว่างจุดวัด บน grid ครอบ bbox (ดู coverage_grid)
+    query:
+    - bbox=minLng,minLat,maxLng,maxLat  (ไม่ใส่ = ครอบทุกจุด)
+    - res=จำนวนช่องตามด้านที่ยาวกว่า (ค่าเริ่มต้น COVERAGE_RES สูงสุด COVERAGE_MAX_RES)
+    - method=idw|kriging, power= (idw), radius=เมตร, session= เหมือน /data
+    - format=grid (ค่าเริ่มต้น) หรือ geojson = เส้น contour ทุก step= dB
+    format=grid:
+    {"bbox": [...], "rows": ny, "cols": nx, "lat": [กลางช่องแต่ละแถว ใต้->เหนือ],
+     "lng": [กลางช่องแต่ละคอลัมน์ ตะวันตก->ออก], "values": [[dBm หรือ null, ...], ...],
+     "method": .., "cell_m": .., "points": .., ...}
+    คำนวณครั้งเดียวต่อ (เวอร์ชันข้อมูล, bbox, res, พารามิเตอร์) แล้วเก็บในแคช
+    """
+    try:
+        session = session_arg()
+        bbox = parse_bbox(request.args.get("bbox"))
+        res = min(max(int(request.args.get("res", COVERAGE_RES)), 2), COVERAGE_MAX_RES)
+        method = request.args.get("method", "idw")
+        if method not in ("idw", "kriging"):
+            raise ValueError("method must be idw or kriging")
+        power = min(max(float(request.args.get("power", COVERAGE_POWER)), 0.5), 6.0)
+        radius = min(max(float(request.args.get("radius", COVERAGE_RADIUS_M)), 1.0), 1000.0)
+        fmt = request.args.get("format", "grid")
+        if fmt not in ("grid", "geojson"):
+            raise ValueError("format must be grid or geojson")
+        step = max(float(request.args.get("step", COVERAGE_LEVEL_STEP)), 0.5)
+        if not (np.isfinite(power) and np.isfinite(radius) and np.isfinite(step)):
+            raise ValueError("power/radius/step must be finite")
+    except ValueError as e:
+        return jsonify({"error": "bad query: " + str(e)}), 400
+
+    if not data_available(session):
+        return jsonify({
+            "error": "SD card not detected or file not found.",
+            "hint": SD_MOUNT_PATH
+        }), 404
+
+    try:
+        pts = read_measurements(session=session)
+        cache_key = ("coverage", pts.source, session, bbox, res, method, power, radius,
+                     fmt, step if fmt == "geojson" else None)
+        cached = _compressed.get(cache_key)
+        if cached is None:
+            area = bbox
+            if area is None:
+                v = pts.valid
+                if not v.any():
+                    return jsonify({"error": "no valid points"}), 404
+                area = (float(pts.lng[v].min()), float(pts.lat[v].min()),
+                        float(pts.lng[v].max()), float(pts.lat[v].max()))
+            lat, lng, values, info = coverage_grid(pts, area, res, method, power, radius)
+            if fmt == "geojson":
+                body = coverage_contours(lat, lng, values, coverage_levels(values, step))
+                body["properties"] = dict(info, bbox=list(area))
+                cached = ("application/geo+json", _dumps(body).encode())
+            else:
+                grid = np.round(values, 1).tolist()
+                body = dict(info, bbox=list(area), rows=len(lat), cols=len(lng),
+                            lat=np.round(lat, 7).tolist(), lng=np.round(lng, 7).tolist(),
+                            values=[[None if v != v else v for v in row] for row in grid])
+                cached = ("application/json", _dumps(body).encode())
+            _compressed.put(cache_key, cached)
+        return Response(cached[1], mimetype=cached[0])
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/data/grid")
+@conditional_data
+def data_grid():
+    """
+    heatmap แบบรวมเป็นช่อง grid ฝั่ง server (โหมด Grid บนแผนที่)
+    query:
+    - bbox=minLng,minLat,maxLng,maxLat  (ไม่ใส่ = ทั้งหมด)
+    - zoom=ระดับซูมของ Leaflet (ใช้คำนวณขนาดช่อง)
+    - cell=ขนาดช่องเป็น pixel บนจอ (ค่าเริ่มต้น GRID_CELL_PX)
+    - session=, from=/to=/last= เหมือน /data
+    ขนาด response ขึ้นกับจำนวนช่องใน viewport ไม่ใช่จำนวนจุดทั้งหมด
+    """
+    try:
+        session = session_arg()
+        bbox = parse_bbox(request.args.get("bbox"))
+        trange = time_range_arg()
+        zoom = min(max(int(request.args.get("zoom", DEFAULT_CENTER["zoom"])), 0), 24)
+        cell_px = min(max(int(request.args.get("cell", GRID_CELL_PX)), 2), 256)
+    except ValueError as e:
+        return jsonify({"error": "bad query: " + str(e)}), 400
+
+    if not data_available(session):
+        return jsonify({
+            "error": "SD card not detected or file not found.",
+            "hint": SD_MOUNT_PATH
+        }), 404
+
+    try:
+        if bbox is None and trange is None:
+            lat, lng, dbm = measurement_arrays(session)
+        else:
+            # bbox ผ่าน spatial index เหมือน /data.bin: เลื่อนแผนที่ไม่ต้องไล่ทุกจุด
+            pts = read_measurements(session=session)
+            idx = select_points(pts, bbox, trange)
+            idx = idx[pts.valid[idx]]
+            lat, lng, dbm = pts.lat[idx], pts.lng[idx], pts.dbm[idx]
+        cells = grid_aggregate(lat, lng, dbm, zoom, cell_px)
+        return jsonify({
+            "zoom": zoom,
+            "cell": cell_px,
+            "points": int(sum(c["count"] for c in cells)),
+            "cells": cells
+        })
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/data/clusters")
+@conditional_data
+def data_clusters():
+    """
+    จุดวัดแบบ level of detail สำหรับ marker บนแผนที่ (ดู cluster_query)
+    query:
+    - bbox=minLng,minLat,maxLng,maxLat  (ไม่ใส่ = ทั้งหมด)
+    - zoom=ระดับซูมของ Leaflet
+    - session=, from=/to=/last= เหมือน /data
+    รูปแบบ:
+    {"zoom":.., "level": ชั้นที่ใช้จริง, "radius": CLUSTER_RADIUS_PX, "points": จำนวนจุดรวม,
+     "clusters": [{"lat","lng","count","mean_dbm","min_dbm","max_dbm","intensity"}, ...]}
+    จำนวน cluster ไม่เกิน CLUSTER_MAX_ITEMS ไม่ว่าข้อมูลจะมีกี่จุด
+    """
+    try:
+        session = session_arg()
+        bbox = parse_bbox(request.args.get("bbox"))
+        trange = time_range_arg()
+        zoom = min(max(int(request.args.get("zoom", DEFAULT_CENTER["zoom"])), 0), 24)
+    except ValueError as e:
+        return jsonify({"error": "bad query: " + str(e)}), 400
+
+    if not data_available(session):
+        return jsonify({
+            "error": "SD card not detected or file not found.",
+            "hint": SD_MOUNT_PATH
+        }), 404
+
+    try:
+        pts = read_measurements(session=session)
+        level, cells = cluster_query(pts, zoom, bbox, trange)
+        return jsonify({
+            "zoom": zoom,
+            "level": level,
+            "radius": CLUSTER_RADIUS_PX,
+            "points": int(cells["count"].sum()),
+            "clusters": cluster_items(cells)
+        })
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/stats")
+@conditional_data
+def stats():
+    """
+    สถิติ dBm (n, mean, std, min, max, p10/p50/p90) รวมทั้งหมด + ต่อช่อง/ต่อช่วงเวลา (ดู rf_stats)
+    query:
+    - by=cell | time | cell,time   (ไม่ใส่ = เฉพาะผลรวม)
+    - bucket=15m  ความยาวช่วงเวลาของ by=time (พหุคูณของ STATS_BUCKET_S ค่าเริ่มต้น STATS_BUCKET_S)
+    - p=10,50,90  percentile ที่ต้องการ
+    - bbox=, session=, from=/to=/last= เหมือน /data
+      (bbox กรองทีละช่อง SPATIAL_CELL_DEG, เวลากรองทีละ STATS_BUCKET_S)
+    รูปแบบ:
+    {"cell_deg":.., "bucket":.., "overall": {...},
+     "groups": [{"lat","lng" (กลางช่อง), "time" (epoch ต้นช่วง), "n","mean","std","min","max","p10",..}, ...]}
+    คำนวณจาก accumulator ที่อัปเดตทีละจุดใหม่ ไม่ไล่ทุกจุดใหม่ทุกครั้ง
+    """
+    try:
+        session = session_arg()
+        bbox = parse_bbox(request.args.get("bbox"))
+        trange = time_range_arg()
+        by = tuple(part.strip() for part in request.args.get("by", "").split(",") if part.strip())
+        if not set(by) <= {"cell", "time"}:
+            raise ValueError("by must be cell, time or cell,time")
+        bucket = None
+        if request.args.get("bucket"):
+            bucket = int(round(parse_duration(request.args["bucket"], "bucket")))
+            if bucket <= 0 or bucket % STATS_BUCKET_S:
+                raise ValueError("bucket must be a multiple of %ds" % STATS_BUCKET_S)
+        percentiles = STATS_PERCENTILES
+        if request.args.get("p"):
+            percentiles = tuple(float(v) for v in request.args["p"].split(","))
+            if not all(0 <= v <= 100 for v in percentiles):
+                raise ValueError("p must be between 0 and 100")
+    except ValueError as e:
+        return jsonify({"error": "bad query: " + str(e)}), 400
+
+    if not data_available(session):
         return jsonify({
             "error": "SD card not detected or file not found.",
             "hint": SD_MOUNT_PATH
         }), 404
 
     try:
-        pts = read_measurements()
-        return jsonify(pts)
+        pts = read_measurements(session=session)
+        overall, groups = rf_stats(pts, by, bucket, bbox, trange, percentiles)
+        return jsonify({
+            "cell_deg": SPATIAL_CELL_DEG,
+            "bucket": bucket or STATS_BUCKET_S,
+            "overall": overall,
+            "groups": groups
+        })
     except Exception as e:
+        record_error(e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/tabledata")
+@conditional_data
 def tabledata():
     """
     ส่งข้อมูลเป็น list ของจุดวัดทั้งหมด เอาไว้ populate ตาราง
@@ -748,25 +5947,91 @@ def tabledata():
       {"idx":1, ...},
       ...
     ]
+
+    ถ้าส่ง limit มาด้วย จะตอบเป็นหน้า ๆ (ตาราง virtual scroll ใช้แบบนี้):
+    - offset, limit (สูงสุด TABLE_MAX_LIMIT)
+    - sort=idx|lat|lng|dbm, order=asc|desc
+    - กรองได้ด้วย min_dbm, max_dbm, bbox=minLng,minLat,maxLng,maxLat
+    รูปแบบ:
+    {"total": จำนวนแถวหลังกรอง, "offset":.., "limit":.., "rows": [...]}
+
+    แบบไม่แบ่งหน้ารองรับ format=ndjson / stream=1 เหมือน /data
+    ทั้งสองแบบรับ session= เหมือน /data (idx นับใหม่จาก 0 ในแต่ละ session)
+    และ from=/to=/last= เหมือน /data (idx ยังเป็นลำดับเดิมในไฟล์)
     """
-    if not is_sdcard_mounted():
+    paged = "limit" in request.args
+    try:
+        session = session_arg()
+        trange = time_range_arg()
+        fmt = _response_format()
+    except ValueError as e:
+        return jsonify({"error": "bad query: " + str(e)}), 400
+
+    if not data_available(session):
         return jsonify({
             "error": "SD card not detected or file not found.",
             "hint": SD_MOUNT_PATH
         }), 404
 
+    if paged:
+        try:
+            offset = max(int(request.args.get("offset", 0)), 0)
+            limit = min(max(int(request.args["limit"]), 0), TABLE_MAX_LIMIT)
+            sort = request.args.get("sort", "idx")
+            order = request.args.get("order", "asc")
+            if sort not in TABLE_SORT_COLUMNS:
+                raise ValueError("sort must be one of " + ", ".join(TABLE_SORT_COLUMNS))
+            if order not in ("asc", "desc"):
+                raise ValueError("order must be asc or desc")
+            min_dbm = _optional_float("min_dbm")
+            max_dbm = _optional_float("max_dbm")
+            bbox = parse_bbox(request.args.get("bbox"))
+        except ValueError as e:
+            return jsonify({"error": "bad query: " + str(e)}), 400
+
     try:
-        pts = read_measurements()
-        table_rows = []
-        for i, p in enumerate(pts):
-            table_rows.append({
-                "idx": i,
-                "lat": p.get("lat"),
-                "lng": p.get("lng"),
-                "dbm": p.get("dbm")
+        pts = read_measurements(session=session)
+        if paged:
+            total, rows = table_page(pts, offset, limit, sort, order == "desc",
+                                     min_dbm, max_dbm, bbox, trange)
+            return jsonify({
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+                "rows": rows
             })
-        return jsonify(table_rows)
+
+        return rows_response(pts, select_points(pts, None, trange), with_index=True, fmt=fmt)
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/timerange")
+def timerange():
+    """
+    ช่วงเวลาของข้อมูล (ไว้ตั้งขอบ slider เล่นย้อนการเดินวัด) รับ session= เหมือน /data
+    รูปแบบ:
+    {"first": epoch แรก, "last": epoch ล่าสุด (null ถ้าไม่มีจุดที่มีเวลาเลย),
+     "timed": จำนวนจุดที่มีเวลา, "untimed": จำนวนจุดที่ไม่มีเวลา (ไม่ถูกส่งเมื่อกรองเวลา)}
+    """
+    try:
+        session = session_arg()
+    except ValueError as e:
+        return jsonify({"error": "bad query: " + str(e)}), 400
+
+    try:
+        pts = read_measurements(session=session)
+        bounds = time_index(pts).bounds()
+        timed = int(np.count_nonzero(pts.epoch != TIME_NONE))
+        return jsonify({
+            "first": bounds[0] if bounds else None,
+            "last": bounds[1] if bounds else None,
+            "timed": timed,
+            "untimed": len(pts) - timed
+        })
     except Exception as e:
+        record_error(e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -775,16 +6040,35 @@ def reload_data():
     """
     สำหรับปุ่ม Reload Data:
     - เช็กว่ามี SD card ไหม
-    - อ่านไฟล์อีกรอบเพื่อ confirm ว่าอ่านได้
+    - อ่านทุกไฟล์อีกรอบทั้งไฟล์ (หลายไฟล์ parse พร้อมกัน) แล้ว sync ลง DB เพื่อ confirm ว่าอ่านได้
     - คืนจำนวนจุดเพื่อโชว์แจ้งเตือน
     """
     if not is_sdcard_mounted():
         return jsonify({"error": "SD card not detected."}), 404
 
     try:
-        pts = read_measurements()
-        return jsonify({"status": "ok", "count": len(pts)})
+        # ปุ่ม Reload เป็นที่เดียวที่บังคับล้างแคชแล้วอ่านไฟล์ใหม่
+        pts = read_measurements(force=True)
+        return jsonify({"status": "ok", "count": len(pts), "cache": cache_stats()})
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/sessions")
+def sessions():
+    """
+    รายการ session (1 ไฟล์ *.json บนการ์ด = 1 session) ที่ ingest ไว้แล้ว
+    ใช้ชื่อกับ /data?session=ชื่อ (หลายอันคั่นด้วย , ไม่ใส่ = รวมทุก session)
+    รูปแบบ:
+    [{"name": "noise_samples", "path": ..., "points": .., "first": เวลาแรก, "last": เวลาล่าสุด,
+      "updated": unix time ที่ ingest ล่าสุด}, ...]
+    """
+    try:
+        data_available()
+        return jsonify(sample_db.sessions())
     except Exception as e:
+        record_error(e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -793,28 +6077,56 @@ def sd_status():
     """
     สำหรับแสดงสถานะมุมขวาล่างแบบ real-time
     คืน:
-    - mounted: True/False
-    - points: นับจำนวนจุดในไฟล์ (ถ้าอ่านได้)
+    - mounted: True/False (สถานะล่าสุดที่ thread เฝ้าการ์ดเห็น ไม่ได้ stat การ์ดใน request)
+    - points: จำนวนจุดใน DB ในเครื่อง (ถอดการ์ดแล้วก็ยังนับอยู่)
+    - source: "sd" การ์ดเสียบอยู่ / "local" ใช้ข้อมูลที่ ingest ไว้แล้ว
+    - serial: สถานะตัวรับจุดสดทาง USB serial (เฉพาะเมื่อตั้ง SERIAL_PORT)
+    - cache: สถิติ hit/miss ของแคชข้อมูล
+    poll ถี่ได้: ตอบจาก store ในหน่วยความจำล้วน ๆ ไม่แตะ SQLite (thread SDWatcher เป็นคน sync ให้)
     """
-    mounted = is_sdcard_mounted()
+    sd_watcher.start()
+    mounted = bool(sd_watcher.mounted)
     info = {
         "mounted": mounted,
         "mount_path": SD_MOUNT_PATH,
-        "timestamp": time.time()
+        "timestamp": time.time(),
+        "points": len(_cache["store"]),
+        "source": "sd" if mounted else "local"
     }
 
-    if mounted:
-        try:
-            pts = read_measurements()
-            info["points"] = len(pts)
-        except Exception:
-            info["points"] = 0
-    else:
-        info["points"] = 0
-
+    if serial_ingest.port:
+        info["serial"] = serial_ingest.status()
+    info["cache"] = cache_stats()
     return jsonify(info)
 
 
+@app.route("/events")
+def events():
+    """
+    Server-Sent Events สำหรับอัปเดตแบบ real-time (แทนการ poll /sdstatus)
+    event: status / append / reset (ดู SDWatcher), live (ตำแหน่งสดจาก USB serial ดู SerialIngest)
+    ทุก client ใช้ watcher ตัวเดียวกัน โหลด server ไม่เพิ่มตามจำนวนคนเปิดดู
+    """
+    sd_watcher.start()
+    q = event_hub.subscribe()
+    return Response(_iter_events(q), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@app.route("/metrics")
+def metrics_text():
+    """
+    ตัวเลขการทำงานแบบ Prometheus text format (ให้ Prometheus scrape ได้ตรง ๆ)
+    - rf_http_*: จำนวน request / เวลา / byte ที่ส่ง แยกตาม route
+    - rf_read_measurements_*, rf_sdcard_check_*, rf_sd_*, rf_db_write_*: hot path ฝั่งอ่านการ์ด
+    - rf_errors_total: error แยกตามที่เกิดและชนิด exception
+    - rf_cache_*: hit/miss/ratio ของแคช store / response บีบอัด / tile
+    """
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # ===============================
 # main
 # ===============================
@@ -0,0 +1,359 @@
+"""
+Benchmark ของ route ใน app.py เมื่อ survey ใหญ่ขึ้นเรื่อย ๆ
+
+สร้างไฟล์จุดวัดสังเคราะห์รูปแบบเดียวกับที่ firmware เขียน (appendJsonArray ใน ESP32_final.ino)
+แล้ววัด /data, /tabledata, /reload, /sdstatus (+ /data.bin, /data/clusters, /tabledata แบบหน้า ที่หน้าเว็บใช้จริง)
+ผ่าน Flask test client โดยใช้โฟลเดอร์ชั่วคราวแทน SD card
+
+ตัวอย่าง:
+    python bench.py                              # ทุกขนาด 1k, 10k, 100k, 1M, 10M
+    python bench.py --sizes 1k,10k --repeat 10   # เฉพาะบางขนาด
+    python bench.py --compare old.json new.json  # เทียบผลสองเวอร์ชัน
+
+ผลลัพธ์ (JSON) ถูกเก็บไว้ใน bench_results/ เอาไว้เทียบข้ามเวอร์ชันได้
+แต่ละขนาดรันใน process แยก peak RSS จะได้ไม่ปนกัน
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# ===============================
+# Config
+# ===============================
+SIZES = {
+    "1k": 1_000,
+    "10k": 10_000,
+    "100k": 100_000,
+    "1M": 1_000_000,
+    "10M": 10_000_000,
+}
+
+# route ที่วัด: (ชื่อในผลลัพธ์, path)
+ROUTES = [
+    ("/", "/"),
+    ("/data", "/data"),
+    ("/tabledata", "/tabledata"),
+    ("/tabledata?limit=200", "/tabledata?offset=0&limit=200&sort=dbm&order=desc"),
+    ("/data.bin", "/data.bin"),
+    ("/data/clusters", "/data/clusters?bbox=100.76,13.72,100.79,13.74&zoom=17"),
+    ("/export?format=csv", "/export?format=csv"),
+    ("/sdstatus", "/sdstatus"),
+    ("/reload", "/reload"),
+]
+
+# ศูนย์กลางพื้นที่สำรวจ (ให้ตรงกับ DEFAULT_CENTER ใน app.py)
+CENTER_LAT = 13.7276
+CENTER_LNG = 100.7726
+
+# เขียนไฟล์ทีละกี่จุด (คุมหน่วยความจำตอนสร้าง 10M จุด)
+GEN_CHUNK = 200_000
+
+
+# ===============================
+# Synthetic survey generator
+# ===============================
+def generate_survey(path, n, seed=0):
+    """เขียน n จุดลง path แบบเดียวกับ firmware:
+       [{"lat":..6 ตำแหน่ง,"lng":..6 ตำแหน่ง,"time":"YYYY-MM-DD HH:MM:SS","dbm":..1 ตำแหน่ง},...]
+       ไม่มีช่องว่าง ไม่มีขึ้นบรรทัดใหม่
+       เส้นทางเป็นการเดินสุ่ม (random walk) รอบ ๆ CENTER บันทึกทุก ~1 วินาที
+       dBm = สนามสัญญาณเรียบ ๆ + noise อยู่ช่วงประมาณ -75..-25
+       seed เดียวกัน = ไฟล์เหมือนกันทุก byte
+    """
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2025-01-01T08:00:00", "s")
+    lat0, lng0 = CENTER_LAT, CENTER_LNG
+    t0 = 0
+    with open(path, "w") as f:
+        f.write("[")
+        for first in range(0, n, GEN_CHUNK):
+            m = min(GEN_CHUNK, n - first)
+            # ก้าวละ ~1 m, ดึงกลับเข้าหาศูนย์กลางนิดหน่อยไม่ให้เดินหลุดออกไปไกล
+            steps = rng.normal(0.0, 1e-5, size=(m, 2))
+            lat = lat0 + np.cumsum(steps[:, 0])
+            lng = lng0 + np.cumsum(steps[:, 1])
+            lat -= (lat - CENTER_LAT) * np.linspace(0.0, 0.02, m)
+            lng -= (lng - CENTER_LNG) * np.linspace(0.0, 0.02, m)
+            lat0, lng0 = float(lat[-1]), float(lng[-1])
+
+            field = (np.sin((lat - CENTER_LAT) * 3000.0) + np.cos((lng - CENTER_LNG) * 2000.0))
+            dbm = np.clip(-50.0 + 10.0 * field + rng.normal(0.0, 3.0, m), -75.0, -25.0)
+
+            secs = t0 + np.cumsum(rng.integers(1, 3, size=m))
+            t0 = int(secs[-1])
+            times = np.char.replace(
+                np.datetime_as_string(start + secs.astype("timedelta64[s]"), unit="s"), "T", " "
+            ).tolist()
+
+            body = ",".join(
+                '{"lat":%.6f,"lng":%.6f,"time":"%s","dbm":%.1f}' % row
+                for row in zip(lat.tolist(), lng.tolist(), times, dbm.tolist())
+            )
+            if first:
+                f.write(",")
+            f.write(body)
+        f.write("]")
+
+
+# ===============================
+# Measurement (child process)
+# ===============================
+def _percentiles(samples):
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "n": int(ms.size),
+        "min_ms": round(float(ms.min()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def _peak_rss_mb():
+    # Linux: ru_maxrss เป็น KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+def repeats_for(points, repeat):
+    """survey ใหญ่ลดจำนวนรอบลง (แต่ไม่ต่ำกว่า 3) ไม่งั้น 10M จุดรันเป็นชั่วโมง"""
+    return max(3, min(repeat, int(2_000_000 // max(points, 1))))
+
+
+def run_child(sd_dir, work_dir, points, repeat):
+    """วัดทุก route กับข้อมูลใน sd_dir คืน dict ผลลัพธ์ (รันใน process ของตัวเอง)"""
+    sd_dir = os.path.abspath(sd_dir)
+    real_ismount = os.path.ismount
+    os.path.ismount = lambda p: os.path.abspath(p) == sd_dir or real_ismount(p)
+
+    sys.path.insert(0, HERE)
+    import app as A
+
+    A.SD_MOUNT_PATH = sd_dir
+    A.JSON_FILE_PATH = os.path.join(sd_dir, "noise_samples.json")
+    A.sample_db = A.SampleDB(os.path.join(work_dir, "rf_samples.db"))
+    A.tile_cache = A.TileCache(A.TILE_CACHE_BYTES, os.path.join(work_dir, "tile_cache"),
+                               A.TILE_DISK_BYTES)
+    # ไม่ให้ thread เฝ้าการ์ดตื่นมาแย่ง CPU ระหว่างวัด
+    A.sd_watcher.interval = 3600.0
+
+    result = {"points": points}
+
+    # ingest ครั้งแรก: parse ไฟล์ทั้งไฟล์ + เขียนลง SQLite
+    t = time.perf_counter()
+    A.sd_watcher.start()
+    result["ingest_s"] = round(time.perf_counter() - t, 3)
+
+    # โหลดจาก DB เข้า store เปล่า (เหมือน request แรกหลังรีสตาร์ตที่ DB มีข้อมูลอยู่แล้ว)
+    A._cache["store"] = A.MeasurementStore()
+    t = time.perf_counter()
+    snap = A.read_measurements()
+    result["store_load_s"] = round(time.perf_counter() - t, 3)
+    result["store_points"] = len(snap)
+    result["rss_after_ingest_mb"] = _peak_rss_mb()
+
+    client = A.app.test_client()
+    rounds = repeats_for(points, repeat)
+    routes = {}
+    for name, path in ROUTES:
+        samples = []
+        status = size = None
+        for _ in range(rounds):
+            t = time.perf_counter()
+            resp = client.get(path)
+            body = resp.get_data()
+            samples.append(time.perf_counter() - t)
+            status, size = resp.status_code, len(body)
+        stats = _percentiles(samples)
+        stats["status"] = status
+        stats["bytes"] = size
+        if name != "/reload":
+            gz = client.get(path, headers={"Accept-Encoding": "gzip"})
+            stats["gzip_bytes"] = len(gz.get_data())
+        routes[name] = stats
+    result["routes"] = routes
+    result["rss_peak_mb"] = _peak_rss_mb()
+    return result
+
+
+# ===============================
+# Driver
+# ===============================
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "-C", HERE, "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, timeout=10)
+        dirty = subprocess.run(["git", "-C", HERE, "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, timeout=10)
+        if out.returncode == 0:
+            return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+    except OSError:
+        pass
+    return None
+
+
+def _versions():
+    out = {"python": platform.python_version(), "numpy": np.__version__}
+    try:
+        from importlib.metadata import version
+        out["flask"] = version("flask")
+    except Exception:
+        pass
+    return out
+
+
+def parse_sizes(text):
+    sizes = []
+    for part in text.split(","):
+        part = part.strip()
+        if part in SIZES:
+            sizes.append(SIZES[part])
+        elif part:
+            sizes.append(int(float(part)))
+    return sizes
+
+
+def run_size(points, args, data_dir):
+    """สร้างไฟล์ (หรือใช้ของเดิมใน data_dir) แล้วรัน child process วัดผล"""
+    path = os.path.join(data_dir, "survey-%d-seed%d.json" % (points, args.seed))
+    gen_s = 0.0
+    if not os.path.exists(path):
+        t = time.perf_counter()
+        generate_survey(path + ".tmp", points, args.seed)
+        os.replace(path + ".tmp", path)
+        gen_s = time.perf_counter() - t
+
+    with tempfile.TemporaryDirectory(prefix="rfbench-") as tmp:
+        sd_dir = os.path.join(tmp, "sd")
+        work_dir = os.path.join(tmp, "work")
+        os.makedirs(sd_dir)
+        os.makedirs(work_dir)
+        os.symlink(path, os.path.join(sd_dir, "noise_samples.json"))
+
+        cmd = [sys.executable, os.path.abspath(__file__), "--child",
+               json.dumps({"sd_dir": sd_dir, "work_dir": work_dir,
+                           "points": points, "repeat": args.repeat})]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            raise SystemExit("benchmark for %d points failed" % points)
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    result["file_bytes"] = os.path.getsize(path)
+    result["generate_s"] = round(gen_s, 3)
+    return result
+
+
+def print_result(r):
+    print("\n== %s points (%.1f MB file) ingest %.2fs, store load %.2fs, peak RSS %.0f MB =="
+          % (format(r["points"], ","), r["file_bytes"] / 1e6, r["ingest_s"],
+             r["store_load_s"], r["rss_peak_mb"]))
+    print("  %-22s %6s %10s %10s %10s %12s %12s"
+          % ("route", "n", "p50 ms", "p90 ms", "p99 ms", "bytes", "gzip bytes"))
+    for name, s in r["routes"].items():
+        print("  %-22s %6d %10.2f %10.2f %10.2f %12d %12s"
+              % (name, s["n"], s["p50_ms"], s["p90_ms"], s["p99_ms"], s["bytes"],
+                 s.get("gzip_bytes", "-")))
+
+
+def compare(base_path, new_path):
+    """พิมพ์ตารางเทียบ p50 / payload / RSS ระหว่างผลสองไฟล์"""
+    with open(base_path) as f:
+        base = {r["points"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def delta(a, b):
+        return "%+.1f%%" % ((b - a) / a * 100.0) if a else "-"
+
+    for r in new["results"]:
+        old = base.get(r["points"])
+        if old is None:
+            continue
+        print("\n== %s points: peak RSS %.0f -> %.0f MB (%s), ingest %.2f -> %.2fs (%s) =="
+              % (format(r["points"], ","), old["rss_peak_mb"], r["rss_peak_mb"],
+                 delta(old["rss_peak_mb"], r["rss_peak_mb"]), old["ingest_s"], r["ingest_s"],
+                 delta(old["ingest_s"], r["ingest_s"])))
+        for name, s in r["routes"].items():
+            o = old["routes"].get(name)
+            if o is None:
+                continue
+            print("  %-22s p50 %9.2f -> %9.2f ms %9s   bytes %11d -> %11d %9s"
+                  % (name, o["p50_ms"], s["p50_ms"], delta(o["p50_ms"], s["p50_ms"]),
+                     o["bytes"], s["bytes"], delta(o["bytes"], s["bytes"])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k,10k,100k,1M,10M",
+                        help="ขนาด survey คั่นด้วย , (1k,10k,100k,1M,10M หรือเลขจำนวนจุด)")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="จำนวนรอบต่อ route (survey ใหญ่จะลดลงเอง ไม่ต่ำกว่า 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="เก็บไฟล์ที่สร้างไว้ใช้ซ้ำรอบหน้า (ไม่ใส่ = ลบทิ้ง)")
+    parser.add_argument("--out", help="ไฟล์ผลลัพธ์ JSON (ค่าเริ่มต้น bench_results/bench-<rev>-<เวลา>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="เทียบผลลัพธ์ 2 ไฟล์ แล้วจบ")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        opts = json.loads(args.child)
+        print(json.dumps(run_child(opts["sd_dir"], opts["work_dir"],
+                                   opts["points"], opts["repeat"])))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    revision = _git_revision()
+    report = {
+        "meta": {
+            "revision": revision,
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "versions": _versions(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": [],
+    }
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="rfbench-data-")
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        for points in parse_sizes(args.sizes):
+            result = run_size(points, args, data_dir)
+            report["results"].append(result)
+            print_result(result)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    out = args.out
+    if not out:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(HERE, "bench_results", "bench-%s-%s.json" % (revision or "local", stamp))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print("\nsaved " + out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+# ค่าของ gunicorn สำหรับ wsgi.py (ตั้งผ่าน environment ได้ ดูหัวไฟล์ wsgi.py)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from wsgi import BIND, WORKERS, THREADS  # noqa: E402
+
+bind = BIND
+workers = WORKERS
+threads = THREADS
+# gthread: /events (SSE) ค้างได้นานโดยไม่บล็อก worker ทั้งตัว
+worker_class = "gthread"
+# SSE ไม่จบเอง ตอนปิด/restart ไม่ต้องรอนาน
+graceful_timeout = 5
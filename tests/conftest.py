@@ -0,0 +1,61 @@
+"""fixture ร่วมของ test: app ที่ชี้ไปการ์ด/DB ชั่วคราว ไม่มี thread เบื้องหลัง (test สั่ง check() เอง)"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as rf  # noqa: E402
+
+
+@pytest.fixture
+def sd(tmp_path, monkeypatch):
+    """โฟลเดอร์การ์ดปลอม (นับว่า mount อยู่) + DB/store ใหม่ต่อ test  คืน path ของโฟลเดอร์การ์ด"""
+    card = tmp_path / "sd"
+    card.mkdir()
+    real_ismount = os.path.ismount
+    monkeypatch.setattr(rf, "SD_MOUNT_PATH", str(card))
+    monkeypatch.setattr(rf, "JSON_FILE_PATH", str(card / "noise_samples.json"))
+    monkeypatch.setattr(os.path, "ismount", lambda p: p == str(card) or real_ismount(p))
+    monkeypatch.setattr(rf, "sample_db", rf.SampleDB(str(tmp_path / "rf.db")))
+    monkeypatch.setitem(rf._cache, "store", rf.MeasurementStore())
+    monkeypatch.setattr(rf, "_session_stores", rf.OrderedDict())
+    monkeypatch.setattr(rf, "_files", {})
+    # tile บนดิสก์ลงโฟลเดอร์ชั่วคราว ไม่เขียน tile_cache/ ใน repo
+    monkeypatch.setattr(rf, "TILE_DISK_DIR", str(tmp_path / "tiles"))
+    monkeypatch.setattr(rf, "tile_cache", rf.TileCache(rf.TILE_CACHE_BYTES, rf.TILE_DISK_DIR,
+                                                      rf.TILE_DISK_BYTES))
+    hub = rf.EventHub()
+    watcher = rf.SDWatcher(hub)
+    watcher._thread = "test"   # ไม่ต้องเริ่ม thread เฝ้าการ์ด
+    monkeypatch.setattr(rf, "event_hub", hub)
+    monkeypatch.setattr(rf, "sd_watcher", watcher)
+    monkeypatch.setattr(rf, "serial_ingest", rf.SerialIngest(hub, watcher, port=None))
+    watcher.check()   # รอบแรกเหมือน SDWatcher.start(): event ถัดไปเทียบกับสถานะนี้
+    return card
+
+
+@pytest.fixture
+def client(sd):
+    return rf.app.test_client()
+
+
+def write_samples(path, records):
+    """เขียนไฟล์แบบเดียวกับ firmware (ไม่มีช่องว่าง)"""
+    body = ",".join('{"lat":%.6f,"lng":%.6f,"time":"%s","dbm":%.1f}' % r for r in records)
+    path.write_text("[" + body + "]")
+
+
+def drain(hub_queue):
+    """event ทั้งหมดที่ค้างในคิวของ EventHub -> list ของ (ชื่อ event, data)"""
+    import json
+    import queue
+    events = []
+    while True:
+        try:
+            msg = hub_queue.get_nowait()
+        except queue.Empty:
+            return events
+        lines = dict(line.split(": ", 1) for line in msg.strip().split("\n") if ": " in line)
+        events.append((lines.get("event"), json.loads(lines.get("data", "null"))))
@@ -0,0 +1,54 @@
+"""Leaflet ในเครื่อง: URL มี version (hash) แคชได้ถาวร, SRI ในหน้าเว็บตรงกับไฟล์ที่ส่ง"""
+import base64
+import gzip
+import hashlib
+import re
+
+import app as rf
+
+
+def page_assets(client):
+    """(url, integrity) ของ <link>/<script> ที่ชี้ /assets/ ในหน้าแรก"""
+    html = client.get("/").get_data(as_text=True)
+    tags = re.findall(r'<(?:link|script)\b[^>]*?(?:href|src)="(/assets/[^"]+)"[^>]*>', html)
+    sri = dict(re.findall(r'(?:href|src)="(/assets/[^"]+)"[^>]*?integrity="([^"]+)"', html))
+    assert tags and set(tags) == set(sri)
+    return sri
+
+
+def test_hashed_urls_are_immutable_with_correct_sri(client):
+    assets = page_assets(client)
+    assert {url.rsplit("/", 1)[1] for url in assets} == {"leaflet.css", "leaflet.js", "leaflet-heat.js"}
+    for url, integrity in assets.items():
+        assert url.startswith("/assets/%s/" % rf.static_assets.version)
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.headers["Cache-Control"] == "public, max-age=%d, immutable" % rf.ASSET_MAX_AGE
+        algo, digest = integrity.split("-", 1)
+        assert algo == "sha256"
+        assert base64.b64encode(hashlib.sha256(resp.data).digest()).decode() == digest
+        # SRI คิดจาก byte ที่ถอด Content-Encoding แล้ว: ส่งแบบ gzip ก็ต้องตรงกัน
+        gz = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert gz.headers.get("Content-Encoding") == "gzip"
+        assert gzip.decompress(gz.data) == resp.data
+
+        # revalidate ด้วย ETag -> 304 ไม่มี body
+        again = client.get(url, headers={"If-None-Match": resp.headers["ETag"]})
+        assert again.status_code == 304 and not again.data
+
+
+def test_stale_version_and_unknown_asset(client):
+    url = next(iter(page_assets(client)))
+    stale = url.replace(rf.static_assets.version, "000000000000")
+    resp = client.get(stale)
+    assert resp.status_code == 200 and resp.headers["Cache-Control"] == "no-cache"
+    assert client.get("/assets/%s/nope.js" % rf.static_assets.version).status_code == 404
+    # images/ ที่ leaflet.css อ้างแบบ relative อยู่ใต้ prefix เดียวกัน
+    icon = client.get("/assets/%s/vendor/leaflet/images/marker-icon.png" % rf.static_assets.version)
+    assert icon.status_code == 200 and icon.mimetype == "image/png"
+
+
+def test_index_page_revalidates(client):
+    first = client.get("/")
+    assert first.headers["Cache-Control"] == "no-cache"
+    assert client.get("/", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
@@ -0,0 +1,39 @@
+"""/data/clusters: ชั้นที่เลือกกับจำนวน marker ต่อจอ"""
+import random
+
+import app as rf
+from conftest import write_samples
+
+
+def survey(n, seed=1):
+    rnd = random.Random(seed)
+    return [(13.7276 + rnd.uniform(-1e-3, 1e-3), 100.7726 + rnd.uniform(-1e-3, 1e-3),
+             "2025-01-01 00:%02d:%02d" % (i // 60 % 60, i % 60), rnd.uniform(-70, -25))
+            for i in range(n)]
+
+
+def test_no_bbox_uses_data_extent_not_whole_world(sd, client):
+    write_samples(sd / "noise_samples.json", survey(2000))
+    rf.sd_watcher.check()
+    body = client.get("/data/clusters?zoom=18").get_json()
+    assert body["level"] == 18
+    assert sum(c["count"] for c in body["clusters"]) == 2000
+    with_bbox = client.get("/data/clusters?zoom=18&bbox=100.7715,13.7265,100.7737,13.7287").get_json()
+    assert with_bbox["clusters"] == body["clusters"]
+
+
+def test_cells_per_viewport_are_bounded(sd, client, monkeypatch):
+    monkeypatch.setattr(rf, "CLUSTER_MAX_ITEMS", 50)
+    write_samples(sd / "noise_samples.json", survey(2000))
+    rf.sd_watcher.check()
+    for query in ("zoom=22", "zoom=22&bbox=100.77,13.72,100.78,13.74", "zoom=19&last=10m"):
+        body = client.get("/data/clusters?" + query).get_json()
+        assert 0 < len(body["clusters"]) <= 50, query
+        assert body["level"] < 22
+
+
+def test_empty_store(sd, client):
+    (sd / "noise_samples.json").write_text("[]")
+    rf.sd_watcher.check()
+    body = client.get("/data/clusters?zoom=18").get_json()
+    assert body["clusters"] == []
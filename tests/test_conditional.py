@@ -0,0 +1,41 @@
+"""ETag/304 + แคช response บีบอัดของ conditional_data"""
+import gzip
+
+import app as rf
+from conftest import write_samples
+
+POINTS = [(13.7276 + i * 1e-5, 100.7726, "2025-01-01 00:00:%02d" % i, -40.0 - i) for i in range(3)]
+
+
+def test_body_comes_from_the_snapshot_behind_the_etag(sd, client, monkeypatch):
+    write_samples(sd / "noise_samples.json", POINTS[:2])
+    rf.sd_watcher.check()
+    real_etag = rf.data_etag
+
+    def etag_then_append(snap):
+        # จุดใหม่เข้า DB ระหว่างคำนวณ ETag กับตอน view สร้าง body
+        etag = real_etag(snap)
+        rf.sample_db.append(rf.DEFAULT_SESSION, "p", rf._records_to_db_rows(
+            [{"lat": POINTS[2][0], "lng": POINTS[2][1], "time": POINTS[2][2], "dbm": POINTS[2][3]}]))
+        return etag
+
+    monkeypatch.setattr(rf, "data_etag", etag_then_append)
+    first = client.get("/data")
+    assert len(first.get_json()) == 2
+    monkeypatch.setattr(rf, "data_etag", real_etag)
+
+    again = client.get("/data", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 200
+    assert len(again.get_json()) == 3
+    assert client.get("/data", headers={"If-None-Match": again.headers["ETag"]}).status_code == 304
+
+
+def test_compress_stream_only_caches_bodies_that_fit(monkeypatch):
+    monkeypatch.setattr(rf, "COMPRESS_CACHE_BYTES", 64)
+    monkeypatch.setattr(rf, "_compressed", rf.BytesLRU(1024))
+    small = b"".join(rf._compress_stream(iter(["a" * 10]), "gzip", "small", "text/plain"))
+    assert rf._compressed.get("small") == ("text/plain", small)
+    chunks = (bytes([i]) * 4096 for i in range(256))   # บีบแล้วยังเกิน 64 byte
+    big = b"".join(rf._compress_stream(chunks, "gzip", "big", "text/plain"))
+    assert len(gzip.decompress(big)) == 256 * 4096
+    assert rf._compressed.get("big") is None
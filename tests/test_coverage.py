@@ -0,0 +1,73 @@
+"""/coverage: IDW ผ่านจุดวัด, ข้อมูลน้อย/เรียงเป็นเส้นไม่ทำให้พัง, marching squares บน grid 2x2"""
+import numpy as np
+import pytest
+
+import app as rf
+from conftest import write_samples
+
+
+def test_idw_reproduces_samples():
+    rnd = np.random.default_rng(5)
+    px, py = rnd.uniform(0, 100, 40), rnd.uniform(0, 100, 40)
+    pv = rnd.uniform(-80, -30, 40)
+    out = rf._idw(px, py, px, py, pv, rf.COVERAGE_POWER, rf.COVERAGE_RADIUS_M)
+    assert out == pytest.approx(pv, abs=0.01)
+    # ไกลเกินรัศมีจากทุกจุด = ไม่มีค่า
+    assert np.isnan(rf._idw(np.array([1e4]), np.array([1e4]), px, py, pv, 2.0, 25.0)).all()
+
+
+def test_kriging_singular_system_falls_back_to_idw():
+    # จุดซ้ำตำแหน่งเดียวกันโดยไม่มี nugget -> matrix singular
+    px, py, pv = np.zeros(3), np.zeros(3), np.array([-40.0, -40.0, -40.0])
+    out = rf._kriging(np.array([1.0, 2.0]), np.array([0.0, 0.0]), px, py, pv,
+                      (0.0, 1.0, 10.0), 25.0, 3)
+    assert out == pytest.approx([-40.0, -40.0])
+
+
+@pytest.mark.parametrize("points", [
+    [(13.7276, 100.7726, "2025-01-01 12:00:00", -40.0)],
+    [(13.7276, 100.7726, "2025-01-01 12:00:00", -40.0),
+     (13.7277, 100.7726, "2025-01-01 12:00:01", -50.0)],
+    # เดินเป็นเส้นตรง / ยืนวัดที่เดิม (variogram fit ได้ แต่ระยะห่างเป็นแนวเดียว / ศูนย์)
+    [(13.7276 + i * 1e-5, 100.7726 + i * 1e-5, "2025-01-01 12:00:%02d" % i, -40.0 - i % 7)
+     for i in range(40)],
+    [(13.7276, 100.7726, "2025-01-01 12:00:%02d" % i, -40.0 - i % 7) for i in range(40)],
+], ids=["one", "two", "collinear", "same-spot"])
+@pytest.mark.parametrize("method", ["idw", "kriging"])
+def test_degenerate_inputs_do_not_error(sd, client, points, method):
+    write_samples(sd / "noise_samples.json", points)
+    rf.sd_watcher.check()
+    body = client.get("/coverage?res=16&method=" + method).get_json()
+    values = np.array([[np.nan if v is None else v for v in row] for row in body["values"]])
+    dbm = [p[3] for p in points]
+    finite = values[np.isfinite(values)]
+    assert finite.size and finite.min() >= min(dbm) - 1e-6 and finite.max() <= max(dbm) + 1e-6
+    geo = client.get("/coverage?res=16&format=geojson&method=" + method)
+    assert geo.status_code == 200 and geo.get_json()["type"] == "FeatureCollection"
+
+
+def test_no_valid_points_is_a_clean_404(sd, client):
+    (sd / "noise_samples.json").write_text('[{"lat":null,"lng":null,"time":"----","dbm":-40.0}]')
+    rf.sd_watcher.check()
+    resp = client.get("/coverage")
+    assert resp.status_code == 404 and "error" in resp.get_json()
+
+
+def segments(values, level):
+    geo = rf.coverage_contours(np.array([0.0, 1.0]), np.array([0.0, 1.0]),
+                               np.array(values, dtype=np.float64), [level])
+    if not geo["features"]:
+        return []
+    return sorted(sorted(map(tuple, s)) for s in geo["features"][0]["geometry"]["coordinates"])
+
+
+def test_contour_segments_on_2x2_field():
+    # แถว 0 = ใต้ (lat 0), coordinates เป็น [lng, lat]
+    assert segments([[0, 0], [10, 10]], 5) == [[(0.0, 0.5), (1.0, 0.5)]]          # แนวนอน
+    assert segments([[0, 10], [0, 10]], 2.5) == [[(0.25, 0.0), (0.25, 1.0)]]      # แนวตั้ง
+    assert segments([[10, 0], [0, 0]], 5) == [[(0.0, 0.5), (0.5, 0.0)]]           # มุมล่างซ้าย
+    # saddle: มุมตรงข้ามสูง -> 2 ท่อน ตัดมุมที่สูงออกจากกัน
+    assert segments([[10, 0], [0, 10]], 5) == [[(0.0, 0.5), (0.5, 0.0)], [(0.5, 1.0), (1.0, 0.5)]]
+    assert segments([[0, 0], [0, 0]], 5) == []
+    assert segments([[0, np.nan], [10, 10]], 5) == []                             # มุมไม่มีค่า
+    assert rf.coverage_levels(np.array([[-61.0, -44.0], [np.nan, -50.0]]), 5) == [-60.0, -55.0, -50.0, -45.0]
@@ -0,0 +1,57 @@
+"""/data.bin: layout ที่ decodePoints() ฝั่ง JS อ่านด้วย offset ตายตัว ต้องตรงกับ /data ของ snapshot เดียวกัน"""
+import json
+import struct
+
+import numpy as np
+
+import app as rf
+
+RECORDS = ([{"lat": 13.7276 + i * 1e-4, "lng": 100.7726 - i * 2e-4,
+             "time": "2025-01-01 12:00:%02d" % i, "dbm": -30.0 - i * 1.5} for i in range(25)]
+           + [{"lat": None, "lng": None, "time": "----", "dbm": -50.0}])
+
+
+def decode(body):
+    """ถอดแบบเดียวกับ decodePoints() ใน index.html (ไม่ใช้ค่าคงที่จาก app)"""
+    magic, version, header_size, n = struct.unpack_from("<4sHHI", body, 0)
+    origin_lat, origin_lng = struct.unpack_from("<dd", body, 16)
+    dbm_min, dbm_max = struct.unpack_from("<ff", body, 32)
+    assert (magic, version, header_size) == (b"RFHM", 1, 48)
+    assert len(body) == header_size + 16 * n
+    cols = np.frombuffer(body, dtype="<f4", offset=header_size).reshape(4, n)
+    return {"origin": (origin_lat, origin_lng), "scale": (dbm_min, dbm_max),
+            "lat": origin_lat + cols[0].astype(np.float64),
+            "lng": origin_lng + cols[1].astype(np.float64),
+            "dbm": cols[2], "intensity": cols[3]}
+
+
+def test_layout_matches_data(sd, client):
+    (sd / "noise_samples.json").write_text(json.dumps(RECORDS, separators=(",", ":")))
+    rf.sd_watcher.check()
+
+    for query in ("", "?bbox=100.7700,13.7276,100.7726,13.7290"):
+        rows = [r for r in client.get("/data" + query).get_json() if r["lat"] is not None]
+        got = decode(client.get("/data.bin" + query).data)
+        assert 0 < len(rows) == len(got["lat"])
+        assert got["scale"] == (rf.HEAT_DBM_MIN, rf.HEAT_DBM_MAX)
+        np.testing.assert_allclose(got["lat"], [r["lat"] for r in rows], atol=1e-6)
+        np.testing.assert_allclose(got["lng"], [r["lng"] for r in rows], atol=1e-6)
+        np.testing.assert_allclose(got["dbm"], [r["dbm"] for r in rows], atol=1e-4)
+        np.testing.assert_allclose(got["intensity"], rf.dbm_to_intensity([r["dbm"] for r in rows]),
+                                   atol=1e-6)
+
+
+def test_empty_payload_is_header_only(sd, client):
+    (sd / "noise_samples.json").write_text(json.dumps(RECORDS[-1:]))
+    rf.sd_watcher.check()
+    body = client.get("/data.bin").data
+    assert len(body) == 48 and decode(body)["origin"] == (rf.DEFAULT_CENTER["lat"],
+                                                         rf.DEFAULT_CENTER["lng"])
+
+
+def test_js_decoder_uses_the_same_offsets(client):
+    page = client.get("/").get_data(as_text=True)
+    for snippet in ('"RFHM"', "dv.getUint16(4, true) !== 1", "dv.getUint16(6, true)",
+                    "dv.getUint32(8, true)", "dv.getFloat64(16, true)", "dv.getFloat64(24, true)",
+                    "headerSize + 4 * n", "headerSize + 8 * n", "headerSize + 12 * n"):
+        assert snippet in page, snippet
@@ -0,0 +1,149 @@
+"""SampleDB: จุดซ้ำ, replace แบบเทียบส่วนต้น, connection ของตัวอ่าน, ข้อมูลอยู่รอดหลังถอดการ์ด"""
+import threading
+
+import app as rf
+from conftest import write_samples
+
+A = (13.7276, 100.7726, "2025-01-01 00:00:00", -40.0)
+B = (13.7277, 100.7726, "2025-01-01 00:00:01", -41.0)
+C = (13.7278, 100.7726, "2025-01-01 00:00:02", -42.0)
+D = (13.7279, 100.7726, "2025-01-01 00:00:03", -43.0)
+
+
+def rows(*records):
+    return rf._records_to_db_rows([{"lat": a, "lng": b, "time": t, "dbm": d}
+                                   for a, b, t, d in records])
+
+
+def stored(db, session="s"):
+    conn = db._read_conn()
+    return [r[0] for r in conn.execute(
+        "SELECT time FROM samples WHERE session = ? ORDER BY id", (session,))]
+
+
+def generation(db):
+    return db.state()[0]["generation"]
+
+
+def test_append_skips_duplicates(tmp_path):
+    db = rf.SampleDB(str(tmp_path / "rf.db"))
+    db.append("s", "p", rows(A, B))
+    version = db.state()[0]["version"]
+    db.append("s", "p", rows(A, B))
+    assert stored(db) == [A[2], B[2]]
+    assert db.state()[0]["version"] == version   # ไม่มีอะไรเปลี่ยน = ไม่ขยับเวอร์ชัน
+
+
+def test_replace_keeps_prefix_and_trims_tail(tmp_path):
+    db = rf.SampleDB(str(tmp_path / "rf.db"))
+    db.replace("s", "p", rows(A, B, C))
+    ids = [r[0] for r in db._read_conn().execute("SELECT id FROM samples ORDER BY id")]
+    gen = generation(db)
+
+    db.replace("s", "p", rows(A, B, C, D))            # ต่อท้าย
+    assert stored(db) == [A[2], B[2], C[2], D[2]]
+    assert generation(db) == gen
+
+    db.replace("s", "p", rows(A, B, C))               # undo
+    assert stored(db) == [A[2], B[2], C[2]]
+    assert generation(db) == gen + 1
+    # ส่วนต้นเป็นแถวเดิม ไม่ได้ลบแล้วเขียนใหม่ทั้งตาราง
+    assert [r[0] for r in db._read_conn().execute("SELECT id FROM samples ORDER BY id")] == ids
+
+    db.replace("s", "p", rows())                      # clear
+    assert stored(db) == []
+
+
+def test_replace_with_duplicate_records_is_stable(tmp_path):
+    db = rf.SampleDB(str(tmp_path / "rf.db"))
+    db.replace("s", "p", rows(A, B, A, C))
+    assert stored(db) == [A[2], B[2], C[2]]
+    state = db.state()[0]
+    # อ่านไฟล์เดิมทั้งไฟล์ซ้ำ (เช่น /reload) ต้องไม่ลบ/เขียนหางใหม่และไม่ขยับ generation
+    db.replace("s", "p", rows(A, B, A, C))
+    assert db.state()[0] == state
+    db.replace("s", "p", rows(A, B, A, C, D))
+    assert stored(db) == [A[2], B[2], C[2], D[2]]
+    assert generation(db) == state["generation"]
+
+
+def test_sessions_are_independent(tmp_path):
+    db = rf.SampleDB(str(tmp_path / "rf.db"))
+    db.replace("s", "p1", rows(A, B))
+    db.replace("t", "p2", rows(A, C))
+    db.replace("s", "p1", rows(A))
+    assert stored(db, "s") == [A[2]]
+    assert stored(db, "t") == [A[2], C[2]]
+    assert [(s["name"], s["path"], s["points"]) for s in db.sessions()] == \
+        [("s", "p1", 1), ("t", "p2", 2)]
+
+
+def test_each_thread_reads_with_its_own_connection(tmp_path):
+    db = rf.SampleDB(str(tmp_path / "rf.db"))
+    db.append("s", "p", rows(A))
+    mine = db._read_conn()
+    theirs = []
+    worker = threading.Thread(target=lambda: theirs.append(db._read_conn()))
+    worker.start()
+    worker.join()
+    assert theirs[0] is not mine
+    assert db._read_conn() is mine
+
+
+def test_concurrent_readers_see_whole_commits(tmp_path):
+    db = rf.SampleDB(str(tmp_path / "rf.db"))
+    db.append("s", "p", rows(A))
+    batches, size = 40, 25
+    done = threading.Event()
+    torn, errors = [], []
+
+    def writer():
+        try:
+            for b in range(batches):
+                db.append("s", "p", rows(*[(13.0 + b, 100.0 + i * 1e-5, "2025-01-02 00:00:00", -50.0)
+                                           for i in range(size)]))
+        finally:
+            done.set()
+
+    def reader():
+        try:
+            while not done.is_set():
+                state, _, cols, _ = db.read_columns_since(None, None, None, 0, 0)
+                # state กับแถวมาจาก transaction เดียวกัน: แถวครบทุก commit ที่ state นับ
+                if cols[0].size != 1 + (state[1] - 1) * size:
+                    torn.append((state[1], cols[0].size))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)] + [threading.Thread(target=writer)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors and not torn
+    assert len(stored(db)) == 1 + batches * size
+
+
+def test_ingested_points_survive_card_removal_and_restart(sd, client, monkeypatch):
+    write_samples(sd / "noise_samples.json", [A, B, C])
+    rf.sd_watcher.check()
+    expected = client.get("/data").get_json()
+    assert len(expected) == 3
+
+    # ถอดการ์ด + เริ่ม process ใหม่: DB เดิม store ว่าง
+    (sd / "noise_samples.json").unlink()
+    monkeypatch.setattr(rf, "sample_db", rf.SampleDB(rf.sample_db.path))
+    monkeypatch.setitem(rf._cache, "store", rf.MeasurementStore())
+    monkeypatch.setattr(rf, "_files", {})
+    rf.sd_watcher.check()
+    assert client.get("/data").get_json() == expected
+
+
+def test_session_range_ignores_placeholder_times(tmp_path):
+    db = rf.SampleDB(str(tmp_path / "rf.db"))
+    db.replace("s", "p", rows((13.0, 100.0, "----", -40.0), B,
+                              (13.1, 100.0, "0000-00-00 00:00:00", -41.0), C))
+    db.replace("t", "p2", rows((13.0, 100.0, "----", -40.0)))
+    info = {s["name"]: s for s in db.sessions()}
+    assert (info["s"]["first"], info["s"]["last"], info["s"]["points"]) == (B[2], C[2], 4)
+    assert (info["t"]["first"], info["t"]["last"], info["t"]["points"]) == (None, None, 1)
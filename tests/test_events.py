@@ -0,0 +1,64 @@
+"""/events (SSE): สถานะแรกทันที, จุดที่ต่อท้ายบนการ์ดมาเป็น event append, reset เมื่อ undo"""
+import itertools
+import json
+
+import pytest
+
+import app as rf
+from conftest import write_samples
+
+POINTS = [(13.7276 + i * 1e-5, 100.7726, "2025-01-01 12:00:%02d" % i, -40.0 - i) for i in range(5)]
+
+
+def parse(chunk):
+    if isinstance(chunk, bytes):
+        chunk = chunk.decode()
+    fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n") if ": " in line)
+    return fields.get("event"), json.loads(fields["data"]) if "data" in fields else None
+
+
+@pytest.fixture
+def stream(sd, client, monkeypatch):
+    monkeypatch.setattr(rf, "SSE_KEEPALIVE", 0.2)   # test พังจะได้ไม่ค้าง
+    write_samples(sd / "noise_samples.json", POINTS[:3])
+    rf.sd_watcher.check()
+    resp = client.get("/events", buffered=False)
+    assert resp.mimetype == "text/event-stream"
+    assert resp.headers["Cache-Control"] == "no-cache"
+    chunks = iter(resp.response)
+
+    def next_event(name):
+        """event ถัดไปที่ชื่อ name (ข้าม keepalive และ status ที่มาคั่น)"""
+        for chunk in itertools.islice(chunks, 50):   # keepalive ทุก 0.2 วินาที: ไม่เกิน ~10 วินาที
+            event = parse(chunk)
+            if event[0] == name:
+                return event
+        raise AssertionError("no %s event" % name)
+    yield next_event
+    resp.close()
+
+
+def test_append_on_watcher_yields_append_event(sd, stream):
+    _, data = stream("status")
+    assert data["mounted"] is True
+
+    write_samples(sd / "noise_samples.json", POINTS)
+    rf.sd_watcher.check()
+    _, data = stream("append")
+    assert data["sessions"] == ["noise_samples"]
+    assert [(r["lat"], r["lng"], r["time"], r["dbm"]) for r in data["rows"]] == \
+        [(round(a, 6), b, t, d) for a, b, t, d in POINTS[3:]]
+
+    write_samples(sd / "noise_samples.json", POINTS[:2])   # undo
+    rf.sd_watcher.check()
+    _, data = stream("reset")
+    assert data["points"] == 2
+
+
+def test_closing_the_stream_unsubscribes(sd, client):
+    before = len(rf.event_hub._subscribers)
+    resp = client.get("/events", buffered=False)
+    next(iter(resp.response))
+    assert len(rf.event_hub._subscribers) == before + 1
+    resp.close()
+    assert len(rf.event_hub._subscribers) == before
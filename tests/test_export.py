@@ -0,0 +1,80 @@
+"""/export: ทุก format อ่านกลับได้ จำนวนแถวครบ และจุดที่ยังไม่มี fix เป็นค่าว่าง/null"""
+import csv
+import io
+import json
+
+import pytest
+
+import app as rf
+
+FIXED = [{"lat": 13.7276 + i * 1e-5, "lng": 100.7726, "time": "2025-01-01 12:00:%02d" % i,
+          "dbm": -40.5 - i} for i in range(7)]
+# GPS ยังไม่ fix: พิกัด null, เวลาเป็นตัวยึดที่ไม่ใช่เวลาจริง
+NO_FIX = [{"lat": None, "lng": None, "time": "----", "dbm": -60.0},
+          {"lat": None, "lng": None, "time": "0000-00-00 00:00:00", "dbm": -61.0}]
+RECORDS = FIXED[:3] + NO_FIX + FIXED[3:]
+
+
+@pytest.fixture
+def export(sd, client, monkeypatch):
+    monkeypatch.setattr(rf, "EXPORT_CHUNK_ROWS", 4)   # หลายก้อน: ต่อรอยก้อนต้องถูก
+    (sd / "noise_samples.json").write_text(json.dumps(RECORDS, separators=(",", ":")))
+    rf.sd_watcher.check()
+
+    def get(fmt):
+        resp = client.get("/export?format=" + fmt)
+        assert resp.status_code == 200
+        assert resp.headers["Content-Disposition"].startswith("attachment;")
+        assert resp.headers["Content-Disposition"].rstrip('"').endswith("." + rf.EXPORT_FORMATS[fmt][1])
+        return resp.data
+    return get
+
+
+def test_csv(export):
+    rows = list(csv.reader(io.StringIO(export("csv").decode())))
+    assert rows[0] == ["lat", "lng", "time", "dbm"]
+    assert len(rows) - 1 == len(RECORDS)
+    for row, rec in zip(rows[1:], RECORDS):
+        assert row[2] == rec["time"] and float(row[3]) == rec["dbm"]
+        if rec["lat"] is None:
+            assert row[:2] == ["", ""]
+        else:
+            assert (float(row[0]), float(row[1])) == (rec["lat"], rec["lng"])
+
+
+def test_geojson(export):
+    body = json.loads(export("geojson"))
+    assert body["type"] == "FeatureCollection"
+    assert len(body["features"]) == len(RECORDS)
+    for feature, rec in zip(body["features"], RECORDS):
+        assert feature["type"] == "Feature"
+        assert feature["properties"] == {"dbm": rec["dbm"], "time": rec["time"]}
+        if rec["lat"] is None:
+            assert feature["geometry"] is None
+        else:
+            assert feature["geometry"] == {"type": "Point", "coordinates": [rec["lng"], rec["lat"]]}
+
+
+def test_ndjson(export):
+    lines = export("ndjson").decode().splitlines()
+    assert len(lines) == len(RECORDS)
+    assert [json.loads(line) for line in lines] == RECORDS
+
+
+def test_parquet(export):
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(io.BytesIO(export("parquet")))
+    assert table.num_rows == len(RECORDS)
+    assert table.column_names == ["lat", "lng", "time", "dbm"]
+    cols = table.to_pydict()
+    assert cols["dbm"] == [r["dbm"] for r in RECORDS]
+    assert cols["lat"] == [r["lat"] for r in RECORDS]
+    # เวลาที่ไม่ใช่เวลาจริง -> null
+    assert [t is None for t in cols["time"]] == [r in NO_FIX for r in RECORDS]
+    assert [t.strftime("%Y-%m-%d %H:%M:%S") for t in cols["time"] if t] == [r["time"] for r in FIXED]
+
+
+def test_parquet_without_pyarrow_is_501(sd, client, monkeypatch):
+    monkeypatch.setattr(rf, "pq", None)
+    assert client.get("/export?format=parquet").status_code == 501
+    assert client.get("/export?format=xml").status_code == 400
@@ -0,0 +1,28 @@
+"""/data/grid: bbox ผ่าน spatial index ได้ผลเท่ากับกรองทุกจุด"""
+import random
+
+import numpy as np
+
+import app as rf
+from conftest import write_samples
+
+
+def test_bbox_grid_matches_full_scan(sd, client):
+    rnd = random.Random(4)
+    points = [(13.7276 + rnd.uniform(-3e-3, 3e-3), 100.7726 + rnd.uniform(-3e-3, 3e-3),
+               "2025-01-01 00:%02d:%02d" % (i // 60 % 60, i % 60), rnd.uniform(-70, -25))
+              for i in range(3000)]
+    write_samples(sd / "noise_samples.json", points)
+    rf.sd_watcher.check()
+    bbox = (100.7716, 13.7262, 100.7741, 13.7284)
+    body = client.get("/data/grid?zoom=18&bbox=%s,%s,%s,%s" % bbox).get_json()
+
+    lat = np.array([round(p[0], 6) for p in points])
+    lng = np.array([round(p[1], 6) for p in points])
+    dbm = np.array([round(p[3], 1) for p in points])
+    inside = (lng >= bbox[0]) & (lng <= bbox[2]) & (lat >= bbox[1]) & (lat <= bbox[3])
+    assert 0 < inside.sum() < len(points)
+    expected = rf.grid_aggregate(lat[inside], lng[inside], dbm[inside], 18, rf.GRID_CELL_PX)
+    assert body["points"] == int(inside.sum())
+    assert sorted(body["cells"], key=lambda c: (c["lat"], c["lng"])) == \
+        sorted(expected, key=lambda c: (c["lat"], c["lng"]))
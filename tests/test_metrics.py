@@ -0,0 +1,37 @@
+"""ตัวนับของแคชผ่าน Metrics: นับจากหลาย thread พร้อมกันค่าไม่หาย (รวม thread ที่จบไปแล้ว)"""
+import threading
+
+import app as rf
+
+
+def test_cache_counters_are_exact_across_threads():
+    before = rf.cache_stats()
+    threads, per_thread = 16, 5000
+    start = threading.Barrier(threads)
+
+    def work():
+        start.wait()
+        for _ in range(per_thread):
+            rf._count("hits")
+        rf._count("parallel_reads", 3)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    del workers, t   # ให้ shard ของ thread ที่จบถูกยุบเข้ากองกลาง
+    after = rf.cache_stats()
+    assert after["hits"] - before["hits"] == threads * per_thread
+    assert after["parallel_reads"] - before["parallel_reads"] == threads * 3
+    assert after["misses"] == before["misses"]
+
+
+def test_counters_show_in_stats_and_metrics(sd, client):
+    before = rf.cache_stats()["misses"]
+    (sd / "noise_samples.json").write_text('[{"lat":13.7,"lng":100.7,"time":"x","dbm":-40}]')
+    rf.sd_watcher.check()
+    assert client.get("/sdstatus").get_json()["cache"]["misses"] == before + 1
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'rf_data_cache_events_total{event="misses"} %d' % (before + 1) in text
+    assert 'rf_cache_misses_total{cache="store"} %d' % (before + 1) in text
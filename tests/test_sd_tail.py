@@ -0,0 +1,82 @@
+"""อ่านการ์ดแบบต่อท้าย (parse เฉพาะส่วนท้าย) และ undo/clear ที่ต้องอ่านทั้งไฟล์"""
+import app as rf
+from conftest import drain, write_samples
+
+
+def samples(n):
+    return [(13.7276 + i * 1e-5, 100.7726, "2025-01-01 12:%02d:%02d" % (i // 60, i % 60),
+             -40.0 - i % 30) for i in range(n)]
+
+
+def stored(records):
+    return [{"lat": round(a, 6), "lng": b, "time": t, "dbm": d} for a, b, t, d in records]
+
+
+def test_append_parses_only_the_tail(sd):
+    path = sd / "noise_samples.json"
+    points = samples(8)
+    write_samples(path, points[:5])
+    rf.sd_watcher.check()
+    q = rf.event_hub.subscribe()
+    full = rf.cache_stats()["full_reads"]
+    tail = rf.cache_stats()["tail_reads"]
+
+    write_samples(path, points)
+    rf.sd_watcher.check()
+    assert rf.cache_stats()["tail_reads"] == tail + 1
+    assert rf.cache_stats()["full_reads"] == full
+    assert rf._files[str(path)]["count"] == 8
+    assert rf.read_measurements().rows() == stored(points)
+    appended = [row for name, data in drain(q) if name == "append" for row in data["rows"]]
+    assert appended == stored(points[5:])
+
+    # ต่อท้ายซ้ำอีกรอบจาก layout ที่อัปเดตแล้ว
+    more = samples(10)
+    write_samples(path, more)
+    rf.sd_watcher.check()
+    assert rf.cache_stats()["tail_reads"] == tail + 2
+    assert rf.read_measurements().rows() == stored(more)
+
+
+def test_tail_parse_refuses_non_appends(sd):
+    path = sd / "noise_samples.json"
+    points = samples(6)
+    write_samples(path, points[:4])
+    rf.sd_watcher.check()
+    state = rf._files[str(path)]
+
+    # จุดแรกถูกแก้ (หัวไฟล์เปลี่ยน) / ไฟล์กำลังเขียนค้างครึ่ง -> ต้อง parse เต็ม
+    write_samples(path, [(1.0, 2.0, "2025-01-01 00:00:00", -1.0)] + points[1:6])
+    assert rf._parse_tail(dict(state), str(path), path.stat().st_size) is None
+    write_samples(path, points)
+    text = path.read_text()
+    path.write_text(text[:-10])
+    assert rf._parse_tail(dict(state), str(path), path.stat().st_size) is None
+
+
+def test_undo_and_clear_replace_rows(sd):
+    path = sd / "noise_samples.json"
+    points = samples(6)
+    write_samples(path, points)
+    rf.sd_watcher.check()
+    q = rf.event_hub.subscribe()
+    full = rf.cache_stats()["full_reads"]
+
+    # undo ของ firmware: เขียนไฟล์ใหม่โดยไม่มีจุดสุดท้าย
+    write_samples(path, points[:-1])
+    rf.sd_watcher.check()
+    assert rf.cache_stats()["full_reads"] == full + 1
+    assert rf.read_measurements().rows() == stored(points[:-1])
+    assert [name for name, _ in drain(q) if name in ("append", "reset")] == ["reset"]
+
+    # หลัง undo ต่อท้ายได้แบบ tail อีก
+    tail = rf.cache_stats()["tail_reads"]
+    write_samples(path, points[:-1] + samples(8)[6:])
+    rf.sd_watcher.check()
+    assert rf.cache_stats()["tail_reads"] == tail + 1
+    assert len(rf.read_measurements()) == 7
+
+    path.write_text("[]")
+    rf.sd_watcher.check()
+    assert len(rf.read_measurements()) == 0
+    assert "reset" in [name for name, _ in drain(q)]
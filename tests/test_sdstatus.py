@@ -0,0 +1,20 @@
+"""/sdstatus ถูก poll ถี่: ต้องตอบจากหน่วยความจำ ไม่ query SQLite"""
+import app as rf
+from conftest import write_samples
+
+
+def test_sdstatus_does_not_touch_db(sd, client, monkeypatch):
+    write_samples(sd / "noise_samples.json",
+                  [(13.7276, 100.7726, "2025-01-01 12:00:%02d" % i, -40.0) for i in range(5)])
+    rf.sd_watcher.check()
+
+    def no_db(*args, **kwargs):
+        raise AssertionError("/sdstatus queried SQLite")
+    for name in ("state", "read_columns_since", "_read_conn", "_connect"):
+        monkeypatch.setattr(rf.sample_db, name, no_db)
+
+    for _ in range(3):
+        info = client.get("/sdstatus").get_json()
+        assert info["mounted"] is True
+        assert info["points"] == 5
+        assert info["cache"]["db_version"] == rf._cache["store"].db_version
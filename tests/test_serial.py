@@ -0,0 +1,139 @@
+"""ตัวรับจุดสดทาง USB serial: ทดสอบกับ pty แทนบอร์ด ESP32 จริง"""
+import os
+import pty
+import time
+
+import pytest
+
+import app as rf
+from conftest import drain, write_samples
+
+STATUS = (b"----------- STATUS -----------\r\n"
+          b"GPS OK  LAT=13.727600  LNG=100.772600  TIME=2025-01-01 12:00:00\r\n"
+          b"Sats=7\r\n"
+          b"RF dBm=-45.3\r\n"
+          b"------------------------------\r\n")
+
+
+def record_json(r):
+    return '{"lat":%.6f,"lng":%.6f,"time":"%s","dbm":%.1f}' % r
+
+
+def log_frames(saved, r):
+    """สิ่งที่ firmware พิมพ์ตอนกด LOG (saved = จุดบนการ์ดก่อนหน้า)"""
+    saved.append(r)
+    return (("🔘 LOG Button pressed!\r\n"
+             "Will save point: lat=%.6f lng=%.6f rf=%.1f dBm time=%s\r\n"
+             % (r[0], r[1], r[3], r[2]))
+            + "----- After Save, JSON is: -----\r\n"
+            + "[" + ",".join(record_json(x) for x in saved) + "]\r\n"
+            + "--------------------------------\r\n").encode()
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def device(sd, monkeypatch):
+    """pty แทน ESP32: คืน (fd ฝั่งบอร์ด, SerialIngest ที่ต่ออยู่)"""
+    monkeypatch.setattr(rf, "SERIAL_RETRY_S", 0.05)
+    monkeypatch.setattr(rf, "SERIAL_MAX_LINE_BYTES", 512)
+    master, slave = pty.openpty()
+    ingest = rf.SerialIngest(rf.event_hub, rf.sd_watcher, port=os.ttyname(slave))
+    monkeypatch.setattr(rf, "serial_ingest", ingest)
+    ingest.start()
+    assert wait_for(lambda: ingest.connected)
+    yield master, ingest
+    ingest.stop(timeout=5)
+    os.close(master)
+    os.close(slave)
+
+
+def store_rows():
+    return rf.read_measurements().rows()
+
+
+def test_parser_is_incremental_and_tolerates_noise():
+    stream = (b"\xff\xfe\x00garbage\r\n" + STATUS
+              + b"----------- STATUS -----------\r\nGPS not fixed yet...\r\nSats=0\r\n"
+              + b"RF dBm=-50.0\r\n------------------------------\r\n"
+              + b"----- After Save, JSON is: -----\r\n[" + b"x" * 600 + b"]\r\n"
+              + b"\xe2\x86\xa9 UNDO: new JSON:\r\n[{\"lat\":1,\r\n"
+              + b"\xf0\x9f\xa7\xb9 SD: File cleared to []\r\n")
+    whole = rf.SerialParser(max_line=512)
+    expected = whole.feed(stream)
+    bytewise = rf.SerialParser(max_line=512)
+    events = []
+    for i in range(len(stream)):
+        events += bytewise.feed(stream[i:i + 1])
+    assert events == expected
+    assert [kind for kind, _ in events] == ["status", "status", "file"]
+    assert events[0][1] == {"fix": True, "lat": 13.7276, "lng": 100.7726,
+                            "time": "2025-01-01 12:00:00", "sats": 7, "dbm": -45.3}
+    assert events[1][1] == {"fix": False, "sats": 0, "dbm": -50.0}
+    assert events[2][1] == []
+    # บรรทัดยาวเกิน + JSON เสียจาก undo
+    assert bytewise.dropped == 2
+
+
+def test_unterminated_status_block_does_not_swallow_points():
+    parser = rf.SerialParser()
+    events = parser.feed(b"----------- STATUS -----------\r\nRF dBm=-40.0\r\n"
+                         + b"noise\r\n" * 10
+                         + b"Will save point: lat=1.000000 lng=2.000000 rf=-3.0 dBm time=x\r\n")
+    assert events == [("point", {"lat": 1.0, "lng": 2.0, "time": "x", "dbm": -3.0})]
+
+
+def test_pty_stream_feeds_store_and_events(device):
+    master, ingest = device
+    q = rf.event_hub.subscribe()
+    saved = []
+    points = [(13.7276 + i * 1e-5, 100.7726, "2025-01-01 12:00:%02d" % i, -40.0 - i)
+              for i in range(3)]
+
+    os.write(master, b"\x00\xffboot noise\x1b[0m\r\n" + STATUS)
+    for r in points[:2]:
+        os.write(master, log_frames(saved, r))
+    # JSON ทั้งไฟล์ยาวเกิน SERIAL_MAX_LINE_BYTES: ทิ้งบรรทัดนั้น แต่จุดยังมาจาก "Will save point"
+    big = log_frames(saved, points[2]).replace(b"[{", b"[" + b" " * 600 + b"{", 1)
+    os.write(master, big)
+
+    assert wait_for(lambda: len(store_rows()) == 3)
+    assert [(r["lat"], r["lng"], r["time"], r["dbm"]) for r in store_rows()] == \
+        [(round(a, 6), b, t, d) for a, b, t, d in points]
+    assert ingest.parser.dropped == 1
+    assert ingest.points == 3
+
+    events = drain(q)
+    live = [data for name, data in events if name == "live"]
+    assert live and live[0]["lat"] == 13.7276 and live[0]["dbm"] == -45.3
+    appended = [row for name, data in events if name == "append" for row in data["rows"]]
+    assert [row["time"] for row in appended] == [r[2] for r in points]
+    assert all(data["sessions"] == [rf.SERIAL_SESSION] for name, data in events if name == "append")
+
+    # undo ที่ firmware ตัด JSON พัง -> ข้าม, undo ที่ถูกต้อง -> แถวสุดท้ายหาย + reset
+    os.write(master, "↩ UNDO: new JSON:\r\n[{\"lat\":1,\r\n".encode())
+    saved.pop()
+    os.write(master, ("↩ UNDO: new JSON:\r\n["
+                      + ",".join(record_json(x) for x in saved) + "]\r\n").encode())
+    assert wait_for(lambda: len(store_rows()) == 2)
+    assert ingest.parser.dropped == 2
+    assert ("reset" in [name for name, _ in drain(q)])
+
+
+def test_serial_does_not_relabel_card_session(sd, device, client):
+    master, _ = device
+    write_samples(sd / "noise_samples.json", [(13.7276, 100.7726, "2025-01-01 11:00:00", -50.0)])
+    rf.sd_watcher.check()
+    os.write(master, log_frames([(13.7276, 100.7726, "2025-01-01 11:00:00", -50.0)],
+                                (13.7277, 100.7726, "2025-01-01 12:00:00", -41.0)))
+    assert wait_for(lambda: len(store_rows()) == 2)
+    sessions = client.get("/sessions").get_json()
+    assert [(s["name"], s["path"], s["points"]) for s in sessions] == \
+        [("noise_samples", str(sd / "noise_samples.json"), 2)]
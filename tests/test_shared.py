@@ -0,0 +1,84 @@
+"""โหมดหลาย worker: ไฟล์คอลัมน์ที่ใช้ร่วมกัน (SharedStore) และการเลือก leader ด้วย flock"""
+import os
+
+import app as rf
+
+
+def rows(*recs):
+    return rf._records_to_db_rows([{"lat": a, "lng": b, "time": t, "dbm": d} for a, b, t, d in recs])
+
+
+def records(n, start=0):
+    return [(13.7 + i * 1e-5, 100.7, "2025-01-01 %02d:%02d:%02d" % (i // 3600, i // 60 % 60, i % 60)
+             if i % 7 else "----", -40.0 - i % 50) for i in range(start, start + n)]
+
+
+def as_rows(recs):
+    return [{"lat": a, "lng": b, "time": t, "dbm": d} for a, b, t, d in recs]
+
+
+def test_publish_is_seen_by_another_worker(sd, tmp_path):
+    shared = str(tmp_path / "shared")
+    writer, reader = rf.SharedStore(shared), rf.SharedStore(shared)
+    reader.refresh()                          # ยังไม่มีไฟล์: ว่าง ไม่ error
+    assert len(reader) == 0
+
+    data = records(10)
+    rf.sample_db.append("s", "p", rows(*data))
+    assert writer.publish()
+    reader.refresh()
+    first = reader.snapshot()
+    assert first.rows() == as_rows(data)
+    capacity, ino = reader.capacity, reader._ino
+
+    # ต่อท้ายในที่ว่างที่เผื่อไว้: ไฟล์เดิม (inode เดิม) แค่ n ขยับ
+    data += records(20, 10)
+    rf.sample_db.append("s", "p", rows(*records(20, 10)))
+    assert writer.publish()
+    reader.refresh()
+    assert (reader.capacity, reader._ino) == (capacity, ino)
+    assert reader.snapshot().rows() == as_rows(data)
+    assert first.rows() == as_rows(data[:10])   # snapshot เก่ายังเห็นแค่ของเดิม
+
+    # ต่อท้ายเกินที่ว่าง: เขียนไฟล์ใหม่แล้ว rename ทับ ตัวอ่านต้อง map ไฟล์ใหม่
+    more = records(capacity, 30)
+    data += more
+    rf.sample_db.append("s", "p", rows(*more))
+    assert writer.publish()
+    assert not writer.publish()                # ไม่มีอะไรใหม่
+    reader.refresh()
+    assert reader.capacity > capacity and reader._ino != ino
+    assert reader.snapshot().rows() == as_rows(data)
+    assert first.rows() == as_rows(data[:10])   # mmap ของไฟล์เก่ายังอ่านได้
+    generation = reader.generation
+
+    # undo: generation ใหม่ ทั้งชุดถูกเขียนใหม่
+    rf.sample_db.replace("s", "p", rows(*data[:-1]))
+    assert writer.sync()
+    reader.refresh()
+    assert reader.generation == generation + 1
+    assert reader.snapshot().rows() == as_rows(data[:-1])
+    meta = rf.sample_db.state()[0]
+    assert (reader.db_generation, reader.db_version) == (meta["generation"], meta["version"])
+
+
+def test_reader_sync_publishes_when_db_is_newer(sd, tmp_path):
+    shared = str(tmp_path / "shared")
+    writer, reader = rf.SharedStore(shared), rf.SharedStore(shared)
+    rf.sample_db.append("s", "p", rows(*records(5)))
+    assert writer.sync()
+    assert not reader.sync()                   # worker อื่น publish ไปแล้ว: แค่ refresh
+    assert len(reader) == 5
+
+
+def test_one_leader_at_a_time(sd, tmp_path, monkeypatch):
+    monkeypatch.setattr(rf, "SHARED_COLUMNS_DIR", str(tmp_path / "shared"))
+    first, second = rf.SDWatcher(rf.event_hub), rf.SDWatcher(rf.event_hub)
+    assert first.is_leader()
+    assert not second.is_leader()
+    assert first.is_leader()                   # ถือล็อกไว้ตลอด
+    # leader ตาย (fd ถูกปิด) -> ตัวถัดไปได้ล็อกแทน
+    os.close(first._leader_fd)
+    first._leader_fd = None
+    assert second.is_leader()
+    os.close(second._leader_fd)
@@ -0,0 +1,79 @@
+"""สถิติ /stats: รวมกลุ่ม (Chan), ลบกลุ่มออก (n ติดลบ) และ index ที่ตามต่อท้าย/undo ตรงกับสร้างใหม่"""
+import numpy as np
+import pytest
+
+import app as rf
+from conftest import write_samples
+
+
+def accumulate(values, key=0):
+    groups, _ = rf._stats_from_values(np.full(len(values), key, dtype=np.int64),
+                                      np.asarray(values, dtype=np.float64))
+    return groups
+
+
+def concat(*tables):
+    return {name: np.concatenate([t[name] for t in tables]) for name in rf._STATS_FIELDS}
+
+
+def test_combine_matches_numpy():
+    rnd = np.random.default_rng(1)
+    a, b = rnd.normal(-50, 8, 300), rnd.normal(-30, 3, 50)
+    both = concat(accumulate(a), accumulate(b))
+    merged = rf._stats_combine(both, both["key"])
+    x = np.concatenate([a, b])
+    assert merged["n"].tolist() == [350]
+    assert merged["mean"][0] == pytest.approx(x.mean())
+    assert merged["m2"][0] == pytest.approx(((x - x.mean()) ** 2).sum())
+    assert (merged["min"][0], merged["max"][0]) == (x.min(), x.max())
+
+
+def test_combine_with_negative_n_removes_a_group():
+    rnd = np.random.default_rng(2)
+    keep, drop = rnd.normal(-50, 8, 200), rnd.normal(-20, 5, 40)
+    total = accumulate(np.concatenate([keep, drop]))
+    removed, _ = rf._stats_negate(accumulate(drop), {"count": np.zeros(0, dtype=np.int64)})
+    both = concat(total, removed)
+    left = rf._stats_combine(both, both["key"])
+    assert left["n"].tolist() == [200]
+    assert left["mean"][0] == pytest.approx(keep.mean())
+    assert left["m2"][0] == pytest.approx(((keep - keep.mean()) ** 2).sum())
+
+    # ลบจนหมด -> กลุ่มหายไป
+    gone = concat(accumulate(drop), removed)
+    assert rf._stats_combine(gone, gone["key"])["key"].size == 0
+
+
+def stats_of(snap, index):
+    """rf_stats ของ snap โดยใช้ index ที่ให้มา (ไม่ใช่ตัวใน derived)"""
+    saved = snap.derived.get("stats")
+    snap.derived["stats"] = index
+    try:
+        overall, groups = rf.rf_stats(snap, by=("cell", "time"))
+    finally:
+        snap.derived["stats"] = saved
+    return overall, sorted(groups, key=lambda g: (g["lat"], g["lng"], g["time"]))
+
+
+def test_incremental_index_matches_rebuild(sd, client):
+    rnd = np.random.default_rng(3)
+    points = [(13.72 + rnd.uniform(0, 0.02), 100.77 + rnd.uniform(0, 0.02),
+               "2025-01-01 %02d:%02d:%02d" % (i // 3600, i // 60 % 60, i % 60),
+               float(np.round(rnd.normal(-45, 10), 1))) for i in range(0, 4000, 2)]
+    path = sd / "noise_samples.json"
+    steps = [points[:1200], points[:1500], points[:1400], points[:1390], points]
+    for step in steps:
+        write_samples(path, step)
+        rf.sd_watcher.check()
+        snap = rf.read_measurements()
+        incremental = rf.stats_index(snap)
+        fresh = rf.StatsIndex()
+        fresh.sync(snap)
+        assert stats_of(snap, incremental) == stats_of(snap, fresh)
+
+    dbm = np.array([p[3] for p in points])
+    overall = client.get("/stats").get_json()["overall"]
+    assert overall["n"] == len(points)
+    assert overall["mean"] == pytest.approx(dbm.mean(), abs=0.01)
+    assert overall["std"] == pytest.approx(dbm.std(ddof=1), abs=0.01)
+    assert (overall["min"], overall["max"]) == (dbm.min(), dbm.max())
@@ -0,0 +1,59 @@
+"""MeasurementStore แบบคอลัมน์: แปลงกลับเป็นแถวได้เหมือนเดิม, snapshot ไม่เปลี่ยนตามการต่อท้าย/แทนที่"""
+import json
+
+import app as rf
+
+RECORDS = [
+    {"lat": 13.7276, "lng": 100.7726, "time": "2025-01-01 12:00:00", "dbm": -40.5},
+    {"lat": None, "lng": None, "time": "0000-00-00 00:00:00", "dbm": -41.0},   # GPS ยังไม่ fix
+    {"lat": 13.7277, "lng": 100.7727, "time": "----", "dbm": -42.0},
+    {"lat": 13.7278, "lng": 100.7728, "time": "2025-02-30 00:00:00", "dbm": -43.0},  # วันที่ไม่มีจริง
+    {"lat": 13.7279, "lng": 100.7729, "time": None, "dbm": None},
+]
+
+
+def more(n, start):
+    return [{"lat": 13.0 + i * 1e-5, "lng": 100.0, "time": "2025-01-02 00:00:%02d" % (i % 60),
+             "dbm": -50.0 - i % 9} for i in range(start, start + n)]
+
+
+def test_rows_round_trip():
+    store = rf.MeasurementStore()
+    store.replace(RECORDS)
+    snap = store.snapshot()
+    assert snap.rows() == RECORDS
+    assert snap.valid.tolist() == [True, False, True, True, False]
+    assert snap.rows([2, 0]) == [RECORDS[2], RECORDS[0]]
+    assert snap.rows(slice(1, 3), with_index=True) == [
+        {"idx": 1, "lat": None, "lng": None, "dbm": -41.0},
+        {"idx": 2, "lat": 13.7277, "lng": 100.7727, "dbm": -42.0}]
+
+
+def test_snapshots_are_stable_across_extend_and_replace():
+    store = rf.MeasurementStore()
+    store.replace(RECORDS)
+    old = store.snapshot()
+    generation, version = store.generation, store.version
+
+    # ต่อท้ายเกินที่จองไว้หลายรอบ (buffer ถูกขยาย/ย้าย) snapshot เก่ายังเห็นของเดิมครบ
+    added = []
+    for start in range(0, 600, 150):
+        store.extend(more(150, start))
+        added += more(150, start)
+    assert (store.generation, store.version) == (generation, version + 4)
+    assert old.n == len(RECORDS) and old.rows() == RECORDS
+    new = store.snapshot()
+    assert new.rows() == RECORDS + added
+    assert new.time_strings([1, len(RECORDS)]) == ["0000-00-00 00:00:00", added[0]["time"]]
+
+    store.replace(more(3, 900))
+    assert (store.generation, store.version) == (generation + 1, version + 5)
+    assert store.snapshot().rows() == more(3, 900)
+    assert old.rows() == RECORDS and new.rows() == RECORDS + added
+
+
+def test_routes_serve_from_store(sd, client):
+    (sd / "noise_samples.json").write_text(json.dumps(RECORDS))
+    rf.sd_watcher.check()
+    assert client.get("/data").get_json() == RECORDS
+    assert len(rf._cache["store"]) == len(RECORDS)
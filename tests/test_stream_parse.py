@@ -0,0 +1,45 @@
+"""iter_sample_chunks: ไฟล์ใหญ่ที่อ่านทีละก้อน ต้องได้ผลเท่ากับ json.loads ทั้งไฟล์ ไม่ว่าจะตัดก้อนตรงไหน"""
+import io
+import json
+
+import pytest
+
+import app as rf
+
+POINTS = [
+    {"lat": 13.7276, "lng": 100.7726, "time": "2025-01-01 12:00:00", "dbm": -40.5},
+    {"lat": 13.7277, "lng": 100.7727, "time": "a},{b", "dbm": -41.0},     # '}' ',' ในข้อความ
+    {"lat": None, "lng": None, "time": "----", "dbm": -42.0},
+    {"lat": 13.7278, "lng": 100.7728, "time": "ไทย}", "dbm": -43.0},
+]
+
+
+def parse(text, buffer_bytes):
+    chunks = rf.iter_sample_chunks(io.BytesIO(text.encode()), buffer_bytes=buffer_bytes)
+    return [p for chunk in chunks for p in chunk]
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps(POINTS, separators=(",", ":"), ensure_ascii=False),
+    json.dumps(POINTS, indent=2, ensure_ascii=False) + "\n",
+    "[]",
+])
+def test_every_split_matches_json_loads(text):
+    # buffer ทุกขนาด = ตัดทุกตำแหน่ง: กลาง object, กลางข้อความที่มี '}' / ',', ก่อน/หลัง ']' ปิดท้าย
+    expected = json.loads(text)
+    for size in range(1, len(text.encode()) + 2):
+        assert parse(text, size) == expected, size
+
+
+@pytest.mark.parametrize("text", [
+    '[{"lat":1,"lng":2,"time":"x","dbm":-1},{"lat":3,"lng":4',   # จุดท้ายขาดครึ่ง
+    '[{"lat":1,"lng":2,"time":"x}","dbm":-1}',                    # ไม่มี ']' ปิด
+    '[{"lat":1,"lng":2,"time":"x","dbm":-1}}]',
+    '{"lat":1}]',
+])
+def test_truncated_or_malformed_raises_like_json_loads(text):
+    with pytest.raises(ValueError):
+        json.loads(text)
+    for size in (1, 3, 7, 64):
+        with pytest.raises(ValueError):
+            parse(text, size)
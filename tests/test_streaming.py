@@ -0,0 +1,58 @@
+"""/data, /tabledata แบบ stream (ทีละ STREAM_CHUNK_ROWS) ต้องได้ body เดียวกับแบบไม่ stream"""
+import json
+
+import pytest
+
+import app as rf
+
+RECORDS = [{"lat": 13.7276 + i * 1e-5, "lng": 100.7726, "time": "2025-01-01 12:%02d:%02d" % (i // 60, i % 60),
+            "dbm": -40.0 - i % 13 + 0.5} for i in range(53)]
+RECORDS[7] = {"lat": None, "lng": None, "time": "----", "dbm": -60.0}
+
+
+@pytest.fixture
+def chunks(monkeypatch):
+    """นับก้อนที่ _iter_rows ส่งออก (ไม่มี = ตอบแบบ jsonify ทั้งก้อน)"""
+    seen = []
+    real = rf._iter_rows
+
+    def counting(*args, **kwargs):
+        for chunk in real(*args, **kwargs):
+            seen.append(chunk)
+            yield chunk
+    monkeypatch.setattr(rf, "_iter_rows", counting)
+    return seen
+
+
+@pytest.fixture
+def loaded(sd, client, monkeypatch):
+    monkeypatch.setattr(rf, "STREAM_CHUNK_ROWS", 10)   # หลายก้อน + ก้อนสุดท้ายไม่เต็ม
+    (sd / "noise_samples.json").write_text(json.dumps(RECORDS))
+    rf.sd_watcher.check()
+    return client
+
+
+@pytest.mark.parametrize("route", ["/data", "/tabledata", "/data?last=30s",
+                                   "/data?bbox=100.77,13.7276,100.78,13.7280"])
+def test_streamed_body_matches_plain(loaded, chunks, route):
+    sep = "&" if "?" in route else "?"
+    plain = loaded.get(route)
+    body = plain.get_data()
+    assert not chunks
+    streamed = loaded.get(route + sep + "stream=1")
+    assert streamed.mimetype == plain.mimetype == "application/json"
+    assert streamed.get_data() == body.rstrip(b"\n")   # jsonify ต่อท้ายด้วย newline
+    assert len(chunks) > 2
+
+
+def test_large_result_streams_without_asking(loaded, chunks, monkeypatch):
+    monkeypatch.setattr(rf, "STREAM_MIN_ROWS", 20)
+    assert loaded.get("/data").get_json() == RECORDS
+    assert len(chunks) == 2 + 6   # "[" + 6 ก้อนของ 53 แถว + "]"
+
+
+def test_ndjson_lines_match_json_rows(loaded):
+    lines = loaded.get("/data?format=ndjson").get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == RECORDS
+    lines = loaded.get("/tabledata?format=ndjson").get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == loaded.get("/tabledata").get_json()
@@ -0,0 +1,60 @@
+"""/tabledata?offset=&limit=: ขอบหน้า, เรียง, กรอง (ตาราง virtual scroll)"""
+import json
+
+import pytest
+
+import app as rf
+
+RECORDS = [{"lat": 13.7276 + i * 1e-5, "lng": 100.7726, "time": "2025-01-01 12:00:%02d" % i,
+            "dbm": -30.0 - (i * 7) % 23} for i in range(25)]
+
+
+@pytest.fixture
+def page(sd, client):
+    (sd / "noise_samples.json").write_text(json.dumps(RECORDS, separators=(",", ":")))
+    rf.sd_watcher.check()
+
+    def get(query):
+        resp = client.get("/tabledata?" + query)
+        assert resp.status_code == 200, resp.get_json()
+        return resp.get_json()
+    return get
+
+
+def test_page_boundaries(page):
+    n = len(RECORDS)
+    first = page("offset=0&limit=10")
+    assert (first["total"], first["offset"], first["limit"]) == (n, 0, 10)
+    assert [r["idx"] for r in first["rows"]] == list(range(10))
+
+    # หน้าต่อกันครบทุกแถว ไม่ซ้ำไม่ขาด หน้าสุดท้ายสั้นกว่า limit
+    got = [r["idx"] for off in range(0, n, 10) for r in page("offset=%d&limit=10" % off)["rows"]]
+    assert got == list(range(n))
+    assert [r["idx"] for r in page("offset=%d&limit=10" % (n - 3))["rows"]] == [n - 3, n - 2, n - 1]
+
+    assert page("offset=%d&limit=10" % n)["rows"] == []
+    assert page("offset=1000&limit=10") == {"total": n, "offset": 1000, "limit": 10, "rows": []}
+    assert page("offset=0&limit=0")["rows"] == []
+    assert page("offset=-5&limit=2")["offset"] == 0
+    assert page("limit=999999")["limit"] == rf.TABLE_MAX_LIMIT
+    last = RECORDS[24]
+    assert page("offset=24&limit=1")["rows"] == [
+        {"idx": 24, "lat": last["lat"], "lng": last["lng"], "dbm": last["dbm"]}]
+
+
+def test_sorted_and_filtered_pages(page):
+    order = sorted(range(len(RECORDS)), key=lambda i: (-RECORDS[i]["dbm"], i))
+    got = [r["idx"] for off in range(0, 25, 7)
+           for r in page("offset=%d&limit=7&sort=dbm&order=desc" % off)["rows"]]
+    assert [RECORDS[i]["dbm"] for i in got] == [RECORDS[i]["dbm"] for i in order]
+    assert sorted(got) == list(range(25))
+
+    strong = [i for i, r in enumerate(RECORDS) if r["dbm"] >= -40]
+    body = page("offset=2&limit=3&min_dbm=-40")
+    assert body["total"] == len(strong)
+    assert [r["idx"] for r in body["rows"]] == strong[2:5]
+
+
+def test_bad_paging_query(page, client):
+    for query in ("limit=x", "limit=5&sort=time", "limit=5&order=up"):
+        assert client.get("/tabledata?" + query).status_code == 400
@@ -0,0 +1,95 @@
+"""heat tile: PNG ที่ถูกต้อง, แคชหน่วยความจำ -> ดิสก์ -> วาดใหม่, ข้อมูลเปลี่ยน tile ต้องเปลี่ยน"""
+import os
+import struct
+import zlib
+
+import numpy as np
+
+import app as rf
+from conftest import write_samples
+
+Z = 17
+POINTS = [(13.7276 + i * 2e-5, 100.7726 + i * 1e-5, "2025-01-01 12:00:%02d" % i, -60.0 + i)
+          for i in range(20)]
+
+
+def tile_of(lat, lng, z=Z):
+    px, py = rf._lnglat_to_pixel(np.array([lng]), np.array([lat]), rf.TILE_SIZE * 2.0 ** z)
+    return int(px[0] // rf.TILE_SIZE), int(py[0] // rf.TILE_SIZE)
+
+
+def decode_png(body):
+    """คืน (width, height, RGBA array) ตรวจ signature/IHDR/CRC ไปด้วย"""
+    assert body[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, chunks = 8, {}
+    while pos < len(body):
+        length, tag = struct.unpack(">I4s", body[pos:pos + 8])
+        data = body[pos + 8:pos + 8 + length]
+        crc, = struct.unpack(">I", body[pos + 8 + length:pos + 12 + length])
+        assert crc == zlib.crc32(tag + data) & 0xFFFFFFFF
+        chunks[tag] = chunks.get(tag, b"") + data
+        pos += 12 + length
+    assert pos == len(body) and b"IEND" in chunks
+    w, h, depth, color = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    assert (depth, color) == (8, 6)   # RGBA 8 bit
+    raw = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(h, w * 4 + 1)
+    assert not raw[:, 0].any()        # filter 0 ทุกแถว
+    return w, h, raw[:, 1:].reshape(h, w, 4)
+
+
+def test_tile_is_valid_png(sd, client):
+    write_samples(sd / "noise_samples.json", POINTS)
+    rf.sd_watcher.check()
+    x, y = tile_of(*POINTS[0][:2])
+    resp = client.get("/tiles/%d/%d/%d.png" % (Z, x, y))
+    assert resp.status_code == 200 and resp.mimetype == "image/png"
+    w, h, rgba = decode_png(resp.data)
+    assert (w, h) == (rf.TILE_SIZE, rf.TILE_SIZE)
+    assert rgba[..., 3].any()
+
+    # tile ไกลจากจุด: โปร่งใสทั้งใบ
+    w, h, rgba = decode_png(client.get("/tiles/%d/%d/%d.png" % (Z, x + 50, y)).data)
+    assert (w, h) == (rf.TILE_SIZE, rf.TILE_SIZE) and not rgba.any()
+
+
+def test_memory_then_disk_then_regenerate(sd):
+    write_samples(sd / "noise_samples.json", POINTS)
+    rf.sd_watcher.check()
+    snap = rf.read_measurements()
+    x, y = tile_of(*POINTS[0][:2])
+    cache = rf.tile_cache
+
+    body = rf.heat_tile_png(snap, None, Z, x, y)
+    assert (cache.misses, cache.hits) == (1, {"memory": 0, "disk": 0})
+    assert rf.heat_tile_png(snap, None, Z, x, y) == body
+    assert cache.hits["memory"] == 1
+
+    # process ใหม่ (หน่วยความจำว่าง) อ่านจากดิสก์
+    cache.mem = rf.BytesLRU(rf.TILE_CACHE_BYTES)
+    assert rf.heat_tile_png(snap, None, Z, x, y) == body
+    assert cache.hits["disk"] == 1
+    assert len(os.listdir(rf.TILE_DISK_DIR)) == 1
+
+    # ไฟล์บนดิสก์หาย -> วาดใหม่ได้ผลเดิม
+    cache.mem = rf.BytesLRU(rf.TILE_CACHE_BYTES)
+    for name in os.listdir(rf.TILE_DISK_DIR):
+        os.remove(os.path.join(rf.TILE_DISK_DIR, name))
+    assert rf.heat_tile_png(snap, None, Z, x, y) == body
+    assert cache.misses == 2
+
+
+def test_new_data_version_invalidates_tile(sd, client):
+    path = sd / "noise_samples.json"
+    write_samples(path, POINTS[:10])
+    rf.sd_watcher.check()
+    x, y = tile_of(*POINTS[0][:2])
+    url = "/tiles/%d/%d/%d.png" % (Z, x, y)
+    before = client.get(url).data
+    misses = rf.tile_cache.misses
+
+    write_samples(path, POINTS)
+    rf.sd_watcher.check()
+    after = client.get(url).data
+    assert rf.tile_cache.misses == misses + 1
+    assert after != before
+    assert decode_png(after)[2][..., 3].sum() > decode_png(before)[2][..., 3].sum()
@@ -0,0 +1,15 @@
+"""?last= เป็นช่วงเปิดซ้าย (t1 - last, t1]"""
+import app as rf
+from conftest import write_samples
+
+
+def test_last_window_is_half_open(sd, client):
+    points = [(13.7276, 100.7726, "2025-01-01 12:%02d:%02d" % (i // 60, i % 60), -40.0)
+              for i in range(180)]
+    write_samples(sd / "noise_samples.json", points)
+    rf.sd_watcher.check()
+    for query in ("last=1m", "last=1m&bbox=100.77,13.72,100.78,13.73",
+                  "last=1m&to=2025-01-01T12:01:59", "last=59.5s"):
+        assert len(client.get("/data?" + query).get_json()) == 60, query
+    rows = client.get("/data?last=1m").get_json()
+    assert rows[0]["time"] == "2025-01-01 12:02:00"
@@ -0,0 +1,56 @@
+"""
+Production entry point (หลาย worker) แทน app.run(debug=True) ของโหมดพัฒนา
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    python wsgi.py          # เหมือนข้างบน (ไม่มี gunicorn -> waitress แบบ process เดียวหลาย thread)
+
+ตั้งค่าผ่าน environment:
+    RF_BIND                 ที่อยู่ที่ฟัง (ค่าเริ่มต้น 0.0.0.0:5000)
+    RF_WORKERS              จำนวน worker process (ค่าเริ่มต้น = จำนวน CPU)
+    RF_THREADS              thread ต่อ worker (ค่าเริ่มต้น 8, client ที่เปิด /events ค้างไว้กิน 1 thread)
+    RF_SHARED_COLUMNS_DIR   โฟลเดอร์ไฟล์คอลัมน์ที่ทุก worker mmap ร่วมกัน
+                            (ค่าเริ่มต้น /dev/shm/rf-heatmap ถ้ามี /dev/shm ไม่งั้น shared_columns/ ข้าง app.py)
+    RF_SERIAL_PORT          port USB serial ของ ESP32 เช่น /dev/ttyUSB0 รับจุดสดไม่ต้องถอดการ์ด (ไม่ตั้ง = ปิด)
+    RF_SERIAL_BAUD          baud rate ของ port ข้างบน (ค่าเริ่มต้น 115200 เท่ากับ firmware)
+
+ทุก worker map ไฟล์คอลัมน์ไฟล์เดียวกัน ข้อมูลชุดรวมจึงอยู่ในหน่วยความจำชุดเดียวไม่ว่ากี่ worker
+(ดู SharedStore ใน app.py) และมี worker เดียวที่อ่านการ์ด (SDWatcher.is_leader)
+"""
+import os
+import multiprocessing
+
+
+def _default_shared_dir():
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm/rf-heatmap"   # tmpfs: อยู่ใน RAM ไม่เขียนลงการ์ด/ดิสก์
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "shared_columns")
+
+
+# ต้องตั้งก่อน import app (app อ่านค่าตอน import)
+os.environ.setdefault("RF_SHARED_COLUMNS_DIR", _default_shared_dir())
+
+from app import app  # noqa: E402
+
+application = app
+
+BIND = os.environ.get("RF_BIND", "0.0.0.0:5000")
+WORKERS = int(os.environ.get("RF_WORKERS", multiprocessing.cpu_count()))
+THREADS = int(os.environ.get("RF_THREADS", 8))
+
+
+def main():
+    try:
+        from gunicorn.app.wsgiapp import run
+    except ImportError:
+        from waitress import serve
+        host, _, port = BIND.rpartition(":")
+        serve(app, host=host or "0.0.0.0", port=int(port), threads=THREADS)
+        return
+    import sys
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.argv = ["gunicorn", "-c", os.path.join(here, "gunicorn.conf.py"), "wsgi:app"]
+    run()
+
+
+if __name__ == "__main__":
+    main()